@@ -0,0 +1,114 @@
+"""
+Admission control for upload requests
+
+Several recording stations tend to finish a session at the same moment.
+Every upload request is admitted here before its body is read:
+
+- at most max_concurrent upload requests are received at once
+- the bytes being received (declared Content-Length) plus the bytes already
+  spooled and waiting in the job queue (backlog_bytes()) stay under
+  max_inflight_bytes. A body of unknown length (chunked transfer encoding)
+  is charged unknown_length_bytes - the largest body the server accepts -
+  so leaving out Content-Length does not get around the budget.
+
+A request over either limit is rejected with AdmissionRejected, which
+carries a Retry-After hint; the route turns it into a 429. When nothing
+is in flight a request is always admitted, so one file larger than the
+byte limit cannot be locked out forever.
+"""
+
+import threading
+
+
+class AdmissionRejected(Exception):
+    """Upload refused by admission control - retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Admission:
+    """One admitted request; releases its slot and bytes when the with-block exits"""
+
+    def __init__(self, controller, nbytes):
+        self._controller = controller
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._controller._release(self.nbytes)
+        return False
+
+
+class AdmissionController:
+    """Limits concurrent upload requests and total in-flight bytes"""
+
+    def __init__(self, max_concurrent=4, max_inflight_bytes=512 * 1024 * 1024,
+                 backlog_bytes=None, retry_after=5, unknown_length_bytes=0):
+        """
+        max_concurrent: upload requests received at the same time (0 = unlimited)
+        max_inflight_bytes: receiving + queued bytes (0 = unlimited)
+        backlog_bytes: callable returning bytes accepted but not yet uploaded
+        retry_after: seconds suggested to rejected clients
+        unknown_length_bytes: bytes charged for a request without Content-Length
+        """
+        self.max_concurrent = max_concurrent
+        self.max_inflight_bytes = max_inflight_bytes
+        self.backlog_bytes = backlog_bytes or (lambda: 0)
+        self.retry_after = retry_after
+        self.unknown_length_bytes = unknown_length_bytes
+
+        self.active_requests = 0
+        self.active_bytes = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def admit(self, nbytes):
+        """
+        Admit an upload of nbytes (Content-Length, None if unknown).
+        Returns a context manager; raises AdmissionRejected when over a limit.
+        """
+        if nbytes is None:
+            nbytes = self.unknown_length_bytes
+        with self._lock:
+            backlog = self.backlog_bytes()
+            inflight = self.active_bytes + backlog
+
+            if self.max_concurrent and self.active_requests >= self.max_concurrent:
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"{self.active_requests} uploads already in progress", self.retry_after
+                )
+            if (self.max_inflight_bytes and inflight > 0 and
+                    inflight + nbytes > self.max_inflight_bytes):
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"{inflight} bytes already in flight (limit {self.max_inflight_bytes})",
+                    self.retry_after
+                )
+
+            self.active_requests += 1
+            self.active_bytes += nbytes
+            self.admitted += 1
+        return _Admission(self, nbytes)
+
+    def _release(self, nbytes):
+        with self._lock:
+            self.active_requests -= 1
+            self.active_bytes -= nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_requests": self.active_requests,
+                "receiving_bytes": self.active_bytes,
+                "queued_bytes": self.backlog_bytes(),
+                "max_concurrent": self.max_concurrent,
+                "max_inflight_bytes": self.max_inflight_bytes,
+                "admitted": self.admitted,
+                "rejected": self.rejected
+            }
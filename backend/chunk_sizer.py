@@ -0,0 +1,79 @@
+"""
+Adaptive chunk sizing for Graph resumable uploads
+
+Graph accepts upload-session chunks of any multiple of 320 KiB up to
+60 MiB. A fixed 320 KiB chunk means ~640 sequential PUTs for a 200 MB
+video; AdaptiveChunkSizer measures every chunk and picks the next size:
+
+- Fast chunk (well under the target duration): grow toward the size the
+  measured throughput can move in target_seconds (at most doubling)
+- Slow chunk (over twice the target): shrink to match the throughput
+- Failed chunk: halve immediately so a bad link recovers quickly
+
+Sizes are always multiples of CHUNK_UNIT within [min_size, max_size].
+"""
+
+CHUNK_UNIT = 327680  # 320 KiB - Graph requires chunk sizes to be multiples of this
+GRAPH_MAX_CHUNK = 192 * CHUNK_UNIT  # 60 MiB
+
+
+def round_to_unit(size):
+    """Round size down to a multiple of CHUNK_UNIT (at least one unit)"""
+    return max(CHUNK_UNIT, (int(size) // CHUNK_UNIT) * CHUNK_UNIT)
+
+
+class AdaptiveChunkSizer:
+    """Per-upload chunk size controller"""
+
+    def __init__(self, min_size=CHUNK_UNIT, max_size=32 * CHUNK_UNIT, initial_size=None, target_seconds=2.0):
+        self.min_size = round_to_unit(min_size)
+        self.max_size = min(round_to_unit(max_size), GRAPH_MAX_CHUNK)
+        self.target_seconds = target_seconds
+        self.size = self._clamp(initial_size or self.min_size)
+
+        self.chunks = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self.seconds = 0.0
+        self.sizes_used = []
+
+    def _clamp(self, size):
+        return min(self.max_size, max(self.min_size, round_to_unit(size)))
+
+    def record_success(self, nbytes, seconds):
+        """Record an accepted chunk and adjust the next chunk size"""
+        self.chunks += 1
+        self.bytes_sent += nbytes
+        self.seconds += seconds
+        self.sizes_used.append(nbytes)
+
+        # A short final chunk says nothing about the link
+        if nbytes < self.size or seconds <= 0:
+            return self.size
+
+        throughput = nbytes / seconds
+        ideal = throughput * self.target_seconds
+
+        if seconds < self.target_seconds / 2:
+            self.size = self._clamp(min(ideal, self.size * 2))
+        elif seconds > self.target_seconds * 2:
+            self.size = self._clamp(ideal)
+
+        return self.size
+
+    def record_failure(self):
+        """Record a failed chunk and halve the next chunk size"""
+        self.failures += 1
+        self.size = self._clamp(self.size // 2)
+        return self.size
+
+    def stats(self):
+        """Summary for logs: chunk count, sizes chosen and average throughput"""
+        return {
+            "chunks": self.chunks,
+            "failures": self.failures,
+            "min_chunk": min(self.sizes_used) if self.sizes_used else 0,
+            "max_chunk": max(self.sizes_used) if self.sizes_used else 0,
+            "final_chunk_size": self.size,
+            "throughput_bps": int(self.bytes_sent / self.seconds) if self.seconds else 0
+        }
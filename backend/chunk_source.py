@@ -0,0 +1,100 @@
+"""
+Zero-copy chunk access for resumable uploads
+
+Reading a chunk with file.read() copies it from the page cache into a new
+bytes object (and a str body was encoded into a second full copy first).
+ChunkSource maps a spool file with mmap and hands out memoryview slices
+of the mapping, which requests/urllib3 send with socket.sendall() as-is.
+
+After a chunk is acknowledged, release() drops its pages from the
+mapping (MADV_DONTNEED; the data stays in the page cache), so resident
+memory stays around one chunk however large the file is.
+
+Sources that cannot be mapped still work:
+- bytes / bytearray / BytesIO: memoryview of the existing buffer (no copy)
+- str: encoded once (small CSV payloads only)
+- other readers (e.g. the reconciler's ThrottledReader): seek() + read()
+"""
+
+import io
+import mmap
+import os
+
+PAGE_SIZE = mmap.PAGESIZE
+
+
+class ChunkSource:
+    """Random access to an upload body as memoryview slices. Use as a context manager."""
+
+    def __init__(self, file_data):
+        self._map = None
+        self._buffer = None
+        self._reader = None
+
+        if isinstance(file_data, str):
+            file_data = file_data.encode()
+        if isinstance(file_data, (bytes, bytearray)):
+            self._buffer = memoryview(file_data)
+        elif isinstance(file_data, io.BytesIO):
+            self._buffer = file_data.getbuffer()
+        elif self._mappable(file_data):
+            self._map = mmap.mmap(file_data.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            self._buffer = memoryview(self._map)
+        else:
+            self._reader = file_data
+
+    @staticmethod
+    def _mappable(file_data):
+        """Regular, non-empty file with a descriptor (an empty file cannot be mapped)"""
+        try:
+            fd = file_data.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        try:
+            stat = os.fstat(fd)
+        except OSError:
+            return False
+        return stat.st_size > 0 and (stat.st_mode & 0o170000) == 0o100000
+
+    @property
+    def zero_copy(self):
+        return self._buffer is not None
+
+    def chunk(self, start, end):
+        """Bytes [start, end) - a memoryview into the source where possible"""
+        if self._buffer is not None:
+            return self._buffer[start:end]
+        self._reader.seek(start)
+        return self._reader.read(end - start)
+
+    def release(self, start, end):
+        """Chunk [start, end) is done: give its mapped pages back to the OS"""
+        if self._map is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        aligned_start = start - start % PAGE_SIZE
+        length = min(end, len(self._map)) - aligned_start
+        if length > 0:
+            self._map.madvise(mmap.MADV_DONTNEED, aligned_start, length)
+
+    def close(self):
+        if self._buffer is not None:
+            try:
+                self._buffer.release()
+            except BufferError:
+                pass  # a slice is still referenced somewhere - garbage collection closes it
+            self._buffer = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
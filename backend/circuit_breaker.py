@@ -0,0 +1,108 @@
+"""
+Circuit breaker around the OneDrive backend
+
+When Graph is unreachable every upload would otherwise wait for its own
+timeouts and retries before falling back to local storage. The breaker
+tracks consecutive failures:
+
+- closed: uploads go to OneDrive
+- open: after failure_threshold consecutive failures, uploads skip
+  OneDrive and go straight to local storage for cooldown_seconds
+- half_open: after the cool-down one caller runs a cheap probe (e.g.
+  GET /me); success closes the breaker, failure re-opens it
+"""
+
+import logging
+import threading
+import time
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+log = logging.getLogger("circuit_breaker")
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker"""
+
+    def __init__(self, failure_threshold=3, cooldown_seconds=60, probe=None):
+        """
+        probe: optional callable() -> bool run once per cool-down to decide
+        whether to close the breaker. Without a probe the next real call
+        is let through as the trial.
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.probe = probe
+
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """True if the caller should try OneDrive, False to go straight to local"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_HALF_OPEN:
+                # A probe/trial is already in flight
+                return False
+            if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                return False
+            self.state = STATE_HALF_OPEN
+
+        if self.probe is None:
+            # This caller's real request is the trial
+            return True
+
+        try:
+            healthy = bool(self.probe())
+        except Exception as e:
+            log.warning("Probe error: %s: %s", type(e).__name__, e)
+            healthy = False
+
+        if healthy:
+            self.record_success()
+        else:
+            self._open()
+        return healthy
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                log.info("OneDrive reachable again, closing circuit")
+            self.state = STATE_CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            should_open = (self.state == STATE_HALF_OPEN or
+                           self.consecutive_failures >= self.failure_threshold)
+        if should_open:
+            self._open()
+
+    def _open(self):
+        with self._lock:
+            if self.state != STATE_OPEN:
+                self.times_opened += 1
+                log.warning("Opening circuit for %ss after %s consecutive failures", self.cooldown_seconds,
+                            self.consecutive_failures)
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+
+    def status(self):
+        with self._lock:
+            retry_in = None
+            if self.state == STATE_OPEN:
+                retry_in = max(0, int(self.cooldown_seconds - (time.monotonic() - self.opened_at)))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "retry_in": retry_in
+            }
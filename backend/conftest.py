@@ -0,0 +1,71 @@
+"""
+Shared pytest setup: an in-process Graph simulator the uploader talks to
+
+onedrive_uploader reads its configuration at import time, so the
+environment is pointed at a scratch directory here, before any test
+module imports it. The simulator serves its Flask app from a background
+thread on a free local port; the uploader talks to it over HTTP exactly
+as it talks to Graph.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+# Before onedrive_uploader is imported: its SQLite stores and token file go to a scratch directory
+STATE_DIR = tempfile.mkdtemp(prefix="graph-simulator-test-")
+os.environ["SPOOL_DIR"] = os.path.join(STATE_DIR, "spool")
+os.environ["TOKEN_FILE"] = os.path.join(STATE_DIR, "tokens.json")
+os.environ["UPLOAD_MODE"] = "local"
+os.environ["LOG_FORMAT"] = "text"
+
+from graph_simulator import DEFAULT_FAULTS, GraphSimulator, write_token_file  # noqa: E402
+
+write_token_file(os.environ["TOKEN_FILE"])
+import onedrive_uploader as uploader  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def server():
+    simulator = GraphSimulator(seed=1)
+    httpd = make_server("127.0.0.1", 0, simulator.create_app(), threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="graph-simulator", daemon=True).start()
+    simulator.base_url = f"http://127.0.0.1:{httpd.server_port}"
+    yield simulator
+    httpd.shutdown()
+
+
+@pytest.fixture
+def sim(server, monkeypatch):
+    """The running simulator with an empty drive and no faults; the uploader points at it"""
+    server.reset()
+    server.faults = dict(DEFAULT_FAULTS)
+    monkeypatch.setattr(uploader, "GRAPH_API_ENDPOINT", f"{server.base_url}/v1.0")
+    # Local fallbacks go to the scratch directory, not the repository's uploads/
+    monkeypatch.setattr(uploader, "LOCAL_STORAGE_DIR", os.path.join(STATE_DIR, "uploads"))
+    # Folder IDs cached by an earlier test belong to a drive that was reset
+    uploader.folder_cache.invalidate(uploader.PROJECT_FOLDER)
+    uploader.onedrive_breaker.record_success()
+    return server
+
+
+def stored_file(sim, name):
+    """driveItem fields of the stored file called name"""
+    matches = [item for item in sim.items.values() if item["name"] == name and not item["folder"]]
+    assert len(matches) == 1, f"expected one {name}, found {len(matches)}"
+    return matches[0]
+
+
+def wait_for(check, timeout=30):
+    """Poll check() until it returns something truthy; fail the test after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.05)
+    pytest.fail("timed out")
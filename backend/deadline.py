@@ -0,0 +1,68 @@
+"""
+Deadline budgets for upload attempts
+
+A Deadline is created when an upload request is admitted, travels with
+its job through the queue and is passed down the Graph call chain
+(folder lookup, session creation, every chunk PUT). The Graph clients
+derive each call's connect/read timeout from the remaining budget, and
+the asyncio client also bounds the whole exchange by it, so neither a
+stuck connection nor a response trickling in can hold a worker longer
+than the upload's budget; once it is spent the upload falls through to
+local storage.
+"""
+
+import asyncio
+import time
+
+import requests
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The upload's time budget is spent (a Timeout, so callers treat it like one)"""
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) an operation must finish by"""
+
+    def __init__(self, seconds):
+        """seconds: budget from now; None or 0 means no deadline"""
+        self.budget = seconds or None
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        """Seconds left (never negative), or None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, what="operation"):
+        """Raise DeadlineExceeded if the budget is spent"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.budget:.0f}s exceeded before {what}")
+
+    def timeout(self, default):
+        """
+        (connect, read) timeout for the next call: the default, capped at the
+        remaining budget. Raises DeadlineExceeded when nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {self.budget:.0f}s exceeded")
+        if isinstance(default, tuple):
+            return tuple(min(part, remaining) for part in default)
+        return min(default, remaining)
+
+    def sleep(self, seconds):
+        """Sleep for seconds, but not past the deadline"""
+        remaining = self.remaining()
+        time.sleep(seconds if remaining is None else min(seconds, remaining))
+
+    async def sleep_async(self, seconds):
+        """sleep() for coroutines on the Graph event loop"""
+        remaining = self.remaining()
+        await asyncio.sleep(seconds if remaining is None else min(seconds, remaining))
@@ -0,0 +1,170 @@
+"""
+In-process cache of OneDrive folder paths to driveItem IDs
+
+Used by onedrive_uploader.ensure_folder_exists so repeated uploads for the
+same volunteer skip the Graph folder lookups.
+
+- Entries expire after a TTL
+- Least recently used entries are evicted when the cache is full
+- invalidate() drops a path and everything below it (used when Graph
+  reports 404 / itemNotFound for a cached folder)
+
+SharedFolderCache adds a second tier in SQLite so worker processes (and
+restarts) share lookups: a miss in the process-local cache checks the
+shared table before going to Graph.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class FolderCache:
+    """Thread-safe path -> folder_id cache with TTL and LRU eviction"""
+
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # path -> (folder_id, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(path):
+        """Normalize a drive path so 'A/B', '/A/B/' and 'A//B' share one key"""
+        return "/".join(part for part in path.split("/") if part)
+
+    def get(self, path):
+        """Return cached folder_id for path, or None if missing/expired"""
+        key = self.normalize(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            folder_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return folder_id
+
+    def put(self, path, folder_id):
+        """Store folder_id for path, evicting the least recently used entry if full"""
+        if not folder_id:
+            return
+
+        key = self.normalize(path)
+        with self._lock:
+            self._entries[key] = (folder_id, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path):
+        """Drop path and every cached path below it"""
+        key = self.normalize(path)
+        prefix = key + "/"
+        with self._lock:
+            for cached in [k for k in self._entries if k == key or k.startswith(prefix)]:
+                del self._entries[cached]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
+
+
+class SharedFolderCache(FolderCache):
+    """FolderCache backed by a SQLite table shared by every process using `path`"""
+
+    def __init__(self, path, max_entries=256, ttl_seconds=3600):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.path = path
+        self.shared_hits = 0
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                folder_id TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def get(self, path):
+        folder_id = super().get(path)
+        if folder_id:
+            return folder_id
+
+        # Wall-clock expiry here: the monotonic clock is per process
+        key = self.normalize(path)
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT folder_id, expires_at FROM folders WHERE path = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._entries[key] = (row[0], time.monotonic() + row[1] - time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.misses -= 1  # counted by the local miss above - this was a hit after all
+            self.hits += 1
+            self.shared_hits += 1
+        return row[0]
+
+    def put(self, path, folder_id):
+        if not folder_id:
+            return
+        super().put(path, folder_id)
+        self._execute("INSERT OR REPLACE INTO folders (path, folder_id, expires_at) VALUES (?, ?, ?)",
+                      (self.normalize(path), folder_id, time.time() + self.ttl_seconds))
+
+    def invalidate(self, path):
+        super().invalidate(path)
+        key = self.normalize(path)
+        prefix = key + "/"
+        # substr() instead of LIKE - folder names may contain % or _
+        self._execute("DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?",
+                      (key, len(prefix), prefix))
+
+    def clear(self):
+        super().clear()
+        self._execute("DELETE FROM folders")
+
+    def stats(self):
+        stats = super().stats()
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
@@ -0,0 +1,280 @@
+"""
+Asyncio client for Microsoft Graph
+
+Uploads run as coroutines on one event loop (GraphEventLoop, a daemon
+thread), so folder lookups, session creation and chunk PUTs of many
+uploads overlap without a thread per upload. AsyncGraphClient behaves
+like GraphClient (graph_client.py):
+
+- Authorization header from the token provider at call time, one token
+  refresh and replay after a 401
+- The same shared GraphRateLimiter; a 429 (or 503 with Retry-After)
+  pauses all Graph traffic, sync and async, and the call is replayed
+- Connect/read timeouts capped by the caller's Deadline; on aiohttp the
+  whole exchange is bounded by it too, so a response that trickles in
+  cannot outlast the budget
+- observer(operation, status_code, seconds) after every exchange
+
+Network errors are raised as requests exceptions (ConnectionError,
+Timeout), so callers handle both clients the same way.
+
+aiohttp is optional. Without it every call goes through a requests.Session
+on a small thread pool - same behaviour, but one thread per call in flight.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from deadline import DeadlineExceeded
+from graph_throttle import parse_retry_after
+
+try:
+    import aiohttp
+except ImportError:  # optional - falls back to requests on a thread pool
+    aiohttp = None
+
+log = logging.getLogger("graph_async")
+
+
+class GraphResponse:
+    """Fully read response, shaped like the parts of requests.Response the uploader uses"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncGraphClient:
+    """Graph client for coroutines running on a GraphEventLoop"""
+
+    def __init__(self, token_provider, pool_size=10, connect_timeout=10, read_timeout=60,
+                 on_unauthorized=None, rate_limiter=None, throttle_retries=3, max_retry_after=120,
+                 observer=None):
+        """Arguments as for GraphClient; token_provider and on_unauthorized may block (run on a thread)"""
+        self.token_provider = token_provider
+        self.on_unauthorized = on_unauthorized
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.max_retry_after = max_retry_after
+        self.observer = observer
+        self.throttle_replays = 0
+        self.throttle_giveups = 0
+
+        self._session = None  # aiohttp.ClientSession, created on the loop
+        self._executor = None  # requests fallback
+        self._requests = None
+
+    @property
+    def transport(self):
+        return "aiohttp" if aiohttp else "requests"
+
+    async def request(self, method, url, headers=None, auth=True, timeout=None, deadline=None, operation=None,
+                      data=None, json=None):
+        """Send a request (see GraphClient.request); returns a GraphResponse"""
+        operation = operation or method.lower()
+        token = await asyncio.to_thread(self.token_provider) if auth else None
+        response = await self._send(method, url, token, headers, timeout, deadline, operation, data, json)
+
+        # Expired/revoked token: refresh once and replay (only if the body can be re-sent)
+        replayable = not hasattr(data, "read")
+        if token and response.status_code == 401 and self.on_unauthorized and replayable:
+            if await asyncio.to_thread(self.on_unauthorized, token):
+                token = await asyncio.to_thread(self.token_provider)
+                response = await self._send(method, url, token, headers, timeout, deadline, operation, data, json)
+
+        # Throttled: wait as long as Graph asks (all callers wait), then replay
+        attempt = 0
+        while self.rate_limiter and replayable and self._is_throttled(response):
+            if attempt >= self.throttle_retries:
+                self.throttle_giveups += 1
+                log.warning("Still throttled after %s retries: %s %s", attempt, method, response.status_code)
+                break
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2 ** attempt
+            delay = min(delay, self.max_retry_after)
+            if deadline and deadline.remaining() is not None and delay >= deadline.remaining():
+                self.throttle_giveups += 1
+                log.warning("Throttled for %.1fs, longer than the remaining deadline", delay)
+                break
+            log.warning("Throttled (%s) on %s, pausing Graph calls for %.1fs", response.status_code, method, delay)
+            self.rate_limiter.pause(delay)
+            attempt += 1
+            self.throttle_replays += 1
+            token = await asyncio.to_thread(self.token_provider) if auth else None
+            response = await self._send(method, url, token, headers, timeout, deadline, operation, data, json)
+
+        return response
+
+    @staticmethod
+    def _is_throttled(response):
+        return response.status_code == 429 or (
+            response.status_code == 503 and "Retry-After" in response.headers
+        )
+
+    async def _acquire(self):
+        while True:
+            wait = self.rate_limiter.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _send(self, method, url, token, headers, timeout, deadline, operation, data, json_body):
+        request_headers = {}
+        if token:
+            request_headers["Authorization"] = f"Bearer {token}"
+        if headers:
+            request_headers.update(headers)
+
+        if self.rate_limiter:
+            await self._acquire()
+        timeout = timeout or self.timeout
+        if deadline:
+            timeout = deadline.timeout(timeout)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        status_code = None
+        try:
+            if aiohttp:
+                response = await self._send_aiohttp(method, url, request_headers, timeout, deadline, data,
+                                                    json_body)
+            else:
+                response = await self._send_requests(method, url, request_headers, timeout, data, json_body)
+            status_code = response.status_code
+            return response
+        finally:
+            if self.observer:
+                self.observer(operation, status_code, loop.time() - started)
+
+    async def _send_aiohttp(self, method, url, headers, timeout, deadline, data, json_body):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size)
+            )
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        exchange = self._exchange_aiohttp(method, url, headers, connect_timeout, read_timeout, data, json_body)
+        remaining = deadline.remaining() if deadline else None
+        try:
+            # Socket timeouts bound each read; this bounds the whole exchange by what is left of the budget
+            # (asyncio.wait_for rather than asyncio.timeout, which needs Python 3.11)
+            return await asyncio.wait_for(exchange, remaining)
+        except asyncio.TimeoutError as e:
+            if deadline and deadline.expired():
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:.0f}s exceeded during {method} {url}") from e
+            raise requests.exceptions.Timeout(f"{method} {url} timed out") from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(f"{method} {url}: {e}") from e
+
+    async def _exchange_aiohttp(self, method, url, headers, connect_timeout, read_timeout, data, json_body):
+        async with self._session.request(
+            method, url, headers=headers, data=data, json=json_body,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        ) as response:
+            content = await response.read()
+            return GraphResponse(response.status, CaseInsensitiveDict(response.headers), content)
+
+    async def _send_requests(self, method, url, headers, timeout, data, json_body):
+        if self._requests is None:
+            self._requests = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+            self._requests.mount("https://", adapter)
+            self._requests.mount("http://", adapter)
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="graph-call")
+        call = functools.partial(self._requests.request, method, url, headers=headers, timeout=timeout,
+                                 data=data, json=json_body)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        return {
+            "transport": self.transport,
+            "throttle_replays": self.throttle_replays,
+            "throttle_giveups": self.throttle_giveups
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._requests is not None:
+            self._requests.close()
+            self._executor.shutdown(wait=False)
+            self._requests = None
+
+
+class GraphEventLoop:
+    """
+    An asyncio event loop on a daemon thread, started on first use.
+
+    run() / submit() hand a coroutine to the loop from any other thread,
+    together with the caller's contextvars (request ID, trace). Callers
+    bound their own concurrency (the job queue, admission control, the
+    reconciler's workers) - the loop runs whatever it is given.
+    """
+
+    def __init__(self, name="graph-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    async def _in_context(self, ctx, coro):
+        self.running += 1
+        try:
+            # The task copies ctx, so spans and the request ID follow the coroutine
+            return await ctx.run(asyncio.ensure_future, coro)
+        finally:
+            self.running -= 1
+
+    def submit(self, coro):
+        """Schedule coro on the loop; returns a concurrent.futures.Future"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._in_context(contextvars.copy_context(), coro), loop)
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and wait for its result (from any thread but the loop's own)"""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("GraphEventLoop.run() called on the loop thread - await the coroutine instead")
+        return self.submit(coro).result(timeout)
@@ -0,0 +1,162 @@
+"""
+Pooled HTTP client for Microsoft Graph
+
+One GraphClient owns a requests.Session, so folder lookups, session
+creation and chunk PUTs reuse keep-alive connections to graph.microsoft.com
+and the upload host instead of opening a new TLS connection per call.
+
+- Sized connection pool (shared by all Flask request threads)
+- Default connect/read timeouts on every call, capped by the caller's
+  Deadline (deadline.py) when one is passed
+- Authorization header added from a token provider at call time
+- A 401 triggers one token refresh (on_unauthorized) and one replay
+- Optional shared GraphRateLimiter: every call takes a token first, and a
+  429 (or 503 with Retry-After) pauses all callers for Retry-After and
+  replays the call instead of failing it
+"""
+
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from graph_throttle import parse_retry_after
+
+log = logging.getLogger("graph_client")
+
+
+class GraphClient:
+    """Keep-alive Graph client shared by the whole backend"""
+
+    def __init__(self, token_provider, pool_size=10, connect_timeout=10, read_timeout=60,
+                 on_unauthorized=None, rate_limiter=None, throttle_retries=3, max_retry_after=120,
+                 observer=None):
+        """
+        token_provider: callable returning the current access token
+        pool_size: max pooled connections kept per host
+        on_unauthorized: callable(stale_token) -> bool, refreshes the token after a 401
+        rate_limiter: GraphRateLimiter shared by all Graph traffic (None = no limiting)
+        throttle_retries: replays of a throttled call before its 429/503 is returned
+        max_retry_after: cap in seconds on a single Retry-After pause
+        observer: callable(operation, status_code, seconds) called after every
+            HTTP exchange (status_code None on a network error) - used for metrics
+        """
+        self.token_provider = token_provider
+        self.on_unauthorized = on_unauthorized
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.max_retry_after = max_retry_after
+        self.observer = observer
+        self.throttle_replays = 0
+        self.throttle_giveups = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, headers=None, auth=True, timeout=None, deadline=None, operation=None,
+                **kwargs):
+        """
+        Send a request through the pooled session.
+
+        auth=False skips the Authorization header - required for the
+        pre-authenticated uploadUrl returned by createUploadSession.
+        deadline: optional Deadline; timeouts are capped at its remaining
+        budget and DeadlineExceeded (a requests Timeout) is raised once it is spent.
+        operation: name reported to the observer (e.g. "chunk_put"), defaults to the method
+        """
+        kwargs["operation"] = operation or method.lower()
+        token = self.token_provider() if auth else None
+        response = self._send(method, url, token, headers, timeout, deadline, **kwargs)
+
+        # Expired/revoked token: refresh once and replay (only if the body can be re-sent)
+        replayable = not hasattr(kwargs.get("data"), "read")
+        if token and response.status_code == 401 and self.on_unauthorized and replayable:
+            if self.on_unauthorized(token):
+                response = self._send(method, url, self.token_provider(), headers, timeout, deadline, **kwargs)
+
+        # Throttled: wait as long as Graph asks (all callers wait), then replay
+        attempt = 0
+        while self.rate_limiter and replayable and self._is_throttled(response):
+            if attempt >= self.throttle_retries:
+                self.throttle_giveups += 1
+                log.warning("Still throttled after %s retries: %s %s", attempt, method, response.status_code)
+                break
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2 ** attempt
+            delay = min(delay, self.max_retry_after)
+            if deadline and deadline.remaining() is not None and delay >= deadline.remaining():
+                # Waiting would spend the whole budget - let the caller fall back now
+                self.throttle_giveups += 1
+                log.warning("Throttled for %.1fs, longer than the remaining deadline", delay)
+                break
+            log.warning("Throttled (%s) on %s, pausing Graph calls for %.1fs", response.status_code, method, delay)
+            self.rate_limiter.pause(delay)
+            attempt += 1
+            self.throttle_replays += 1
+            token = self.token_provider() if auth else None
+            response = self._send(method, url, token, headers, timeout, deadline, **kwargs)
+
+        return response
+
+    @staticmethod
+    def _is_throttled(response):
+        # 503 is only throttling when Graph says when to come back
+        return response.status_code == 429 or (
+            response.status_code == 503 and "Retry-After" in response.headers
+        )
+
+    def _send(self, method, url, token, headers, timeout, deadline=None, operation=None, **kwargs):
+        request_headers = {}
+        if token:
+            request_headers["Authorization"] = f"Bearer {token}"
+        if headers:
+            request_headers.update(headers)
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        timeout = timeout or self.timeout
+        if deadline:
+            timeout = deadline.timeout(timeout)
+
+        started = time.monotonic()
+        status_code = None
+        try:
+            response = self.session.request(
+                method,
+                url,
+                headers=request_headers,
+                timeout=timeout,
+                **kwargs
+            )
+            status_code = response.status_code
+            return response
+        finally:
+            if self.observer:
+                self.observer(operation, status_code, time.monotonic() - started)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        """Throttling counters (rate limiter + replays)"""
+        stats = self.rate_limiter.stats() if self.rate_limiter else {}
+        stats["throttle_replays"] = self.throttle_replays
+        stats["throttle_giveups"] = self.throttle_giveups
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,501 @@
+"""
+Local Microsoft Graph simulator for offline throughput and failure testing
+
+Implements the subset of Graph the backend uses, against an in-memory drive:
+
+- GET  /v1.0/me
+- GET  /v1.0/me/drive/root:/{path}                        (folder or file by path)
+- POST /v1.0/me/drive/root/children, /root:/{path}:/children   (create folder)
+- POST /v1.0/me/drive/items/{id}:/{name}:/createUploadSession
+- PUT / GET / DELETE {uploadUrl}        (chunk PUTs with nextExpectedRanges; a Content-Range
+                                         total of "*" leaves the size open)
+- PUT  /v1.0/me/drive/items/{id}:/{name}:/content         (simple upload)
+- GET  /v1.0/me/drive/items/{id}:/{name}                  (driveItem with size + quickXorHash)
+- GET / DELETE /v1.0/me/drive/items/{id}                   (driveItem by ID; delete an item and its children)
+
+File contents are not kept - only size and quickXorHash - so large
+benchmark uploads cost no memory.
+
+Faults are injected per request (random rates and/or "next N requests"):
+latency with jitter, 429 with Retry-After, 5xx, dropped connections and a
+bandwidth cap on request bodies. Change them at runtime through
+/_sim/faults; counters are at /_sim/stats.
+
+Usage:
+    python3 graph_simulator.py --port 5100 --latency 0.05 --throttle-rate 0.02 --drop-rate 0.01
+    GRAPH_API_ENDPOINT=http://127.0.0.1:5100/v1.0 TOKEN_FILE=/tmp/sim_tokens.json python3 onedrive_uploader.py
+
+--token-file writes a dummy token file for TOKEN_FILE (the simulator accepts
+any bearer token).
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, request, jsonify
+
+from chunk_sizer import CHUNK_UNIT, GRAPH_MAX_CHUNK
+from quickxor import QuickXorHash
+
+log = logging.getLogger("graph_simulator")
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")  # "*": total not known yet
+
+DEFAULT_FAULTS = {
+    "latency": 0.0,         # seconds added to every request
+    "jitter": 0.0,          # up to this many extra seconds, uniformly random
+    "throttle_rate": 0.0,   # probability of a 429
+    "retry_after": 1,       # seconds sent with 429s (None = no header)
+    "error_rate": 0.0,      # probability of a 5xx
+    "error_statuses": [500, 502, 503, 504],
+    "drop_rate": 0.0,       # probability of closing the connection without a response
+    "drop_after_commit": False,  # drop after the request took effect (e.g. a chunk was stored)
+    "bandwidth": 0,         # bytes/second for request bodies, 0 = unlimited
+    "throttle_next": 0,     # deterministic: the next N requests get 429
+    "error_next": 0,        # ... get a 5xx
+    "drop_next": 0,         # ... are dropped
+    "paths": None           # regex; faults only hit matching paths (e.g. "^/upload/")
+}
+
+
+def _now_iso(offset_seconds=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _error(status_code, code, message=""):
+    response = jsonify({"error": {"code": code, "message": message}})
+    response.status_code = status_code
+    return response
+
+
+class GraphSimulator:
+    """In-memory drive plus fault injection, served by create_app()"""
+
+    def __init__(self, faults=None, seed=None, session_ttl=3600, strict_chunks=True):
+        self.faults = dict(DEFAULT_FAULTS, **(faults or {}))
+        self.random = random.Random(seed)
+        self.session_ttl = session_ttl
+        self.strict_chunks = strict_chunks
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.items = {}     # id -> {"id", "name", "parent", "folder": bool, "size", "hash"}
+            self.children = {"root": {}}  # folder id -> {name: item id}
+            self.sessions = {}  # session id -> {"parent", "name", "received", "hasher", "expires_at", "total"}
+            self.stats = {"requests": 0, "by_status": {}, "bytes_received": 0, "throttled": 0,
+                          "errors": 0, "dropped": 0, "files_committed": 0}
+
+    # ---- drive model ----
+
+    def _lookup(self, path):
+        """Item id for "a/b/c" below the root, or None"""
+        item_id = "root"
+        for name in [part for part in path.split("/") if part]:
+            item_id = self.children.get(item_id, {}).get(name)
+            if item_id is None:
+                return None
+        return item_id
+
+    def _free_name(self, parent, name):
+        """conflictBehavior "rename": "clip.webm" -> "clip 1.webm", "clip 2.webm", ..."""
+        taken = self.children[parent]
+        if name not in taken:
+            return name
+        stem, dot, ext = name.rpartition(".")
+        if not dot:
+            stem, ext = name, ""
+        for n in range(1, 10000):
+            candidate = f"{stem} {n}{dot}{ext}"
+            if candidate not in taken:
+                return candidate
+        raise RuntimeError("No free name")
+
+    def _target_name(self, parent, name, conflict_behavior):
+        """Name an item will be stored under, or None if conflictBehavior "fail" hits an existing item"""
+        if name not in self.children[parent] or conflict_behavior == "replace":
+            return name
+        if conflict_behavior == "fail":
+            return None
+        return self._free_name(parent, name)
+
+    def _put_item(self, parent, name, folder=False, size=0, quick_xor=None):
+        existing = self.children[parent].get(name)
+        item_id = existing or uuid.uuid4().hex
+        self.items[item_id] = {"id": item_id, "name": name, "parent": parent, "folder": folder,
+                               "size": size, "hash": quick_xor, "modified": _now_iso()}
+        self.children[parent][name] = item_id
+        if folder:
+            self.children.setdefault(item_id, {})
+        return self.items[item_id]
+
+    def _remove_item(self, item_id):
+        """Delete an item and everything below it"""
+        item = self.items.pop(item_id)
+        for child_id in list(self.children.pop(item_id, {}).values()):
+            self._remove_item(child_id)
+        self.children.get(item["parent"], {}).pop(item["name"], None)
+
+    @staticmethod
+    def drive_item(item):
+        body = {"id": item["id"], "name": item["name"], "size": item["size"],
+                "lastModifiedDateTime": item["modified"], "parentReference": {"id": item["parent"]}}
+        if item["folder"]:
+            body["folder"] = {"childCount": 0}
+        else:
+            body["file"] = {"hashes": {"quickXorHash": item["hash"]}}
+        return body
+
+    # ---- faults ----
+
+    def _fault_applies(self, path):
+        pattern = self.faults.get("paths")
+        return not pattern or re.search(pattern, path)
+
+    def _pick_fault(self):
+        """None, "throttle", "error" or "drop" for the current request"""
+        faults = self.faults
+        with self._lock:
+            for kind in ("throttle", "error", "drop"):
+                if faults[f"{kind}_next"] > 0:
+                    faults[f"{kind}_next"] -= 1
+                    return kind
+        roll = self.random.random()
+        for kind in ("throttle", "error", "drop"):
+            rate = faults[f"{kind}_rate"]
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    def _delay(self):
+        seconds = self.faults["latency"] + self.random.uniform(0, self.faults["jitter"])
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _read_body(self):
+        """Request body, paced to the bandwidth cap"""
+        bandwidth = self.faults["bandwidth"]
+        started = time.monotonic()
+        body = request.get_data()
+        if bandwidth:
+            remaining = len(body) / bandwidth - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+        with self._lock:
+            self.stats["bytes_received"] += len(body)
+        return body
+
+    @staticmethod
+    def _drop_connection():
+        """
+        Shut the client connection down; the server's attempt to write the
+        response then fails quietly (werkzeug treats it as a dropped client).
+        """
+        sock = request.environ.get("werkzeug.socket")
+        if sock is None:
+            raise RuntimeError("Dropping connections needs the werkzeug server")
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    # ---- app ----
+
+    def create_app(self):
+        app = Flask("graph_simulator")
+        sim = self
+
+        @app.before_request
+        def inject_faults():
+            if request.path.startswith("/_sim"):
+                return None
+            with sim._lock:
+                sim.stats["requests"] += 1
+            if not sim._fault_applies(request.path):
+                return None
+            sim._delay()
+            fault = sim._pick_fault()
+            if fault == "throttle":
+                sim._count("throttled")
+                response = _error(429, "activityLimitReached", "Simulated throttling")
+                if sim.faults["retry_after"] is not None:
+                    response.headers["Retry-After"] = str(sim.faults["retry_after"])
+                return response
+            if fault == "error":
+                sim._count("errors")
+                status_code = sim.random.choice(sim.faults["error_statuses"])
+                return _error(status_code, "serviceNotAvailable", "Simulated server error")
+            if fault == "drop":
+                sim._count("dropped")
+                if sim.faults["drop_after_commit"]:
+                    request.environ["graph_simulator.drop"] = True
+                else:
+                    sim._drop_connection()
+                    return "", 502
+            if request.path.startswith("/v1.0/") and not request.headers.get("Authorization", "").startswith("Bearer "):
+                return _error(401, "InvalidAuthenticationToken", "Access token is empty")
+            return None
+
+        @app.after_request
+        def finish(response):
+            if request.environ.get("graph_simulator.drop"):
+                sim._drop_connection()
+            with sim._lock:
+                by_status = sim.stats["by_status"]
+                by_status[str(response.status_code)] = by_status.get(str(response.status_code), 0) + 1
+            return response
+
+        @app.get("/v1.0/me")
+        def me():
+            return jsonify({"id": "simulator", "displayName": "Graph Simulator",
+                            "userPrincipalName": "simulator@localhost"})
+
+        @app.get("/v1.0/me/drive/root:/<path:path>")
+        def item_by_path(path):
+            with sim._lock:
+                item_id = sim._lookup(path)
+                if item_id is None:
+                    return _error(404, "itemNotFound", f"{path} not found")
+                return jsonify(sim.drive_item(sim.items[item_id]))
+
+        def create_folder(parent):
+            payload = request.get_json(silent=True) or {}
+            name = payload.get("name")
+            if not name or "folder" not in payload:
+                return _error(400, "invalidRequest", "name and folder are required")
+            conflict_behavior = payload.get("@microsoft.graph.conflictBehavior", "fail")
+            with sim._lock:
+                existing = sim.children[parent].get(name)
+                if existing and sim.items[existing]["folder"] and conflict_behavior == "replace":
+                    return jsonify(sim.drive_item(sim.items[existing])), 200
+                target = sim._target_name(parent, name, conflict_behavior)
+                if target is None:
+                    return _error(409, "nameAlreadyExists", f"{name} already exists")
+                return jsonify(sim.drive_item(sim._put_item(parent, target, folder=True))), 201
+
+        @app.post("/v1.0/me/drive/root/children")
+        def create_root_folder():
+            return create_folder("root")
+
+        @app.post("/v1.0/me/drive/root:/<path:path>:/children")
+        def create_child_folder(path):
+            with sim._lock:
+                parent = sim._lookup(path)
+            if parent is None or not (parent == "root" or sim.items[parent]["folder"]):
+                return _error(404, "itemNotFound", f"{path} not found")
+            return create_folder(parent)
+
+        def folder_or_404(folder_id):
+            if folder_id != "root" and not sim.items.get(folder_id, {}).get("folder"):
+                return _error(404, "itemNotFound", f"Folder {folder_id} not found")
+            return None
+
+        @app.post("/v1.0/me/drive/items/<folder_id>:/<name>:/createUploadSession")
+        def create_upload_session(folder_id, name):
+            payload = (request.get_json(silent=True) or {}).get("item", {})
+            conflict_behavior = payload.get("@microsoft.graph.conflictBehavior", "fail")
+            with sim._lock:
+                missing = folder_or_404(folder_id)
+                if missing:
+                    return missing
+                target = sim._target_name(folder_id, name, conflict_behavior)
+                if target is None:
+                    return _error(409, "nameAlreadyExists", f"{name} already exists")
+                session_id = uuid.uuid4().hex
+                sim.sessions[session_id] = {"parent": folder_id, "name": target, "received": 0,
+                                            "hasher": QuickXorHash(), "total": None,
+                                            "expires_at": time.time() + sim.session_ttl}
+            return jsonify({
+                "uploadUrl": f"{request.host_url}upload/{session_id}",
+                "expirationDateTime": _now_iso(sim.session_ttl),
+                "nextExpectedRanges": ["0-"]
+            }), 200
+
+        def open_session(session_id):
+            session = sim.sessions.get(session_id)
+            if session is None or session["expires_at"] <= time.time():
+                sim.sessions.pop(session_id, None)
+                return None
+            return session
+
+        @app.route("/upload/<session_id>", methods=["GET"])
+        def session_status(session_id):
+            with sim._lock:
+                session = open_session(session_id)
+                if session is None:
+                    return _error(404, "itemNotFound", "Upload session not found")
+                return jsonify({"expirationDateTime": _now_iso(session["expires_at"] - time.time()),
+                                "nextExpectedRanges": [f"{session['received']}-"]})
+
+        @app.route("/upload/<session_id>", methods=["DELETE"])
+        def cancel_session(session_id):
+            with sim._lock:
+                sim.sessions.pop(session_id, None)
+            return "", 204
+
+        @app.route("/upload/<session_id>", methods=["PUT"])
+        def upload_chunk(session_id):
+            match = CONTENT_RANGE.fullmatch(request.headers.get("Content-Range", ""))
+            if not match:
+                return _error(400, "invalidRequest", "Content-Range is required")
+            start, end = int(match.group(1)), int(match.group(2))
+            total = None if match.group(3) == "*" else int(match.group(3))
+            body = sim._read_body()
+
+            with sim._lock:
+                session = open_session(session_id)
+                if session is None:
+                    return _error(404, "itemNotFound", "Upload session not found")
+                if len(body) != end - start + 1:
+                    return _error(400, "invalidRequest", "Body length does not match Content-Range")
+                if None not in (session["total"], total) and session["total"] != total:
+                    return _error(400, "invalidRequest", "Total size changed")
+                if start != session["received"]:
+                    return _error(416, "invalidRange", f"Expected range {session['received']}-")
+                last = end + 1 == total  # never while the total is "*"
+                if sim.strict_chunks and (len(body) > GRAPH_MAX_CHUNK or (not last and len(body) % CHUNK_UNIT)):
+                    return _error(400, "invalidRequest", "Fragments must be multiples of 320 KiB, at most 60 MiB")
+
+                session["total"] = session["total"] if total is None else total
+                session["hasher"].update(body)
+                session["received"] = end + 1
+                if not last:
+                    return jsonify({"expirationDateTime": _now_iso(session["expires_at"] - time.time()),
+                                    "nextExpectedRanges": [f"{session['received']}-"]}), 202
+
+                del sim.sessions[session_id]
+                item = sim._put_item(session["parent"], session["name"], size=total,
+                                     quick_xor=session["hasher"].b64digest())
+                sim.stats["files_committed"] += 1
+                return jsonify(sim.drive_item(item)), 201
+
+        @app.put("/v1.0/me/drive/items/<folder_id>:/<name>:/content")
+        def simple_upload(folder_id, name):
+            body = sim._read_body()
+            with sim._lock:
+                missing = folder_or_404(folder_id)
+                if missing:
+                    return missing
+                existed = name in sim.children[folder_id]
+                item = sim._put_item(folder_id, name, size=len(body), quick_xor=QuickXorHash(body).b64digest())
+                sim.stats["files_committed"] += 1
+                return jsonify(sim.drive_item(item)), 200 if existed else 201
+
+        @app.get("/v1.0/me/drive/items/<folder_id>:/<name>")
+        def item_in_folder(folder_id, name):
+            with sim._lock:
+                item_id = sim.children.get(folder_id, {}).get(name)
+                if item_id is None:
+                    return _error(404, "itemNotFound", f"{name} not found")
+                return jsonify(sim.drive_item(sim.items[item_id]))
+
+        @app.get("/v1.0/me/drive/items/<item_id>")
+        def item_by_id(item_id):
+            with sim._lock:
+                item = sim.items.get(item_id)
+                if item is None:
+                    return _error(404, "itemNotFound", f"Item {item_id} not found")
+                return jsonify(sim.drive_item(item))
+
+        @app.delete("/v1.0/me/drive/items/<item_id>")
+        def delete_item(item_id):
+            with sim._lock:
+                if item_id not in sim.items:
+                    return _error(404, "itemNotFound", f"Item {item_id} not found")
+                sim._remove_item(item_id)
+            return "", 204
+
+        # ---- control ----
+
+        @app.route("/_sim/faults", methods=["GET", "POST"])
+        def faults():
+            if request.method == "POST":
+                changes = request.get_json(silent=True) or {}
+                unknown = set(changes) - set(DEFAULT_FAULTS)
+                if unknown:
+                    return _error(400, "invalidRequest", f"Unknown fault settings: {sorted(unknown)}")
+                with sim._lock:
+                    sim.faults.update(changes)
+            return jsonify(sim.faults)
+
+        @app.get("/_sim/stats")
+        def stats():
+            with sim._lock:
+                return jsonify(dict(sim.stats, open_sessions=len(sim.sessions),
+                                    files=sum(1 for item in sim.items.values() if not item["folder"])))
+
+        @app.post("/_sim/reset")
+        def reset():
+            sim.reset()
+            return jsonify({"reset": True})
+
+        return app
+
+
+def write_token_file(path):
+    """Dummy token file for TOKEN_FILE - never overwrites an existing (real) one"""
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists, not overwriting it")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"access_token": "simulator", "refresh_token": "simulator",
+                   "expires_at": time.time() + 10 * 365 * 86400}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Microsoft Graph simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability of a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 5xx")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of a dropped connection")
+    parser.add_argument("--drop-after-commit", action="store_true",
+                        help="drop connections after the request took effect")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/second for request bodies, 0 = unlimited")
+    parser.add_argument("--paths", default=None, help="regex: only inject faults on matching paths")
+    parser.add_argument("--session-ttl", type=int, default=3600, help="upload session lifetime, seconds")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible fault patterns")
+    parser.add_argument("--token-file", default=None, help="write a dummy token file for TOKEN_FILE and exit")
+    args = parser.parse_args()
+
+    if args.token_file:
+        write_token_file(args.token_file)
+        print(f"Wrote {args.token_file}")
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    simulator = GraphSimulator(faults={
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "throttle_rate": args.throttle_rate,
+        "retry_after": args.retry_after,
+        "error_rate": args.error_rate,
+        "drop_rate": args.drop_rate,
+        "drop_after_commit": args.drop_after_commit,
+        "bandwidth": args.bandwidth,
+        "paths": args.paths
+    }, seed=args.seed, session_ttl=args.session_ttl)
+
+    log.info("Graph simulator on http://%s:%s/v1.0 - faults: %s", args.host, args.port, simulator.faults)
+    simulator.create_app().run(host=args.host, port=args.port, threaded=True, debug=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Shared rate limiter for Microsoft Graph traffic
+
+Graph throttles per app and user, so one throttled call means every other
+call made right now will be throttled too. All Graph requests (folder
+lookups, session creation, chunk PUTs, /me) pass through one
+GraphRateLimiter:
+
+- a token bucket of `rate` requests/second with `burst` capacity
+- a global pause: when Graph answers 429/503 with Retry-After, every
+  caller waits until the pause is over instead of hammering Graph
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value):
+    """Retry-After header (seconds or HTTP-date) -> seconds to wait, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class GraphRateLimiter:
+    """Thread-safe token bucket plus a shared Retry-After pause"""
+
+    def __init__(self, rate=10, burst=20):
+        """rate: requests per second (0 = unlimited), burst: bucket size"""
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.throttled = 0
+        self.throttle_wait_seconds = 0.0
+        self.rate_wait_seconds = 0.0
+
+    def acquire(self):
+        """Block until one request may be sent"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Take a token without blocking. Returns 0 if the request may be sent,
+        otherwise the seconds to wait before trying again (for async callers).
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if wait > 0:
+                return wait
+            if not self.rate:
+                return 0
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            wait = (1 - self.tokens) / self.rate
+            self.rate_wait_seconds += wait
+            return wait
+
+    def pause(self, seconds):
+        """Graph said Retry-After: hold every caller for `seconds`"""
+        with self._lock:
+            self.throttled += 1
+            self.throttle_wait_seconds += seconds
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            paused_for = max(0.0, self.paused_until - time.monotonic())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "throttled": self.throttled,
+                "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+                "rate_wait_seconds": round(self.rate_wait_seconds, 3),
+                "paused_for": round(paused_for, 3)
+            }
@@ -0,0 +1,33 @@
+"""
+Gunicorn settings for multi-worker serving
+
+    gunicorn -c backend/gunicorn.conf.py onedrive_uploader:app
+
+(start.sh does this when WEB_CONCURRENCY is set above 1). Each worker is
+a separate process with WEB_THREADS request threads; tokens, folder IDs,
+the upload journal and the upload index are shared through files in
+backend/ and backend/spool/, and one worker - the leader - runs the
+background services (see onedrive_uploader.start_services).
+"""
+
+import multiprocessing
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.getenv("BACKEND_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+# Uploads are spooled from slow browsers - don't kill a worker mid-request
+timeout = int(os.getenv("WEB_TIMEOUT", 300))
+graceful_timeout = 30
+# Workers import the app themselves: no threads or SQLite connections cross a fork
+preload_app = False
+
+# Workers read WEB_CONCURRENCY to split the Graph rate limit between them
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def post_worker_init(worker):
+    import onedrive_uploader
+    onedrive_uploader.start_services()
@@ -0,0 +1,328 @@
+"""
+Live uploads - a recording sent in segments while it is still running
+
+The UI's MediaRecorder emits a segment every few seconds. Each one is
+PUT with its sequence number and appended to a spool file. A Graph
+upload session is opened when the live upload starts, and while
+recording continues every full 320 KiB-aligned run of spooled bytes is
+pushed to it with an open-ended Content-Range (bytes a-b/*). Finishing
+hands the spool file and the session to the job queue, which resumes
+the session and sends the rest with the real total - so when recording
+stops most of the video is already on OneDrive. Without a session (no
+token, OneDrive down, the session expired) the whole file is uploaded
+after finishing, as before.
+
+SHA-1 and quickXorHash are updated as each segment is appended, so
+finishing does not read the recording back. The hash state lives in the
+appending process; a process that finishes (or appends to) an upload
+whose earlier segments went to another worker reads just those bytes.
+
+Segments must arrive in order: a repeat of an appended segment is
+acknowledged without appending it again (the client retried after a lost
+response), a gap is refused with the sequence number expected next.
+
+The append happens inside a SQLite write transaction, which orders
+appends from any number of worker processes. The file is cut back to the
+recorded size first, so a write interrupted before its commit leaves no
+stray bytes.
+
+States: open -> finished | failed
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from quickxor import QuickXorHash
+
+LIVE_OPEN = "open"
+LIVE_FINISHED = "finished"
+LIVE_FAILED = "failed"
+
+# append() results
+APPENDED = "appended"
+DUPLICATE = "duplicate"
+OUT_OF_ORDER = "out_of_order"
+CLOSED = "closed"
+
+LIVE_TTL = 7 * 24 * 3600  # seconds finished entries are kept for polling
+HASH_BUFFER_SIZE = 1024 * 1024  # bytes read at a time when catching up on other workers' segments
+
+
+class _SpoolHashes:
+    """SHA-1 and quickXorHash of the first `size` bytes of a spool file"""
+
+    def __init__(self):
+        self.size = 0
+        self.sha1 = hashlib.sha1()
+        self.quick_xor = QuickXorHash()
+
+    def update(self, data):
+        self.sha1.update(data)
+        self.quick_xor.update(data)
+        self.size += len(data)
+
+    def catch_up(self, spool_path, size):
+        """Hash bytes up to size that were appended without this object seeing them"""
+        if self.size == size:
+            return
+        with open(spool_path, "rb") as f:
+            f.seek(self.size)
+            while self.size < size:
+                piece = f.read(min(HASH_BUFFER_SIZE, size - self.size))
+                if not piece:
+                    raise OSError(f"{spool_path} is shorter than the {size} bytes recorded")
+                self.update(piece)
+
+
+class LiveUploadStore:
+    """Thread- and process-safe store of live uploads; spool files live in spool_dir"""
+
+    def __init__(self, path, spool_dir):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS live_uploads (
+                live_id TEXT PRIMARY KEY,
+                volunteer_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                spool_path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                next_seq INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                job_id TEXT,
+                session_id TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._add_missing_columns()
+        self._conn.commit()
+
+        self._hashes = {}  # live_id -> _SpoolHashes, for uploads this process appended to
+        self.segments_appended = 0
+        self.bytes_appended = 0
+
+    # Columns added after the first release - existing stores are migrated in place
+    ADDED_COLUMNS = {
+        "upload_url": "TEXT",           # Graph upload session receiving the recording
+        "upload_expires_at": "REAL",
+        "uploaded": "INTEGER NOT NULL DEFAULT 0",  # bytes the session has acknowledged
+        "push_until": "REAL"            # lease of the process pushing to the session
+    }
+
+    def _add_missing_columns(self):
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(live_uploads)")}
+        for name, column_type in self.ADDED_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE live_uploads ADD COLUMN {name} {column_type}")
+
+    def create(self, volunteer_id, filename, file_type):
+        """Open a live upload with an empty spool file; returns its entry"""
+        live_id = uuid.uuid4().hex
+        spool_path = os.path.join(self.spool_dir, f"live-{live_id}.part")
+        open(spool_path, "wb").close()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO live_uploads (live_id, volunteer_id, filename, file_type, spool_path, state, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (live_id, str(volunteer_id), filename, file_type, spool_path, LIVE_OPEN, now, now)
+            )
+            self._conn.execute("DELETE FROM live_uploads WHERE state != ? AND updated_at < ?",
+                               (LIVE_OPEN, now - LIVE_TTL))
+            self._conn.commit()
+        return self.get(live_id)
+
+    def get(self, live_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM live_uploads WHERE live_id = ?", (live_id,)).fetchone()
+        return dict(row) if row else None
+
+    def append(self, live_id, seq, data):
+        """
+        Append segment seq. Returns (result, entry) - result is APPENDED,
+        DUPLICATE, OUT_OF_ORDER or CLOSED; entry is None for an unknown ID.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # one appender at a time, in any process
+            try:
+                row = self._conn.execute("SELECT * FROM live_uploads WHERE live_id = ?", (live_id,)).fetchone()
+                if row is None:
+                    result = None
+                elif row["state"] != LIVE_OPEN:
+                    result = CLOSED
+                elif seq < row["next_seq"]:
+                    result = DUPLICATE
+                elif seq > row["next_seq"]:
+                    result = OUT_OF_ORDER
+                else:
+                    hashes = self._hashes.setdefault(live_id, _SpoolHashes())
+                    hashes.catch_up(row["spool_path"], row["size"])
+                    with open(row["spool_path"], "r+b") as f:
+                        f.truncate(row["size"])
+                        f.seek(row["size"])
+                        f.write(data)
+                    self._conn.execute(
+                        "UPDATE live_uploads SET next_seq = next_seq + 1, size = size + ?, updated_at = ? "
+                        "WHERE live_id = ?",
+                        (len(data), time.time(), live_id)
+                    )
+                    result = APPENDED
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                self._hashes.pop(live_id, None)  # may have seen bytes that were not recorded
+                raise
+            if result == APPENDED:
+                hashes.update(data)
+                self.segments_appended += 1
+                self.bytes_appended += len(data)
+        return result, self.get(live_id)
+
+    def hashes(self, live_id):
+        """{"sha1", "quickXorHash"} of everything appended so far (reads only bytes this process has not seen)"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM live_uploads WHERE live_id = ?", (live_id,)).fetchone()
+            hashes = self._hashes.setdefault(live_id, _SpoolHashes())
+            hashes.catch_up(row["spool_path"], row["size"])
+            return {"sha1": hashes.sha1.hexdigest(), "quickXorHash": hashes.quick_xor.b64digest()}
+
+    # ---- the Graph upload session ----
+
+    def set_upload_session(self, live_id, upload_url, expires_at):
+        """Attach a new Graph upload session; False if the upload is no longer open (or already has one)"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE live_uploads SET upload_url = ?, upload_expires_at = ?, uploaded = 0, updated_at = ? "
+                "WHERE live_id = ? AND state = ? AND upload_url IS NULL",
+                (upload_url, expires_at, time.time(), live_id, LIVE_OPEN)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def drop_upload_session(self, live_id):
+        """The session is gone (expired, rejected) - the recording is uploaded whole after finishing"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE live_uploads SET upload_url = NULL, upload_expires_at = NULL, uploaded = 0 WHERE live_id = ?",
+                (live_id,)
+            )
+            self._conn.commit()
+
+    def claim_push(self, live_id, lease_seconds):
+        """
+        Become the one process pushing this upload's bytes to its session,
+        for lease_seconds. Returns the entry, or None if the upload is not
+        open, has no session, or another pusher holds an unexpired lease.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE live_uploads SET push_until = ? WHERE live_id = ? AND state = ? "
+                "AND upload_url IS NOT NULL AND (push_until IS NULL OR push_until < ?)",
+                (now + lease_seconds, live_id, LIVE_OPEN, now)
+            )
+            self._conn.commit()
+        return self.get(live_id) if cursor.rowcount == 1 else None
+
+    def set_uploaded(self, live_id, uploaded, lease_seconds):
+        """The session acknowledged bytes up to uploaded; renews the push lease. Returns the entry."""
+        with self._lock:
+            self._conn.execute("UPDATE live_uploads SET uploaded = ?, push_until = ? WHERE live_id = ?",
+                               (uploaded, time.time() + lease_seconds, live_id))
+            self._conn.commit()
+        return self.get(live_id)
+
+    def release_push(self, live_id):
+        with self._lock:
+            self._conn.execute("UPDATE live_uploads SET push_until = NULL WHERE live_id = ?", (live_id,))
+            self._conn.commit()
+
+    def finish(self, live_id):
+        """Stop accepting segments; returns the entry if this call finished it, else None"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE live_uploads SET state = ?, updated_at = ? WHERE live_id = ? AND state = ?",
+                (LIVE_FINISHED, time.time(), live_id, LIVE_OPEN)
+            )
+            self._conn.commit()
+        return self.get(live_id) if cursor.rowcount == 1 else None
+
+    def reopen(self, live_id):
+        """Accept segments again (finishing was refused, e.g. segments were missing)"""
+        with self._lock:
+            self._conn.execute("UPDATE live_uploads SET state = ?, updated_at = ? WHERE live_id = ?",
+                               (LIVE_OPEN, time.time(), live_id))
+            self._conn.commit()
+
+    def set_job(self, live_id, job_id, session_id=None):
+        """The spool file went to the job queue as job_id"""
+        with self._lock:
+            self._hashes.pop(live_id, None)
+            self._conn.execute(
+                "UPDATE live_uploads SET job_id = ?, session_id = ?, updated_at = ? WHERE live_id = ?",
+                (job_id, session_id, time.time(), live_id)
+            )
+            self._conn.commit()
+
+    def abandon(self, live_id):
+        """Drop an open live upload and its spool file; returns False if it was not open"""
+        with self._lock:
+            self._hashes.pop(live_id, None)
+            cursor = self._conn.execute(
+                "UPDATE live_uploads SET state = ?, error = ?, updated_at = ? WHERE live_id = ? AND state = ?",
+                (LIVE_FAILED, "Abandoned by the client", time.time(), live_id, LIVE_OPEN)
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT spool_path FROM live_uploads WHERE live_id = ?", (live_id,)).fetchone()
+        if cursor.rowcount != 1:
+            return False
+        try:
+            os.remove(row["spool_path"])
+        except OSError:
+            pass
+        return True
+
+    def fail(self, live_id, error):
+        with self._lock:
+            self._hashes.pop(live_id, None)
+            self._conn.execute("UPDATE live_uploads SET state = ?, error = ?, updated_at = ? WHERE live_id = ?",
+                               (LIVE_FAILED, error, time.time(), live_id))
+            self._conn.commit()
+
+    def idle(self, idle_seconds):
+        """Open live uploads that received nothing for idle_seconds (the browser went away)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM live_uploads WHERE state = ? AND updated_at < ? ORDER BY created_at",
+                (LIVE_OPEN, time.time() - idle_seconds)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def open_count(self):
+        """Number of live uploads still receiving segments, across all processes"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM live_uploads WHERE state = ?",
+                                      (LIVE_OPEN,)).fetchone()[0]
+
+    def stats(self):
+        return {
+            "open": self.open_count(),
+            "segments_appended": self.segments_appended,
+            "bytes_appended": self.bytes_appended
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -4,6 +4,17 @@ Flask Backend for uploading files to OneDrive using Microsoft Graph API
 Features:
 - Receive file upload requests from HTML/JavaScript
 - Upload files to OneDrive with Resumable Upload support
+- Streaming raw-body uploads spooled to disk (/api/upload/stream)
+- Background upload jobs with progress polling (/api/jobs/<id>)
+- Upload sessions: a declared manifest of files uploaded in parallel, complete once all are verified
+- Live uploads: recording segments appended on the backend while the session is still running
+- Upload journal so in-flight uploads resume after a restart
+- Idempotency keys and content-hash dedup so retries never create copies
+- Admission control (429 + Retry-After) on concurrent uploads and bytes in flight
+- Prometheus-style /metrics endpoint
+- Per-upload request IDs and span tracing (JSON lines / Chrome trace export)
+- Structured JSON logging through a non-blocking queue, levels per logger
+- Reconciler that pushes locally saved fallback files once OneDrive is back
 - Create folder structure: /KFUPM_GSR_Project/V{volunteer_id}/
 - Error handling and retry logic
 - CORS support for browser requests
@@ -28,18 +39,51 @@ if not hasattr(pkgutil, 'get_loader'):
             return spec.loader if spec else None
     pkgutil.get_loader = get_loader
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 import requests
 import json
+import logging
 import os
+import io
+import uuid
+import shutil
+import asyncio
 import base64
+import functools
+import hashlib
+import threading
+import time
 from datetime import datetime
-import msal
 from dotenv import load_dotenv
 
+from folder_cache import SharedFolderCache
+from graph_client import GraphClient
+from graph_async import AsyncGraphClient, GraphEventLoop
+from graph_throttle import GraphRateLimiter
+from deadline import Deadline
+from health_prober import HealthProber
+import metrics
+import tracing
+import structured_log
+from upload_jobs import UploadJob, UploadJobQueue, QueueFullError, JOB_DONE, JOB_FAILED, JOB_UPLOADING
+from chunk_sizer import AdaptiveChunkSizer
+from chunk_source import ChunkSource
+from upload_journal import UploadJournal, parse_expiry
+from token_manager import TokenManager
+from circuit_breaker import CircuitBreaker, STATE_CLOSED
+from reconciler import Reconciler
+from quickxor import QuickXorHash
+from upload_index import UploadIndex
+from live_uploads import LiveUploadStore, LIVE_OPEN, APPENDED, DUPLICATE, OUT_OF_ORDER, CLOSED
+from upload_sessions import (UploadSessionStore, ManifestError, validate_manifest, manifest_document, part_key,
+                             PART_UPLOADING, PART_UPLOADED, PART_QUEUED, PART_WAITING, SESSION_OPEN)
+from admission import AdmissionController, AdmissionRejected
+from process_lock import LeaderLock
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["Retry-After", "X-Request-ID"])  # let the UI read backpressure hints and request IDs
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -47,15 +91,106 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 # Microsoft Graph settings
 TENANT = "consumers"
 CLIENT_ID = "04b07795-8ddb-461a-bbee-02f9e1bf7b46"
-GRAPH_API_ENDPOINT = "https://graph.microsoft.com/v1.0"
+GRAPH_API_ENDPOINT = os.getenv('GRAPH_API_ENDPOINT', "https://graph.microsoft.com/v1.0")  # or graph_simulator.py
 
 # Token cache file - use absolute path or relative from this file's directory
 TOKEN_FILE_NAME = "onedrive_tokens.json"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-TOKEN_CACHE_FILE = os.path.join(SCRIPT_DIR, TOKEN_FILE_NAME)
+TOKEN_CACHE_FILE = os.getenv('TOKEN_FILE', os.path.join(SCRIPT_DIR, TOKEN_FILE_NAME))
+TOKEN_SCOPES = ["Files.ReadWrite"]  # offline_access is implied - MSAL rejects reserved scopes
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 300))  # refresh this many seconds before expiry
 
 # Resumable Upload settings
-CHUNK_SIZE = 327680  # 320 KB per chunk
+CHUNK_SIZE = 327680  # 320 KB per chunk - starting / minimum chunk size
+CHUNK_SIZE_MAX = int(os.getenv('CHUNK_SIZE_MAX', 32 * 327680))  # 10 MB adaptive ceiling
+CHUNK_TARGET_SECONDS = float(os.getenv('CHUNK_TARGET_SECONDS', 2.0))  # aim for chunks this long
+SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024  # Graph simple PUT limit
+CHUNK_MAX_RETRIES = int(os.getenv('CHUNK_MAX_RETRIES', 5))  # per chunk, before giving up
+CHUNK_RETRY_BACKOFF = float(os.getenv('CHUNK_RETRY_BACKOFF', 1.0))  # seconds, doubled per retry
+SESSION_CANCEL_TIMEOUT = 5  # seconds for the best-effort DELETE of an abandoned session
+
+# Streaming upload settings - request bodies are spooled to disk in
+# bounded pieces so memory use does not grow with the file size
+STREAM_BUFFER_SIZE = 1024 * 1024  # 1 MB per read from the request stream
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join(SCRIPT_DIR, "spool"))  # also holds the SQLite stores
+os.makedirs(SPOOL_DIR, exist_ok=True)
+
+# Journal of queued uploads and their Graph sessions - survives restarts
+UPLOAD_JOURNAL_FILE = os.path.join(SPOOL_DIR, "upload_journal.db")
+
+# Index of uploads already on OneDrive - repeats are answered without re-sending
+UPLOAD_INDEX_FILE = os.path.join(SPOOL_DIR, "upload_index.db")
+
+# Upload sessions (/api/sessions) - files of one recording session, declared up front
+UPLOAD_SESSIONS_FILE = os.path.join(SPOOL_DIR, "upload_sessions.db")
+SESSION_MAX_FILES = int(os.getenv('SESSION_MAX_FILES', 8))
+
+# Live uploads (/api/live) - recording segments appended while the recorder runs
+LIVE_UPLOADS_FILE = os.path.join(SPOOL_DIR, "live_uploads.db")
+LIVE_SEGMENT_MAX = int(os.getenv('LIVE_SEGMENT_MAX', 64 * 1024 * 1024))  # bytes per segment
+LIVE_IDLE_TIMEOUT = float(os.getenv('LIVE_IDLE_TIMEOUT', 1800))  # seconds without segments, then uploaded as is
+LIVE_PUSH_LEASE = 300  # seconds one process may push a live upload to OneDrive before another may take over
+LIVE_PUSH_CHUNK = max(CHUNK_SIZE, CHUNK_SIZE_MAX // CHUNK_SIZE * CHUNK_SIZE)  # bytes per PUT while recording
+
+# Graph HTTP client settings (pooled keep-alive connections)
+GRAPH_POOL_SIZE = int(os.getenv('GRAPH_POOL_SIZE', 10))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv('GRAPH_CONNECT_TIMEOUT', 10))  # seconds
+GRAPH_READ_TIMEOUT = float(os.getenv('GRAPH_READ_TIMEOUT', 60))  # seconds
+GRAPH_RATE_LIMIT = float(os.getenv('GRAPH_RATE_LIMIT', 10))  # requests/second for all Graph calls, 0 = unlimited
+GRAPH_RATE_BURST = int(os.getenv('GRAPH_RATE_BURST', 20))
+GRAPH_THROTTLE_RETRIES = int(os.getenv('GRAPH_THROTTLE_RETRIES', 3))  # replays of a 429/503 call
+GRAPH_MAX_RETRY_AFTER = float(os.getenv('GRAPH_MAX_RETRY_AFTER', 120))  # seconds, cap per pause
+
+# Circuit breaker - after BREAKER_FAILURE_THRESHOLD consecutive OneDrive
+# failures, uploads go straight to local storage for BREAKER_COOLDOWN seconds
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 60))  # seconds
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', 5))  # seconds
+
+# /api/status answers from a background probe instead of calling Graph per hit
+STATUS_PROBE_INTERVAL = float(os.getenv('STATUS_PROBE_INTERVAL', 30))  # seconds
+
+# Upload tracing (see tracing.py) - "jsonl" or "chrome" writes every span to TRACE_FILE, empty = off
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', '').lower()
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join(
+    SPOOL_DIR, "traces.json" if TRACE_EXPORT == tracing.EXPORT_CHROME else "traces.jsonl"))
+DEBUG_TIMING_HEADER = "X-Debug-Timing"  # set to 1 to get a "timing" breakdown in upload responses
+
+# Logging (see structured_log.py) - LOG_LEVELS overrides single loggers, e.g. "uploader.folder=WARNING"
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', structured_log.FORMAT_JSON)  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # records waiting for the writer; more are dropped
+
+# Background upload jobs - /api/upload spools the file and returns 202,
+# a bounded worker pool uploads it. UPLOAD_ASYNC=false restores blocking uploads.
+UPLOAD_ASYNC = os.getenv('UPLOAD_ASYNC', 'true').lower() == 'true'
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 8))  # jobs uploading at once (coroutines, not threads)
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', 32))
+UPLOAD_DEADLINE = float(os.getenv('UPLOAD_DEADLINE', 1800))  # seconds from admission to OneDrive, then local; 0 = none
+
+# Admission control - upload requests over these limits get 429 + Retry-After
+UPLOAD_MAX_CONCURRENT = int(os.getenv('UPLOAD_MAX_CONCURRENT', 4))  # requests being received at once
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.getenv('UPLOAD_MAX_INFLIGHT_BYTES', 512 * 1024 * 1024))  # receiving + queued
+UPLOAD_RETRY_AFTER = int(os.getenv('UPLOAD_RETRY_AFTER', 5))  # seconds suggested to rejected clients
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # largest request body, 413 above
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+
+# OneDrive folder layout: /{PROJECT_FOLDER}/V{volunteer_id}/
+PROJECT_FOLDER = "KFUPM_GSR_Project"
+
+# Folder-ID cache settings - shared by worker processes through FOLDER_CACHE_FILE
+FOLDER_CACHE_TTL = int(os.getenv('FOLDER_CACHE_TTL', 3600))  # seconds
+FOLDER_CACHE_SIZE = int(os.getenv('FOLDER_CACHE_SIZE', 256))  # entries
+FOLDER_CACHE_FILE = os.path.join(SPOOL_DIR, "folder_cache.db")
+
+# Multi-worker serving (gunicorn.conf.py). Graph rate limits are per process,
+# so each of the WEB_CONCURRENCY workers gets its share of GRAPH_RATE_LIMIT.
+# One process - the leader - runs the background services.
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+LEADER_LOCK_FILE = os.path.join(SPOOL_DIR, "leader.lock")
+JOURNAL_SWEEP_INTERVAL = float(os.getenv('JOURNAL_SWEEP_INTERVAL', 60))  # seconds between orphaned-job scans
+PROCESS_STARTED = time.time()
 
 # Storage configuration from .env
 UPLOAD_MODE = os.getenv('UPLOAD_MODE', 'local')  # 'local' or 'onedrive'
@@ -66,12 +201,126 @@ LOCAL_STORAGE_DIR = os.path.join(SCRIPT_DIR, "..", "uploads")
 if UPLOAD_MODE == 'onedrive' and ONEDRIVE_PATH:
     LOCAL_STORAGE_DIR = ONEDRIVE_PATH
 
-print(f"[CONFIG] Upload mode: {UPLOAD_MODE}")
-print(f"[CONFIG] Storage path: {LOCAL_STORAGE_DIR}")
+# Reconciler - pushes locally saved fallback files to OneDrive later.
+# Off by default when local storage is the OneDrive sync folder itself.
+RECONCILE_ENABLED = os.getenv(
+    'RECONCILE_ENABLED', 'false' if UPLOAD_MODE == 'onedrive' and ONEDRIVE_PATH else 'true'
+).lower() == 'true'
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', 300))  # seconds between scans
+RECONCILE_WORKERS = int(os.getenv('RECONCILE_WORKERS', 2))
+RECONCILE_MAX_BPS = int(os.getenv('RECONCILE_MAX_BPS', 1024 * 1024))  # bytes/second, 0 = unlimited
+RECONCILE_ROOTS = [
+    LOCAL_STORAGE_DIR,
+    os.path.join(SCRIPT_DIR, "..", "uploads", "GSR_Sessions")  # drive_upload.py fallback tree
+]
+RECONCILE_MANIFEST_FILE = os.path.join(SPOOL_DIR, "reconcile_manifest.json")
+
+structured_log.configure(LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, queue_size=LOG_QUEUE_SIZE)
+log = logging.getLogger("uploader")
+folder_log = log.getChild("folder")
+upload_log = log.getChild("upload")
+resumable_log = log.getChild("resumable")
+integrity_log = log.getChild("integrity")
+local_log = log.getChild("local")
+journal_log = log.getChild("journal")
+jobs_log = log.getChild("jobs")
+dedup_log = log.getChild("dedup")
+session_log = log.getChild("session")
+live_log = log.getChild("live")
+
+log.info("Upload mode: %s", UPLOAD_MODE)
+log.info("Storage path: %s", LOCAL_STORAGE_DIR)
+
+# Metrics (rendered by /metrics) - live state is read through callbacks at scrape time
+HTTP_REQUESTS = metrics.counter("upload_backend_http_requests_total", "HTTP requests by endpoint and status",
+                                ["endpoint", "method", "status"])
+HTTP_LATENCY = metrics.histogram("upload_backend_http_request_duration_seconds", "HTTP request latency",
+                                 ["endpoint"])
+GRAPH_REQUESTS = metrics.counter("graph_requests_total", "Graph calls by operation and status",
+                                 ["operation", "status"])
+GRAPH_LATENCY = metrics.histogram("graph_request_duration_seconds", "Graph call latency by operation",
+                                  ["operation"])
+GRAPH_BYTES_SENT = metrics.counter("graph_upload_bytes_sent_total", "File bytes accepted by Graph")
+UPLOADS_FINISHED = metrics.counter("uploads_total", "Finished uploads by destination and integrity",
+                                   ["location", "integrity"])
+UPLOAD_BYTES = metrics.counter("upload_bytes_total", "Bytes of finished uploads by destination", ["location"])
+FALLBACKS = metrics.counter("upload_fallback_local_total", "Uploads saved locally instead of OneDrive",
+                            ["reason"])
+CHUNK_RETRIES = metrics.counter("upload_chunk_retries_total", "Failed chunk PUTs that were retried")
+CHUNK_SIZES = metrics.histogram("upload_chunk_size_bytes", "Size of accepted resumable-upload chunks",
+                                buckets=[CHUNK_SIZE * 2 ** i for i in range(8)])
+metrics.gauge("upload_chunk_size_preferred_bytes", "Adaptive chunk size the next upload starts with",
+              callback=lambda: preferred_chunk_size)
+metrics.gauge("upload_jobs", "Upload jobs by state (pending = queued + uploading)", ["state"],
+              callback=lambda: {(state,): count for state, count in upload_jobs.stats().items()})
+metrics.gauge("upload_inflight_bytes", "Bytes being received and queued for upload", ["stage"],
+              callback=lambda: {("receiving",): admission.active_bytes, ("queued",): upload_jobs.pending_bytes()})
+metrics.counter("upload_admission_rejected_total", "Upload requests rejected with 429",
+                callback=lambda: admission.rejected)
+SESSIONS_FINISHED = metrics.counter("upload_sessions_total", "Upload sessions settled, by outcome", ["state"])
+metrics.counter("live_upload_segments_total", "Recording segments appended to live uploads",
+                callback=lambda: live_uploads.segments_appended)
+metrics.counter("live_upload_bytes_total", "Bytes appended to live uploads",
+                callback=lambda: live_uploads.bytes_appended)
+metrics.counter("upload_duplicates_total", "Uploads answered from the completed-upload index",
+                callback=lambda: upload_index.hits)
+metrics.counter("graph_throttled_total", "Graph 429/503 responses with Retry-After",
+                callback=lambda: graph_rate_limiter.throttled)
+metrics.counter("graph_throttle_wait_seconds_total", "Time Graph calls were paused by Retry-After",
+                callback=lambda: graph_rate_limiter.throttle_wait_seconds)
+metrics.gauge("graph_loop_tasks", "Uploads and Graph calls running on the Graph event loop",
+              callback=lambda: graph_loop.running)
+metrics.gauge("onedrive_circuit_open", "1 while the OneDrive circuit breaker is not closed",
+              callback=lambda: 0 if onedrive_breaker.state == STATE_CLOSED else 1)
+metrics.gauge("graph_token_expires_in_seconds", "Seconds until the access token expires",
+              callback=lambda: token_manager.seconds_left())
+metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full",
+                callback=structured_log.dropped)
+
+
+def observe_graph_call(operation, status_code, seconds):
+    GRAPH_REQUESTS.inc(operation=operation, status=str(status_code or "error"))
+    GRAPH_LATENCY.observe(seconds, operation=operation)
+    tracing.add_span(f"graph.{operation}", seconds, status=status_code)
+
+
+def observe_token_refresh(seconds, success):
+    observe_graph_call("token_refresh", 200 if success else None, seconds)
+
 
 # Global variables
-access_token = None
-tokens_data = {}
+token_manager = TokenManager(
+    TOKEN_CACHE_FILE,
+    CLIENT_ID,
+    authority=f"https://login.microsoftonline.com/{TENANT}",
+    scopes=TOKEN_SCOPES,
+    refresh_margin=TOKEN_REFRESH_MARGIN,
+    observer=observe_token_refresh
+)
+folder_cache = SharedFolderCache(FOLDER_CACHE_FILE, max_entries=FOLDER_CACHE_SIZE, ttl_seconds=FOLDER_CACHE_TTL)
+preferred_chunk_size = CHUNK_SIZE  # last adaptive size, seeds the next upload
+upload_journal = UploadJournal(UPLOAD_JOURNAL_FILE)
+upload_index = UploadIndex(UPLOAD_INDEX_FILE)
+upload_sessions = UploadSessionStore(UPLOAD_SESSIONS_FILE)
+live_uploads = LiveUploadStore(LIVE_UPLOADS_FILE, SPOOL_DIR)
+graph_rate_limiter = GraphRateLimiter(rate=GRAPH_RATE_LIMIT / WEB_CONCURRENCY,
+                                      burst=max(1, GRAPH_RATE_BURST // WEB_CONCURRENCY))
+graph_client_options = dict(
+    pool_size=GRAPH_POOL_SIZE,
+    connect_timeout=GRAPH_CONNECT_TIMEOUT,
+    read_timeout=GRAPH_READ_TIMEOUT,
+    on_unauthorized=lambda stale_token: token_manager.refresh(stale_token=stale_token),
+    rate_limiter=graph_rate_limiter,
+    throttle_retries=GRAPH_THROTTLE_RETRIES,
+    max_retry_after=GRAPH_MAX_RETRY_AFTER,
+    observer=observe_graph_call
+)
+# Blocking client for health probes; uploads go through async_graph on graph_loop
+graph = GraphClient(token_manager.get_token, **graph_client_options)
+async_graph = AsyncGraphClient(token_manager.get_token, **graph_client_options)
+graph_loop = GraphEventLoop()
+trace_exporter = tracing.SpanExporter(TRACE_FILE, TRACE_EXPORT) if TRACE_EXPORT else None
+leader = LeaderLock(LEADER_LOCK_FILE)
 
 
 def ensure_local_storage():
@@ -80,12 +329,15 @@ def ensure_local_storage():
         os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
         return LOCAL_STORAGE_DIR
     except Exception as e:
-        print(f"Error creating local storage directory: {e}")
+        local_log.error("Could not create local storage directory %s: %s", LOCAL_STORAGE_DIR, e)
         return None
 
 
 def save_file_locally(volunteer_id, filename, file_data):
-    """Save file to local storage as fallback when OneDrive is unavailable"""
+    """Save file to local storage as fallback when OneDrive is unavailable
+
+    file_data can be str, bytes or a binary file object (spooled upload).
+    """
     try:
         # Create volunteer folder
         volunteer_dir = os.path.join(LOCAL_STORAGE_DIR, f"V{volunteer_id}")
@@ -97,76 +349,131 @@ def save_file_locally(volunteer_id, filename, file_data):
         if isinstance(file_data, str):
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(file_data)
+        elif hasattr(file_data, 'read'):
+            # Spooled upload - copy in bounded pieces
+            file_data.seek(0)
+            with open(file_path, 'wb') as f:
+                shutil.copyfileobj(file_data, f, STREAM_BUFFER_SIZE)
         else:
             with open(file_path, 'wb') as f:
                 f.write(file_data)
         
-        print(f"[LOCAL] File saved locally: {file_path}")
+        local_log.info("File saved locally: %s", file_path)
         return True
-    except Exception as e:
-        print(f"[LOCAL] Error saving file locally: {e}")
+    except Exception:
+        local_log.exception("Could not save V%s/%s locally", volunteer_id, filename)
         return False
 
 
-def load_tokens():
-    """Load tokens from file"""
-    global tokens_data, access_token
+def spool_request_body(source, max_bytes=UPLOAD_MAX_BYTES):
+    """
+    Copy a readable request stream to a spool file in bounded pieces,
+    hashing each piece on the way through.
+    Returns (spool_path, size, hashes) where hashes has "sha1" (hex) and
+    "quickXorHash" (base64, as Graph reports it). The caller owns the spool file.
+    Raises RequestEntityTooLarge once more than max_bytes arrived - a body
+    without Content-Length is not checked before it is read.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}.part")
+    size = 0
+    sha1 = hashlib.sha1()
+    quick_xor = QuickXorHash()
     
-    if not os.path.exists(TOKEN_CACHE_FILE):
-        return False
+    try:
+        with tracing.span("spool") as spool_span, open(spool_path, "wb") as f:
+            while True:
+                piece = source.read(STREAM_BUFFER_SIZE)
+                if not piece:
+                    break
+                size += len(piece)
+                if size > max_bytes:
+                    raise RequestEntityTooLarge(f"Request body larger than {max_bytes} bytes")
+                f.write(piece)
+                sha1.update(piece)
+                quick_xor.update(piece)
+            spool_span.set(bytes=size)
+    except Exception:
+        remove_spool_file(spool_path)
+        raise
     
+    hashes = {"sha1": sha1.hexdigest(), "quickXorHash": quick_xor.b64digest()}
+    return spool_path, size, hashes
+
+
+def read_spool_range(spool_path, start, end):
+    """Bytes start..end-1 of a spool file"""
+    with open(spool_path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def remove_spool_file(spool_path):
+    """Delete a spool file, ignoring errors"""
     try:
-        with open(TOKEN_CACHE_FILE, "r", encoding="utf-8") as f:
-            tokens_data = json.load(f)
-        
-        access_token = tokens_data.get("access_token")
-        if access_token:
-            print("✅ Tokens loaded successfully")
-            return True
-        else:
-            return False
-    except Exception as e:
-        print(f"Error loading tokens: {e}")
-        return False
+        os.remove(spool_path)
+    except OSError:
+        pass
+
+
+def load_tokens():
+    """Load tokens from file"""
+    return token_manager.load()
 
 
 def refresh_access_token():
-    """Refresh access token using refresh token"""
-    global access_token, tokens_data
-    
-    refresh_token = tokens_data.get("refresh_token")
-    if not refresh_token:
-        print("No refresh token available")
-        return False
-    
+    """Refresh access token using refresh token (single-flight, see TokenManager)"""
+    return token_manager.refresh()
+
+
+def probe_onedrive():
+    """Cheap health check used by the circuit breaker's half-open probe"""
     try:
-        app_client = msal.PublicClientApplication(CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT}")
-        
-        result = app_client.acquire_token_by_refresh_token(refresh_token, scopes=["Files.ReadWrite", "offline_access"])
-        
-        if "access_token" not in result:
-            print(f"Failed to refresh token: {result.get('error_description')}")
-            return False
-        
-        access_token = result["access_token"]
-        tokens_data["access_token"] = access_token
-        
-        with open(TOKEN_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(tokens_data, f, indent=2)
-        
-        print("✅ Token refreshed successfully")
-        return True
-    except Exception as e:
-        print(f"Error refreshing token: {e}")
+        response = graph.get(f"{GRAPH_API_ENDPOINT}/me?$select=id", operation="probe",
+                             timeout=(BREAKER_PROBE_TIMEOUT, BREAKER_PROBE_TIMEOUT))
+        return response.status_code == 200
+    except requests.RequestException:
         return False
 
 
-def ensure_folder_exists(parent_path, folder_name):
-    """Create folder if it doesn't exist. Returns folder_id."""
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
+def probe_graph_status():
+    """GET /me for the health prober - connectivity plus token validity"""
+    if not token_manager.has_token():
+        # Nothing to probe until device_auth.py has signed in (the prober keeps checking)
+        return {"connected": False, "status_code": None, "error": "No access token"}
+    response = graph.get(f"{GRAPH_API_ENDPOINT}/me?$select=userPrincipalName", operation="probe",
+                         timeout=(BREAKER_PROBE_TIMEOUT, BREAKER_PROBE_TIMEOUT))
+    connected = response.status_code == 200
+    return {
+        "connected": connected,
+        "status_code": response.status_code,
+        "user": response.json().get("userPrincipalName") if connected else None,
+        "error": None if connected else response.text[:200]
     }
+
+
+health_prober = HealthProber(probe_graph_status, interval_seconds=STATUS_PROBE_INTERVAL)
+
+onedrive_breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    cooldown_seconds=BREAKER_COOLDOWN,
+    probe=probe_onedrive
+)
+
+
+async def ensure_folder_exists_async(parent_path, folder_name, deadline=None):
+    """Create folder if it doesn't exist. Returns folder_id.
+    
+    Results are kept in folder_cache so repeat lookups skip Graph.
+    Graph calls are bounded by deadline (None = default timeouts only).
+    folder_cache is SQLite shared with other workers, so it is read and
+    written on a thread - a write waiting on another process's lock must
+    not hold up the event loop.
+    """
+    folder_path = f"{parent_path}/{folder_name}" if parent_path else folder_name
+    cached_id = await asyncio.to_thread(folder_cache.get, folder_path)
+    if cached_id:
+        return cached_id
     
     try:
         # Build the correct API path
@@ -179,175 +486,1125 @@ def ensure_folder_exists(parent_path, folder_name):
             search_url = f"{GRAPH_API_ENDPOINT}/me/drive/root:/{folder_name}?$select=id,name"
             create_url = f"{GRAPH_API_ENDPOINT}/me/drive/root/children"
         
-        print(f"[FOLDER] Searching for {folder_name} at {parent_path or 'root'}")
-        response = requests.get(search_url, headers=headers)
-        print(f"[FOLDER] Search response: {response.status_code}")
+        folder_log.debug("Searching for %s at %s", folder_name, parent_path or "root")
+        response = await async_graph.get(search_url, deadline=deadline, operation="folder_lookup")
+        folder_log.debug("Search response: %s", response.status_code)
         
         if response.status_code == 200:
             folder_data = response.json()
             folder_id = folder_data.get("id")
-            print(f"[FOLDER] Found existing folder {folder_name}: {folder_id}")
+            folder_log.info("Found existing folder %s: %s", folder_name, folder_id)
+            await asyncio.to_thread(folder_cache.put, folder_path, folder_id)
             return folder_id
         
         # Create folder if not found (404)
         if response.status_code == 404:
-            print(f"[FOLDER] Folder not found, creating {folder_name}")
+            folder_log.info("Folder not found, creating %s", folder_name)
+            # "fail", not "rename": parts of one session upload in parallel (maybe in
+            # several processes) and must all land in the same folder
             payload = {
                 "name": folder_name,
                 "folder": {},
-                "@microsoft.graph.conflictBehavior": "rename"
+                "@microsoft.graph.conflictBehavior": "fail"
             }
             
-            print(f"[FOLDER] Create URL: {create_url}")
-            create_response = requests.post(create_url, headers=headers, json=payload)
-            print(f"[FOLDER] Create response: {create_response.status_code}")
+            folder_log.debug("Create URL: %s", create_url)
+            create_response = await async_graph.post(create_url, json=payload, deadline=deadline,
+                                                     operation="folder_create")
+            folder_log.debug("Create response: %s", create_response.status_code)
             
             if create_response.status_code in [201, 200]:
                 folder_data = create_response.json()
                 folder_id = folder_data.get("id")
-                print(f"[FOLDER] Created folder {folder_name}: {folder_id}")
+                folder_log.info("Created folder %s: %s", folder_name, folder_id)
+                await asyncio.to_thread(folder_cache.put, folder_path, folder_id)
                 return folder_id
+            elif create_response.status_code == 409:
+                # Another upload created it in the meantime - use that one
+                response = await async_graph.get(search_url, deadline=deadline, operation="folder_lookup")
+                if response.status_code == 200:
+                    folder_id = response.json().get("id")
+                    folder_log.info("Folder %s was created concurrently: %s", folder_name, folder_id)
+                    await asyncio.to_thread(folder_cache.put, folder_path, folder_id)
+                    return folder_id
+                folder_log.warning("Lookup of concurrently created %s failed (%s)", folder_name,
+                                   response.status_code)
+                return None
             else:
-                print(f"[FOLDER] Create failed: {create_response.text}")
+                folder_log.warning("Creating %s failed (%s): %s", folder_name, create_response.status_code,
+                                   create_response.text)
                 return None
         
-        print(f"[FOLDER] Search returned unexpected status: {response.status_code}")
-        print(f"[FOLDER] Response: {response.text}")
+        folder_log.warning("Search for %s returned unexpected status %s: %s", folder_path, response.status_code,
+                           response.text)
         return None
     
-    except Exception as e:
-        print(f"FOLDER CREATION ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        folder_log.exception("Folder lookup/creation failed for %s", folder_path)
         return None
 
 
-def upload_file_resumable(volunteer_id, filename, file_data, file_size):
-    """Upload file using Resumable Upload (for large files)"""
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-    
-    try:
-        # Create folder structure
-        main_folder_id = ensure_folder_exists("", "KFUPM_GSR_Project")
+def ensure_folder_exists(parent_path, folder_name, deadline=None):
+    """Blocking ensure_folder_exists_async() for threads outside the Graph event loop"""
+    return graph_loop.run(ensure_folder_exists_async(parent_path, folder_name, deadline))
+
+
+async def resolve_volunteer_folder_async(volunteer_id, deadline=None):
+    """Return the folder_id of /{PROJECT_FOLDER}/V{volunteer_id}, creating it if needed"""
+    with tracing.span("resolve_folder", volunteer_id=volunteer_id):
+        main_folder_id = await ensure_folder_exists_async("", PROJECT_FOLDER, deadline)
         if not main_folder_id:
-            return False
-        
-        volunteer_folder_name = f"V{volunteer_id}"
-        volunteer_folder_path = "KFUPM_GSR_Project"
+            folder_log.warning("Failed to create/find main folder")
+            return None
         
-        volunteer_folder_id = ensure_folder_exists(volunteer_folder_path, volunteer_folder_name)
+        volunteer_folder_id = await ensure_folder_exists_async(PROJECT_FOLDER, f"V{volunteer_id}", deadline)
         if not volunteer_folder_id:
-            return False
+            folder_log.warning("Failed to create/find volunteer folder V%s", volunteer_id)
+            return None
         
-        # Create upload session
-        upload_session_url = f"{GRAPH_API_ENDPOINT}/me/drive/items/{volunteer_folder_id}:/{filename}:/createUploadSession"
-        
-        session_payload = {
-            "item": {
-                "@microsoft.graph.conflictBehavior": "rename",
-                "name": filename
-            }
+        return volunteer_folder_id
+
+
+def resolve_volunteer_folder(volunteer_id, deadline=None):
+    """Blocking resolve_volunteer_folder_async()"""
+    return graph_loop.run(resolve_volunteer_folder_async(volunteer_id, deadline))
+
+
+def is_item_not_found(response):
+    """True if a Graph response means the target item (folder) no longer exists"""
+    if response.status_code == 404:
+        return True
+    try:
+        return response.json().get("error", {}).get("code") == "itemNotFound"
+    except ValueError:
+        return False
+
+
+def invalidate_volunteer_folder(volunteer_id):
+    """Forget cached folder IDs after Graph reports the folder is gone.
+    
+    The project folder may have been removed too, so the whole project
+    subtree is dropped; the next upload re-resolves both levels.
+    """
+    folder_log.info("Cached folder for V%s is stale, invalidating", volunteer_id)
+    folder_cache.invalidate(PROJECT_FOLDER)
+
+
+def warm_folder_cache():
+    """Resolve the project root folder at startup so the first upload skips the lookup"""
+    if token_manager.has_token() and ensure_folder_exists("", PROJECT_FOLDER):
+        folder_log.info("Folder cache warmed for %s", PROJECT_FOLDER)
+
+
+async def create_upload_session_async(volunteer_id, volunteer_folder_id, filename, job_id=None,
+                                      conflict_behavior="rename", deadline=None, live_id=None):
+    """
+    Create a Graph upload session. Returns the uploadUrl or None.
+    With a job_id the session is written to the upload journal, with a
+    live_id to the live upload (None if that is no longer open).
+    conflict_behavior "replace" overwrites an existing item (used to re-send a corrupt upload).
+    """
+    upload_session_url = f"{GRAPH_API_ENDPOINT}/me/drive/items/{volunteer_folder_id}:/{filename}:/createUploadSession"
+    
+    session_payload = {
+        "item": {
+            "@microsoft.graph.conflictBehavior": conflict_behavior,
+            "name": filename
         }
+    }
+    
+    session_response = await async_graph.post(upload_session_url, json=session_payload, deadline=deadline,
+                                              operation="create_session")
+    
+    if session_response.status_code not in [200, 201]:
+        resumable_log.warning("Create session for %s failed: %s", filename, session_response.status_code)
+        if is_item_not_found(session_response):
+            await asyncio.to_thread(invalidate_volunteer_folder, volunteer_id)
+        return None
+    
+    session = session_response.json()
+    upload_url = session.get("uploadUrl")
+    if job_id and upload_url:
+        await asyncio.to_thread(upload_journal.set_session, job_id, upload_url,
+                                parse_expiry(session.get("expirationDateTime")))
+    if live_id and upload_url and not await asyncio.to_thread(
+            live_uploads.set_upload_session, live_id, upload_url, parse_expiry(session.get("expirationDateTime"))):
+        await cancel_upload_session_async(upload_url)  # finished or abandoned meanwhile
+        return None
+    return upload_url
+
+
+async def resume_journaled_session_async(job_id, deadline=None):
+    """
+    Look up a journaled upload session for job_id that is still open.
+    Returns (upload_url, offset) or (None, 0).
+    """
+    entry = await asyncio.to_thread(upload_journal.get, job_id)
+    if not entry or not entry.get("upload_url"):
+        return None, 0
+    
+    expires_at = entry.get("expires_at")
+    if expires_at and expires_at <= time.time():
+        journal_log.info("Session for job %s expired, starting over", job_id)
+        return None, 0
+    
+    session_state, server_offset = await query_upload_session_async(entry["upload_url"], deadline)
+    if session_state != "active":
+        return None, 0
+    
+    journal_log.info("Resuming job %s at byte %s (journal confirmed %s)", job_id, server_offset,
+                     entry["confirmed_offset"])
+    return entry["upload_url"], server_offset
+
+
+async def query_upload_session_async(upload_url, deadline=None):
+    """
+    Ask Graph where an upload session should continue.
+    
+    Returns (state, offset):
+    - ("active", offset) - resume from the first byte of nextExpectedRanges
+    - ("expired", None) - session is gone, a new one is needed
+    - ("unknown", None) - status could not be read (network error / 5xx)
+    """
+    try:
+        response = await async_graph.get(upload_url, auth=False, deadline=deadline, operation="session_query")
+    except requests.RequestException as e:
+        resumable_log.warning("Session status query failed: %s", e)
+        return "unknown", None
+    
+    if response.status_code in [404, 410]:
+        return "expired", None
+    if response.status_code != 200:
+        return "unknown", None
+    
+    ranges = response.json().get("nextExpectedRanges") or []
+    if not ranges:
+        return "unknown", None
+    return "active", int(ranges[0].split("-")[0])
+
+
+async def remote_item_async(volunteer_folder_id, filename, deadline=None):
+    """driveItem (id, name, size, file hashes) of an existing file in the volunteer folder, or None"""
+    try:
+        response = await async_graph.get(f"{GRAPH_API_ENDPOINT}/me/drive/items/{volunteer_folder_id}:/{filename}"
+                                         f"?$select=id,name,size,file", deadline=deadline, operation="item_lookup")
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+def remote_item(volunteer_folder_id, filename, deadline=None):
+    """Blocking remote_item_async()"""
+    return graph_loop.run(remote_item_async(volunteer_folder_id, filename, deadline))
+
+
+async def cancel_upload_session_async(upload_url):
+    """Best-effort DELETE of an abandoned upload session (short timeout)"""
+    try:
+        await async_graph.delete(upload_url, auth=False, timeout=(SESSION_CANCEL_TIMEOUT, SESSION_CANCEL_TIMEOUT),
+                                 operation="session_cancel")
+    except requests.RequestException:
+        pass
+
+
+def discard_upload_session(upload_session):
+    """Cancel, in the background, an upload session nobody will finish ({"upload_url", ...} or None)"""
+    if upload_session:
+        graph_loop.submit(cancel_upload_session_async(upload_session["upload_url"]))
+
+
+def check_integrity(drive_item, local_hash):
+    """
+    Compare the quickXorHash of the bytes we sent with the one Graph
+    reports for the stored file.
+    Returns "verified", "corrupt" or "unverified" (a hash is missing -
+    e.g. Graph has not computed it yet).
+    """
+    remote_hash = ((drive_item or {}).get("file") or {}).get("hashes", {}).get("quickXorHash")
+    if not local_hash or not remote_hash:
+        return "unverified"
+    return "verified" if remote_hash == local_hash else "corrupt"
+
+
+def upload_result(drive_item, local_hash, filename):
+    """Result of a finished OneDrive upload: {"item": driveItem, "integrity": ...}"""
+    integrity = check_integrity(drive_item, local_hash)
+    if integrity == "corrupt":
+        remote_hash = drive_item["file"]["hashes"]["quickXorHash"]
+        integrity_log.warning("%s is corrupt on OneDrive: sent %s, stored %s", filename, local_hash, remote_hash)
+    else:
+        integrity_log.info("%s: %s", filename, integrity)
+    return {"item": drive_item or {}, "integrity": integrity}
+
+
+async def upload_file_resumable_async(volunteer_id, filename, file_data, file_size, progress=None, job_id=None,
+                                      expected_hash=None, conflict_behavior="rename", deadline=None):
+    """
+    Upload file using Resumable Upload (for large files)
+    
+    Runs on the Graph event loop (graph_async.py) next to other uploads;
+    upload_file_resumable() is the blocking wrapper for worker threads.
+    
+    file_data can be bytes/str or a binary file object. A spool file is
+    memory-mapped and each chunk goes to the HTTP layer as a memoryview
+    slice of the mapping (no per-chunk copy); pages of acknowledged chunks
+    are released, so resident memory stays near one chunk (chunk_source.py).
+    progress(bytes_sent) is called after every accepted chunk.
+    
+    Returns upload_result() ({"item", "integrity"}) on success, None on
+    failure. quickXorHash is computed from the chunks as they are sent
+    (bytes re-sent after a rewind are not hashed again) and compared with
+    the hash in the final driveItem. When the upload resumes a journaled
+    session the skipped prefix was never read, so expected_hash (computed
+    when the request was spooled) is used instead.
+    
+    A failed chunk is retried with exponential backoff. Before each retry
+    the session's nextExpectedRanges is read and the upload continues from
+    the server's offset; a new session is only created once the old one
+    has expired.
+    
+    Chunk size adapts to measured throughput (AdaptiveChunkSizer) between
+    CHUNK_SIZE and CHUNK_SIZE_MAX.
+    
+    With a job_id the session URL and acknowledged offset are kept in the
+    upload journal, and a journaled session that is still open is resumed
+    instead of creating a new one.
+    
+    Every Graph call and retry wait is bounded by deadline; once it is spent
+    the upload gives up (returns None) so the caller can fall back.
+    """
+    global preferred_chunk_size
+    deadline = deadline or Deadline(None)
+    source = None
+    
+    try:
+        # Create folder structure
+        volunteer_folder_id = await resolve_volunteer_folder_async(volunteer_id, deadline)
+        if not volunteer_folder_id:
+            return None
         
-        session_response = requests.post(upload_session_url, headers=headers, json=session_payload)
-        
-        if session_response.status_code not in [200, 201]:
-            return False
-        
-        upload_url = session_response.json().get("uploadUrl")
+        upload_url, offset = await resume_journaled_session_async(job_id, deadline) if job_id else (None, 0)
+        if not upload_url:
+            upload_url = await create_upload_session_async(volunteer_id, volunteer_folder_id, filename, job_id,
+                                                           conflict_behavior, deadline)
+            if not upload_url:
+                return None
         
         # Upload file in chunks
-        bytes_data = file_data.encode() if isinstance(file_data, str) else file_data
-        total_size = len(bytes_data) if isinstance(bytes_data, bytes) else file_size
+        source = ChunkSource(file_data)
+        total_size = file_size
+        failures = 0
+        hasher = QuickXorHash()
+        hashed_to = 0 if offset == 0 else None  # None: prefix not seen, hash unusable
         
-        for chunk_start in range(0, total_size, CHUNK_SIZE):
-            chunk_end = min(chunk_start + CHUNK_SIZE, total_size)
-            chunk = bytes_data[chunk_start:chunk_end]
+        def local_hash():
+            return hasher.b64digest() if hashed_to == total_size else expected_hash
+        sizer = AdaptiveChunkSizer(
+            min_size=CHUNK_SIZE,
+            max_size=CHUNK_SIZE_MAX,
+            initial_size=preferred_chunk_size,
+            target_seconds=CHUNK_TARGET_SECONDS
+        )
+        
+        while offset < total_size:
+            if deadline.expired():
+                resumable_log.warning("Deadline of %.0fs reached for %s at byte %s", deadline.budget, filename, offset)
+                await cancel_upload_session_async(upload_url)
+                return None
+            
+            chunk_end = min(offset + sizer.size, total_size)
+            if source.zero_copy:
+                chunk = source.chunk(offset, chunk_end)
+            else:
+                # Plain readers (e.g. the reconciler's throttled one) may block - keep them off the loop
+                chunk = await asyncio.to_thread(source.chunk, offset, chunk_end)
+            if hashed_to is not None and offset > hashed_to:
+                hashed_to = None  # server skipped bytes this process never read
+            elif hashed_to is not None and hashed_to < chunk_end:
+                # Only bytes not hashed yet - a rewound chunk is not counted twice
+                hasher.update(memoryview(chunk)[hashed_to - offset:])
+                hashed_to = chunk_end
             
             chunk_headers = {
                 "Content-Length": str(len(chunk)),
-                "Content-Range": f"bytes {chunk_start}-{chunk_end - 1}/{total_size}"
+                "Content-Range": f"bytes {offset}-{chunk_end - 1}/{total_size}"
             }
             
-            upload_response = requests.put(upload_url, headers=chunk_headers, data=chunk)
+            chunk_started = time.monotonic()
+            with tracing.span("chunk", offset=offset, bytes=len(chunk)) as chunk_span:
+                try:
+                    # uploadUrl is pre-authenticated - no Authorization header
+                    upload_response = await async_graph.put(upload_url, headers=chunk_headers, data=chunk,
+                                                            auth=False, deadline=deadline, operation="chunk_put")
+                    status_code = upload_response.status_code
+                except requests.RequestException as e:
+                    resumable_log.warning("Chunk %s-%s network error: %s", offset, chunk_end - 1, e)
+                    status_code = None
+                chunk_span.set(status=status_code)
+            chunk_seconds = time.monotonic() - chunk_started
+            
+            if status_code in [200, 201, 202]:
+                GRAPH_BYTES_SENT.inc(len(chunk))
+                CHUNK_SIZES.observe(len(chunk))
+                source.release(offset, chunk_end)
+            
+            if status_code in [200, 201]:
+                # Last chunk accepted - file is complete
+                sizer.record_success(len(chunk), chunk_seconds)
+                preferred_chunk_size = sizer.size
+                resumable_log.info("%s complete", filename, extra={"chunking": sizer.stats()})
+                if job_id:
+                    # The session is closed - a re-send must not try to resume it
+                    await asyncio.to_thread(upload_journal.set_session, job_id, None, None)
+                if progress:
+                    progress(total_size)
+                return upload_result(upload_response.json(), local_hash(), filename)
+            
+            if status_code == 202:
+                previous_size = sizer.size
+                sizer.record_success(len(chunk), chunk_seconds)
+                if sizer.size != previous_size:
+                    resumable_log.debug("Chunk size %s -> %s (%.2f MB/s)", previous_size, sizer.size,
+                                        len(chunk) / chunk_seconds / 1e6)
+                offset = chunk_end
+                failures = 0
+                if job_id:
+                    await asyncio.to_thread(upload_journal.set_offset, job_id, offset)
+                if progress:
+                    progress(offset)
+                continue
+            
+            # Chunk failed - shrink the chunk, back off, then ask the server where to continue
+            sizer.record_failure()
+            failures += 1
+            if failures > CHUNK_MAX_RETRIES:
+                resumable_log.error("Giving up on %s after %s retries at byte %s", filename, CHUNK_MAX_RETRIES, offset)
+                await cancel_upload_session_async(upload_url)
+                return None
+            
+            CHUNK_RETRIES.inc()
+            delay = CHUNK_RETRY_BACKOFF * (2 ** (failures - 1))
+            resumable_log.warning("Chunk at byte %s failed (%s), retry %s/%s in %.1fs", offset, status_code,
+                                  failures, CHUNK_MAX_RETRIES, delay)
+            with tracing.span("retry_backoff", delay=delay):
+                await deadline.sleep_async(delay)
+            if deadline.expired():
+                continue
+            
+            session_state, server_offset = (("expired", None) if status_code == 404
+                                            else await query_upload_session_async(upload_url, deadline))
             
-            if upload_response.status_code not in [200, 201, 202]:
-                return False
+            if session_state == "active":
+                offset = server_offset
+            elif session_state == "expired":
+                # The final chunk may have landed before the connection dropped
+                item = (await remote_item_async(volunteer_folder_id, filename, deadline)
+                        if chunk_end == total_size else None)
+                if item and item.get("size") == total_size:
+                    resumable_log.info("Session closed but %s is complete on OneDrive", filename)
+                    if progress:
+                        progress(total_size)
+                    return upload_result(item, local_hash(), filename)
+                
+                resumable_log.info("Upload session expired, starting a new one for %s", filename)
+                upload_url = await create_upload_session_async(volunteer_id, volunteer_folder_id, filename, job_id,
+                                                               conflict_behavior, deadline)
+                if not upload_url:
+                    return None
+                offset = 0
+            # "unknown": retry the same chunk
         
-        return True
+        # Zero-byte file: nothing to send
+        return upload_result(None, local_hash(), filename)
     
-    except Exception as e:
-        print(f"RESUMABLE UPLOAD ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
+    except Exception:
+        resumable_log.exception("Resumable upload of %s failed", filename)
+        return None
+    
+    finally:
+        if source:
+            source.close()
 
 
-def upload_file_simple(volunteer_id, filename, file_data):
-    """Upload simple file (for small files like CSV)"""
+def upload_file_resumable(volunteer_id, filename, file_data, file_size, progress=None, job_id=None,
+                          expected_hash=None, conflict_behavior="rename", deadline=None):
+    """Blocking upload_file_resumable_async() - the upload itself runs on the Graph event loop"""
+    return graph_loop.run(upload_file_resumable_async(volunteer_id, filename, file_data, file_size, progress,
+                                                      job_id, expected_hash, conflict_behavior, deadline))
+
+
+async def upload_file_simple_async(volunteer_id, filename, file_data, progress=None, deadline=None):
+    """Upload simple file (for small files like CSV) on the Graph event loop
+    
+    file_data can be bytes/str or a binary file object.
+    progress(bytes_sent) is called once the file is accepted.
+    Returns upload_result() on success (quickXorHash of the sent bytes
+    checked against the returned driveItem), None on failure.
+    A simple PUT replaces an existing file of the same name.
+    """
     headers = {
-        "Authorization": f"Bearer {access_token}",
         "Content-Type": "text/csv" if filename.endswith(".csv") else "application/octet-stream"
     }
     
     try:
-        print(f"[UPLOAD] Starting simple upload: {filename}")
+        upload_log.info("Starting simple upload: %s", filename)
         # Create folder structure
-        main_folder_id = ensure_folder_exists("", "KFUPM_GSR_Project")
-        if not main_folder_id:
-            print(f"[UPLOAD] Failed to create/find main folder")
-            return False
-        
-        print(f"[UPLOAD] Main folder ID: {main_folder_id}")
-        volunteer_folder_name = f"V{volunteer_id}"
-        volunteer_folder_path = "KFUPM_GSR_Project"
-        
-        volunteer_folder_id = ensure_folder_exists(volunteer_folder_path, volunteer_folder_name)
+        volunteer_folder_id = await resolve_volunteer_folder_async(volunteer_id, deadline)
         if not volunteer_folder_id:
-            print(f"[UPLOAD] Failed to create/find volunteer folder")
-            return False
+            return None
         
-        print(f"[UPLOAD] Volunteer folder ID: {volunteer_folder_id}")
+        upload_log.debug("Volunteer folder ID: %s", volunteer_folder_id)
         
         # Upload file
         upload_url = f"{GRAPH_API_ENDPOINT}/me/drive/items/{volunteer_folder_id}:/{filename}:/content"
-        print(f"[UPLOAD] Upload URL: {upload_url}")
+        upload_log.debug("Upload URL: %s", upload_url)
         
-        if isinstance(file_data, str):
+        if hasattr(file_data, "read"):
+            file_data.seek(0)
+            file_bytes = await asyncio.to_thread(file_data.read)
+        elif isinstance(file_data, str):
             file_bytes = file_data.encode()
         else:
             file_bytes = file_data
         
-        print(f"[UPLOAD] File size: {len(file_bytes)} bytes")
-        upload_response = requests.put(upload_url, headers=headers, data=file_bytes)
-        print(f"[UPLOAD] Upload response status: {upload_response.status_code}")
+        upload_log.debug("File size: %s bytes", len(file_bytes))
+        upload_response = await async_graph.put(upload_url, headers=headers, data=file_bytes, deadline=deadline,
+                                                operation="simple_put")
+        upload_log.debug("Upload response status: %s", upload_response.status_code)
         
         if upload_response.status_code in [200, 201]:
-            print(f"[UPLOAD] Upload successful for {filename}")
-            return True
+            upload_log.info("Upload successful for %s", filename)
+            GRAPH_BYTES_SENT.inc(len(file_bytes))
+            if progress:
+                progress(len(file_bytes))
+            # file_bytes is already in memory - hashing it is not a second read of the file
+            return upload_result(upload_response.json(), QuickXorHash(file_bytes).b64digest(), filename)
         
-        print(f"[UPLOAD] Upload failed with status {upload_response.status_code}: {upload_response.text}")
-        return False
+        upload_log.warning("Upload of %s failed with status %s: %s", filename, upload_response.status_code,
+                           upload_response.text)
+        if is_item_not_found(upload_response):
+            await asyncio.to_thread(invalidate_volunteer_folder, volunteer_id)
+        return None
+    
+    except Exception:
+        upload_log.exception("Simple upload of %s failed", filename)
+        return None
+
+
+def upload_file_simple(volunteer_id, filename, file_data, progress=None, deadline=None):
+    """Blocking upload_file_simple_async()"""
+    return graph_loop.run(upload_file_simple_async(volunteer_id, filename, file_data, progress, deadline))
+
+
+def uses_resumable_upload(file_type, file_size):
+    """Videos and anything over SIMPLE_UPLOAD_LIMIT go through an upload session"""
+    return file_type == "video" or file_size > SIMPLE_UPLOAD_LIMIT
+
+
+async def upload_to_onedrive_async(volunteer_id, filename, file_data, file_size, file_type, progress=None,
+                                   job_id=None, expected_hash=None, deadline=None):
+    """
+    Pick simple or resumable upload based on file type and size.
+    Returns upload_result() ({"item", "integrity"}) or None on failure.
+    
+    If the stored file's quickXorHash differs from what was sent, the file
+    is sent once more, replacing the corrupt item.
+    """
+    async def attempt(target_name=filename, conflict_behavior="rename"):
+        if uses_resumable_upload(file_type, file_size):
+            return await upload_file_resumable_async(volunteer_id, target_name, file_data, file_size, progress,
+                                                     job_id, expected_hash, conflict_behavior, deadline)
+        return await upload_file_simple_async(volunteer_id, target_name, file_data, progress, deadline)
     
+    invalidations_before = folder_cache.invalidations
+    result = await attempt()
+    if not result and folder_cache.invalidations != invalidations_before and not (deadline and deadline.expired()):
+        # A cached folder ID was stale - retry once against freshly resolved folders
+        result = await attempt()
+    
+    if result and result["integrity"] == "corrupt" and not (deadline and deadline.expired()):
+        # conflictBehavior "rename" may have stored it under another name - replace that item
+        stored_name = result["item"].get("name") or filename
+        integrity_log.warning("Re-sending %s to replace %s", filename, stored_name)
+        result = await attempt(stored_name, "replace") or result
+    return result
+
+
+def upload_to_onedrive(volunteer_id, filename, file_data, file_size, file_type, progress=None, job_id=None,
+                       expected_hash=None, deadline=None):
+    """Blocking upload_to_onedrive_async()"""
+    return graph_loop.run(upload_to_onedrive_async(volunteer_id, filename, file_data, file_size, file_type,
+                                                   progress, job_id, expected_hash, deadline))
+
+
+async def upload_with_fallback_async(volunteer_id, filename, file_data, file_size, file_type, progress=None,
+                                     job_id=None, expected_hash=None, deadline=None):
+    """
+    Upload to OneDrive, falling back to local storage.
+    Returns (response_body, http_status). The body's "integrity" is
+    "verified", "unverified" or "corrupt" (see check_integrity); a file
+    still corrupt after one re-send is kept locally instead.
+    
+    The OneDrive attempt gets a time budget (deadline - for queued jobs
+    the one started when the request was admitted; default UPLOAD_DEADLINE
+    seconds from now); when it runs out the file goes to local storage
+    instead of waiting on Graph.
+    
+    Token expiry is handled before/inside each Graph call by token_manager
+    (proactive refresh, one replay on 401) and failed chunks are resumed,
+    so there is no second full upload attempt here. While onedrive_breaker
+    is open the OneDrive attempt is skipped entirely.
+    """
+    # Try OneDrive upload first if we have a token and the circuit allows it
+    onedrive_success = False
+    integrity = None
+    fallback_reason = "no_token"
+    if deadline is None:
+        deadline = Deadline(UPLOAD_DEADLINE)
+    if deadline.expired():
+        # Spent waiting in the queue - says nothing about OneDrive, so the breaker is left alone
+        fallback_reason = "deadline"
+    elif token_manager.has_token():
+        # A half-open breaker runs its blocking GET /me probe here - not on the event loop
+        if not await asyncio.to_thread(onedrive_breaker.allow_request):
+            upload_log.warning("OneDrive circuit open, skipping straight to local storage")
+            fallback_reason = "circuit_open"
+        else:
+            upload_log.debug("Attempting OneDrive upload of %s", filename)
+            result = None
+            try:
+                with tracing.span("onedrive_upload", filename=filename, bytes=file_size):
+                    result = await upload_to_onedrive_async(volunteer_id, filename, file_data, file_size, file_type,
+                                                            progress, job_id, expected_hash, deadline)
+            except Exception:
+                upload_log.exception("OneDrive upload of %s raised", filename)
+            
+            if result:
+                # OneDrive answered - a corrupt copy is not an availability failure
+                onedrive_breaker.record_success()
+                integrity = result["integrity"]
+                onedrive_success = integrity != "corrupt"
+                fallback_reason = "corrupt"
+            else:
+                onedrive_breaker.record_failure()
+                fallback_reason = "deadline" if deadline.expired() else "onedrive_failed"
+    
+    # If OneDrive still failed, fall back to local storage
+    if not onedrive_success:
+        upload_log.warning("OneDrive unavailable (%s), falling back to local storage", fallback_reason,
+                           extra={"file": filename, "volunteer_id": volunteer_id})
+        FALLBACKS.inc(reason=fallback_reason)
+        with tracing.span("save_local", reason=fallback_reason):
+            ensure_local_storage()
+            # A copy of up to the whole file - not on the event loop
+            local_success = await asyncio.to_thread(save_file_locally, volunteer_id, filename, file_data)
+        
+        if local_success:
+            UPLOADS_FINISHED.inc(location="local", integrity=str(integrity))
+            UPLOAD_BYTES.inc(file_size, location="local")
+            return {
+                "success": True,
+                "message": f"File {filename} saved locally (OneDrive unavailable)",
+                "location": "local",
+                "integrity": integrity,
+                "file": filename,
+                "volunteer_id": volunteer_id
+            }, 200
+        else:
+            return {
+                "success": False,
+                "error": "Upload to OneDrive and local storage both failed"
+            }, 500
+    
+    # OneDrive upload succeeded
+    UPLOADS_FINISHED.inc(location="onedrive", integrity=integrity)
+    UPLOAD_BYTES.inc(file_size, location="onedrive")
+    return {
+        "success": True,
+        "message": f"File {filename} uploaded to OneDrive successfully",
+        "location": "onedrive",
+        "integrity": integrity,
+        "item_id": result["item"].get("id"),
+        "file": filename,
+        "volunteer_id": volunteer_id
+    }, 200
+
+
+def upload_with_fallback(volunteer_id, filename, file_data, file_size, file_type, progress=None, job_id=None,
+                         expected_hash=None, deadline=None):
+    """Blocking upload_with_fallback_async() (inline uploads with UPLOAD_ASYNC off)"""
+    return graph_loop.run(upload_with_fallback_async(volunteer_id, filename, file_data, file_size, file_type,
+                                                     progress, job_id, expected_hash, deadline))
+
+
+def remember_completed_upload(volunteer_id, filename, hashes, size, body, idempotency_key=None, job_id=None):
+    """Index an upload that reached OneDrive so a repeat is not sent again"""
+    if not hashes or not body.get("success") or body.get("location") != "onedrive":
+        return
+    try:
+        upload_index.record(volunteer_id, filename, hashes["sha1"], hashes.get("quickXorHash"), size,
+                            body, idempotency_key=idempotency_key, job_id=job_id)
     except Exception as e:
-        print(f"SIMPLE UPLOAD ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        dedup_log.warning("Could not index %s/%s: %s", volunteer_id, filename, e)
+
+
+def find_earlier_upload(volunteer_id, filename, hashes, idempotency_key=None):
+    """
+    Look for an earlier upload this request repeats - same Idempotency-Key,
+    or same volunteer, filename and content. Returns a Flask response for
+    the earlier result, or None if the request is new.
+    """
+    if idempotency_key:
+        job = upload_jobs.find_by_key(idempotency_key)
+        if job and job.state == JOB_DONE and job.location == "onedrive" and not uploaded_item_exists(
+                job.result or {}, job.volunteer_id, job.filename, job.size, job.quick_xor_hash):
+            upload_index.remove(job.volunteer_id, job.filename, job.sha1)
+            job = None
+        # In flight in another worker process?
+        pending = None if job else upload_journal.find_by_key(idempotency_key)
+        entry = None if job or pending else upload_index.find_by_key(idempotency_key)
+        if entry and not indexed_upload_exists(entry):
+            entry = None
+        earlier_sha1 = job.sha1 if job else (pending or entry or {}).get("sha1")
+        if earlier_sha1 and earlier_sha1 != hashes["sha1"]:
+            return jsonify({
+                "success": False,
+                "error": "Idempotency-Key was already used for a different file"
+            }), 422
+        if job and job.state != JOB_FAILED:
+            return duplicate_job_response(job)
+        if pending:
+            return duplicate_pending_response(pending)
+        if entry:
+            return duplicate_index_response(entry)
+    
+    # Same content still queued/uploading under another (or no) key
+    job = upload_jobs.find_active(lambda j: j.volunteer_id == volunteer_id and
+                                  j.filename == filename and j.sha1 == hashes["sha1"])
+    if job:
+        return duplicate_job_response(job)
+    pending = upload_journal.find_active(volunteer_id, filename, hashes["sha1"])
+    if pending:
+        return duplicate_pending_response(pending)
+    
+    entry = upload_index.find(volunteer_id, filename, hashes["sha1"])
+    if entry and indexed_upload_exists(entry):
+        return duplicate_index_response(entry)
+    return None
+
+
+async def uploaded_item_exists_async(result, volunteer_id, filename, size, quick_xor_hash, deadline=None):
+    """
+    Check an earlier upload's result against OneDrive before answering a
+    repeat from it - the file may have been deleted or replaced since.
+    False if the item is gone or holds other content; True if it is there
+    or Graph cannot tell right now (an unreachable OneDrive is no reason
+    to send a second copy).
+    """
+    item_id = result.get("item_id")
+    if item_id:
+        url = f"{GRAPH_API_ENDPOINT}/me/drive/items/{item_id}?$select=id,size,file"
+    else:
+        # Uploaded before results carried the item ID - look it up by path
+        url = f"{GRAPH_API_ENDPOINT}/me/drive/root:/{PROJECT_FOLDER}/V{volunteer_id}/{filename}?$select=id,size,file"
+    try:
+        response = await async_graph.get(url, deadline=deadline, operation="dedup_verify")
+    except requests.RequestException as e:
+        dedup_log.warning("Could not check V%s/%s on OneDrive: %s", volunteer_id, filename, e)
+        return True
+    
+    if response.status_code == 200:
+        item = response.json()
+        remote_hash = (item.get("file") or {}).get("hashes", {}).get("quickXorHash")
+        if item.get("size") == size and (not remote_hash or not quick_xor_hash or remote_hash == quick_xor_hash):
+            return True
+        reason = "was replaced"
+    elif is_item_not_found(response):
+        reason = "is gone"
+    else:
+        return True
+    dedup_log.info("Earlier upload of V%s/%s %s on OneDrive, uploading it again", volunteer_id, filename, reason)
+    return False
+
+
+def uploaded_item_exists(result, volunteer_id, filename, size, quick_xor_hash):
+    """
+    Blocking uploaded_item_exists_async(), bounded by BREAKER_PROBE_TIMEOUT.
+    While the circuit breaker is not closed OneDrive is not asked at all -
+    the earlier result is trusted, as it would be if the check failed.
+    """
+    if onedrive_breaker.state != STATE_CLOSED:
+        return True
+    return graph_loop.run(uploaded_item_exists_async(result, volunteer_id, filename, size, quick_xor_hash,
+                                                     Deadline(BREAKER_PROBE_TIMEOUT)))
+
+
+def indexed_upload_exists(entry):
+    """uploaded_item_exists() for an upload_index entry; a stale entry is removed"""
+    if uploaded_item_exists(entry["result"], entry["volunteer_id"], entry["filename"], entry["size"],
+                            entry["quick_xor_hash"]):
+        return True
+    upload_index.remove(entry["volunteer_id"], entry["filename"], entry["sha1"])
+    return False
+
+
+def duplicate_job_response(job):
+    dedup_log.info("%s/%s repeats job %s (%s)", job.volunteer_id, job.filename, job.id, job.state)
+    if job.state == JOB_DONE:
+        return jsonify(dict(job.result or {}, duplicate=True, job_id=job.id)), 200
+    return jsonify({
+        "success": True,
+        "message": f"File {job.filename} is already being uploaded",
+        "duplicate": True,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+        "state": job.state,
+        "file": job.filename,
+        "volunteer_id": job.volunteer_id
+    }), 202
+
+
+def duplicate_pending_response(status):
+    """Repeat of a job in flight in another worker process (status from the journal)"""
+    dedup_log.info("%s/%s repeats job %s of another worker (%s)", status["volunteer_id"], status["filename"],
+                   status["job_id"], status["state"])
+    return jsonify({
+        "success": True,
+        "message": f"File {status['filename']} is already being uploaded",
+        "duplicate": True,
+        "job_id": status["job_id"],
+        "status_url": f"/api/jobs/{status['job_id']}",
+        "state": status["state"],
+        "file": status["filename"],
+        "volunteer_id": status["volunteer_id"]
+    }), 202
+
+
+def duplicate_index_response(entry):
+    upload_index.hits += 1
+    dedup_log.info("V%s/%s already on OneDrive, not re-sending", entry["volunteer_id"], entry["filename"])
+    return jsonify(dict(entry["result"], duplicate=True, job_id=entry["job_id"])), 200
+
+
+def mark_job_uploading(job):
+    """Journal (and the job's session part): the job is uploading"""
+    upload_journal.set_state(job.id, JOB_UPLOADING)
+    upload_sessions.set_part_state(job.idempotency_key, job.id, PART_UPLOADING)
+
+
+async def process_upload_job_async(job):
+    """Handler for upload_jobs, run on the Graph event loop - uploads the job's spool file
+    
+    Continues the trace of the request that queued the job (journal-resumed
+    jobs start a new one, keyed by job ID, when traces are exported).
+    """
+    if job.trace is None and trace_exporter:
+        job.trace = tracing.Trace(job.id, trace_exporter)
+    with tracing.bind_request_id(job.request_id or job.id), tracing.activate(job.trace):
+        jobs_log.info("Starting job %s: %s/%s (%s bytes)", job.id, job.volunteer_id, job.filename, job.size)
+        tracing.add_span("queue_wait", time.time() - job.created_at, job_id=job.id)
+        await asyncio.to_thread(mark_job_uploading, job)
+        with tracing.span("job", job_id=job.id, filename=job.filename, bytes=job.size), \
+                open(job.spool_path, "rb") as spooled:
+            body, status_code = await upload_with_fallback_async(job.volunteer_id, job.filename, spooled, job.size,
+                                                                 job.file_type, job.set_progress, job.id,
+                                                                 job.quick_xor_hash, job.deadline)
+        if job.sha1:
+            hashes = {"sha1": job.sha1, "quickXorHash": job.quick_xor_hash}
+            await asyncio.to_thread(remember_completed_upload, job.volunteer_id, job.filename, hashes,
+                                    job.size, body, job.idempotency_key, job.id)
+        return body, status_code
+
+
+def finish_journaled_job(job):
+    """
+    Finished one way or another (OneDrive, local or failed) - nothing to
+    resume. The final state stays in the journal for /api/jobs/<id> in
+    other worker processes. A session part also reports to its session.
+    """
+    status = job.to_dict()
+    upload_journal.finish(job.id, status)
+    finish_session_part(job.idempotency_key, job.id, status)
+
+
+def finish_session_part(idempotency_key, job_id, status):
+    """Record a session part's outcome; the part that finishes its session schedules the completion"""
+    session = upload_sessions.finish_part(idempotency_key, job_id, status)
+    if session:
+        graph_loop.submit(complete_session_async(session))
+
+
+async def complete_session_async(session):
+    """
+    All parts of the session have finished. If every one reached OneDrive
+    intact, write the manifest (session-<id>.json) next to them - the
+    marker that the session is complete - and mark it complete; otherwise
+    it is incomplete (parts saved locally are pushed later by the reconciler).
+    """
+    session_id = session["session_id"]
+    failed = [part for part in session["parts"] if part["state"] != PART_UPLOADED]
+    error = "; ".join(f"{part['filename']}: {part['error']}" for part in failed) or None
+    if not failed:
+        try:
+            result = await upload_file_simple_async(session["volunteer_id"], f"session-{session_id}.json",
+                                                    manifest_document(session))
+        except Exception:
+            session_log.exception("Session %s manifest upload raised", session_id)
+            result = None
+        if not result or result["integrity"] == "corrupt":
+            error = "Could not write the session manifest to OneDrive"
+    
+    await asyncio.to_thread(upload_sessions.complete, session_id, error is None, error)
+    SESSIONS_FINISHED.inc(state="incomplete" if error else "complete")
+    if error:
+        session_log.warning("Session %s of V%s incomplete: %s", session_id, session["volunteer_id"], error)
+    else:
+        session_log.info("Session %s of V%s complete (%s files)", session_id, session["volunteer_id"],
+                         len(session["parts"]))
+
+
+upload_jobs = UploadJobQueue(process_upload_job_async, max_workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE,
+                             on_finished=finish_journaled_job, runner=graph_loop)
+admission = AdmissionController(
+    max_concurrent=UPLOAD_MAX_CONCURRENT,
+    max_inflight_bytes=UPLOAD_MAX_INFLIGHT_BYTES,
+    backlog_bytes=upload_jobs.pending_bytes,
+    retry_after=UPLOAD_RETRY_AFTER,
+    unknown_length_bytes=UPLOAD_MAX_BYTES
+)
+
+
+def busy_response(error, retry_after, status_code):
+    """429/503 response telling the client when to try again"""
+    response = jsonify({
+        "success": False,
+        "error": error,
+        "retry_after": retry_after
+    })
+    response.headers["Retry-After"] = str(retry_after)
+    return response, status_code
+
+
+def too_large_response():
+    """413 for a request body over UPLOAD_MAX_BYTES"""
+    return jsonify({
+        "success": False,
+        "error": f"Upload larger than {UPLOAD_MAX_BYTES} bytes"
+    }), 413
+
+
+def admission_controlled(view):
+    """Admit an upload request before its body is read (see admission.py)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            admitted = admission.admit(request.content_length)
+        except AdmissionRejected as e:
+            log.getChild("admission").warning("Rejected upload (%s bytes): %s", request.content_length, e)
+            return busy_response(f"Server busy: {e}", e.retry_after, 429)
+        with admitted:
+            # The upload's time budget runs from here, not from when a worker picks the job up
+            g.deadline = Deadline(UPLOAD_DEADLINE)
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def wants_timing():
+    """True if the client asked for a timing breakdown (X-Debug-Timing: 1)"""
+    return request.headers.get(DEBUG_TIMING_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def traced_upload(view):
+    """
+    Trace an upload request under its request ID when traces are exported
+    or the client sent X-Debug-Timing. Queued jobs carry the trace on.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not (trace_exporter or wants_timing()):
+            return view(*args, **kwargs)
+        g.trace = tracing.Trace(g.request_id, trace_exporter)
+        with tracing.activate(g.trace), tracing.span("request", endpoint=request.endpoint,
+                                                      content_length=request.content_length):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def accept_spooled_upload(volunteer_id, filename, file_type, spool_path, file_size, hashes,
+                          idempotency_key=None, upload_session=None):
+    """
+    Hand a spooled upload to the job queue (202) or, with UPLOAD_ASYNC off,
+    upload it inline. Takes ownership of spool_path either way.
+    
+    upload_session ({"upload_url", "expires_at", "offset"}) is a Graph
+    session already holding the first bytes (a live upload): it goes into
+    the journal so the job resumes it. It is cancelled if no job takes it.
+    
+    A repeat of an earlier upload (same Idempotency-Key, or same volunteer,
+    filename and content hash) returns the earlier result without sending
+    anything to OneDrive. The journal insert is what decides between two
+    identical requests arriving together: only one gets a journal entry,
+    the other is answered as a repeat of it.
+    """
+    with tracing.span("dedup_lookup"):
+        earlier = find_earlier_upload(volunteer_id, filename, hashes, idempotency_key)
+    if earlier:
+        remove_spool_file(spool_path)
+        discard_upload_session(upload_session)
+        return earlier
+    
+    # Started at admission; requests that skip admission (finishing a live upload) start it now
+    deadline = g.get("deadline") or Deadline(UPLOAD_DEADLINE)
+    
+    if not UPLOAD_ASYNC:
+        discard_upload_session(upload_session)  # only queued jobs resume journaled sessions
+        try:
+            with open(spool_path, "rb") as spooled:
+                body, status_code = upload_with_fallback(volunteer_id, filename, spooled, file_size, file_type,
+                                                         expected_hash=hashes["quickXorHash"], deadline=deadline)
+            remember_completed_upload(volunteer_id, filename, hashes, file_size, body, idempotency_key)
+            return jsonify(body), status_code
+        finally:
+            remove_spool_file(spool_path)
+    
+    job = UploadJob(volunteer_id, filename, file_type, spool_path, file_size, sha1=hashes["sha1"],
+                    quick_xor_hash=hashes["quickXorHash"], idempotency_key=idempotency_key)
+    job.trace = tracing.current_trace()
+    job.request_id = tracing.current_request_id()
+    job.deadline = deadline
+    while not upload_journal.record(job.id, volunteer_id, filename, file_type, spool_path, file_size,
+                                    sha1=job.sha1, quick_xor_hash=job.quick_xor_hash,
+                                    idempotency_key=idempotency_key):
+        # An identical request was journaled since the lookup above - answer from it
+        earlier = find_earlier_upload(volunteer_id, filename, hashes, idempotency_key)
+        if earlier:
+            remove_spool_file(spool_path)
+            discard_upload_session(upload_session)
+            return earlier
+    if upload_session:
+        upload_journal.set_session(job.id, upload_session["upload_url"], upload_session["expires_at"])
+        upload_journal.set_offset(job.id, upload_session["offset"])
+    try:
+        upload_jobs.submit(job)
+    except QueueFullError as e:
+        upload_journal.remove(job.id)
+        remove_spool_file(spool_path)
+        discard_upload_session(upload_session)
+        return busy_response(f"Upload queue full: {e}", UPLOAD_RETRY_AFTER, 503)
+    
+    jobs_log.info("Queued job %s: %s/%s", job.id, volunteer_id, filename)
+    return jsonify({
+        "success": True,
+        "message": f"File {filename} accepted for upload",
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}",
+        "state": job.state,
+        "file": filename,
+        "volunteer_id": volunteer_id
+    }), 202
+
+
+def resume_journaled_uploads():
+    """
+    Re-queue uploads that were still in flight when the backend (or the
+    worker process running them) stopped
+    """
+    orphans = upload_journal.claim_orphans(PROCESS_STARTED)
+    for index, entry in enumerate(orphans):
+        if not os.path.exists(entry["spool_path"]):
+            journal_log.warning("Spool file for job %s is gone, dropping entry", entry["job_id"])
+            upload_journal.remove(entry["job_id"])
+            continue
+        
+        job = UploadJob(entry["volunteer_id"], entry["filename"], entry["file_type"],
+                        entry["spool_path"], entry["size"], job_id=entry["job_id"],
+                        sha1=entry["sha1"], quick_xor_hash=entry["quick_xor_hash"],
+                        idempotency_key=entry["idempotency_key"])
+        # The request that queued it is long gone - a fresh budget for the resumed upload
+        job.deadline = Deadline(UPLOAD_DEADLINE)
+        try:
+            upload_jobs.submit(job)
+        except QueueFullError:
+            journal_log.warning("Upload queue full, %s jobs stay journaled for a later sweep",
+                                len(orphans) - index)
+            for remaining in orphans[index:]:
+                upload_journal.disown(remaining["job_id"])
+            break
+        journal_log.info("Re-queued job %s: %s/%s from byte %s", job.id, job.volunteer_id, job.filename,
+                         entry["confirmed_offset"])
+
+
+def reconcile_upload(volunteer_id, filename, reader, size, quick_xor_hash):
+    """
+    Push one locally saved file for the reconciler. A file of the same
+    name is only taken as this one if its quickXorHash matches; while
+    OneDrive has not computed the hash yet the file stays pending.
+    """
+    if not onedrive_breaker.allow_request():
         return False
+    
+    volunteer_folder_id = resolve_volunteer_folder(volunteer_id)
+    existing = remote_item(volunteer_folder_id, filename) if volunteer_folder_id else None
+    if existing and existing.get("size") == size:
+        integrity = check_integrity(existing, quick_xor_hash)
+        if integrity == "verified":
+            log.getChild("reconcile").info("V%s/%s already on OneDrive", volunteer_id, filename)
+            return True
+        if integrity == "unverified":
+            log.getChild("reconcile").info("V%s/%s on OneDrive has no hash yet, checking again later",
+                                           volunteer_id, filename)
+            return False
+    
+    file_type = "video" if filename.endswith(".webm") else "csv"
+    result = upload_to_onedrive(volunteer_id, filename, reader, size, file_type, expected_hash=quick_xor_hash)
+    if result:
+        onedrive_breaker.record_success()
+    else:
+        onedrive_breaker.record_failure()
+    # A copy that is still corrupt stays pending for the next pass
+    return bool(result) and result["integrity"] != "corrupt"
+
+
+def uploads_in_progress():
+    """
+    True while any worker process has uploads journaled or live uploads
+    open - the reconciler backs off. Read from the shared SQLite stores,
+    since the leader running the reconciler only sees its own job queue.
+    """
+    return upload_journal.active_count() > 0 or live_uploads.open_count() > 0
+
+
+reconciler = Reconciler(
+    RECONCILE_ROOTS,
+    RECONCILE_MANIFEST_FILE,
+    upload_fn=reconcile_upload,
+    is_healthy=lambda: token_manager.has_token() and onedrive_breaker.state == STATE_CLOSED,
+    is_busy=uploads_in_progress,
+    max_workers=RECONCILE_WORKERS,
+    bytes_per_second=RECONCILE_MAX_BPS,
+    interval_seconds=RECONCILE_INTERVAL
+)
 
 
 @app.route("/api/upload", methods=["POST"])
+@traced_upload
+@admission_controlled
 def upload():
-    """Endpoint for file upload requests - with local storage fallback"""
-    global access_token
+    """Endpoint for file upload requests - with local storage fallback
     
+    Expects a JSON body with base64 file_data. Kept for small files (CSV);
+    large files should use /api/upload/stream. The decoded file is spooled
+    and queued like a streaming upload.
+    """
+    data = {}
     try:
         data = request.get_json()
         
         volunteer_id = data.get("volunteer_id")
-        filename = data.get("filename")
+        # Only the name - a client path must not reach the local fallback or Graph paths
+        filename = os.path.basename(data.get("filename") or "")
         file_data_b64 = data.get("file_data")
         file_type = data.get("file_type", "csv")
         
@@ -365,73 +1622,24 @@ def upload():
                 "error": f"Decode error: {str(e)}"
             }), 400
         
-        print(f"Upload request: {volunteer_id}/{filename}")
+        upload_log.info("Upload request: %s/%s", volunteer_id, filename)
         
-        # Try OneDrive upload first if we have a token
-        onedrive_success = False
-        if access_token:
-            print(f"[UPLOAD] Attempting OneDrive upload...")
-            try:
-                if file_type == "video" or len(file_data) > 4 * 1024 * 1024:
-                    onedrive_success = upload_file_resumable(volunteer_id, filename, file_data, len(file_data))
-                else:
-                    onedrive_success = upload_file_simple(volunteer_id, filename, file_data)
-            except Exception as e:
-                print(f"[UPLOAD] OneDrive upload exception: {e}")
-                onedrive_success = False
-        
-        # If OneDrive failed, try token refresh and retry
-        if not onedrive_success and access_token:
-            print(f"[UPLOAD] OneDrive upload failed, attempting token refresh...")
-            if refresh_access_token():
-                try:
-                    if file_type == "video" or len(file_data) > 4 * 1024 * 1024:
-                        onedrive_success = upload_file_resumable(volunteer_id, filename, file_data, len(file_data))
-                    else:
-                        onedrive_success = upload_file_simple(volunteer_id, filename, file_data)
-                except Exception as e:
-                    print(f"[UPLOAD] OneDrive upload after refresh exception: {e}")
-                    onedrive_success = False
-        
-        # If OneDrive still failed, fall back to local storage
-        if not onedrive_success:
-            print(f"[UPLOAD] OneDrive unavailable, falling back to local storage...")
-            ensure_local_storage()
-            local_success = save_file_locally(volunteer_id, filename, file_data)
-            
-            if local_success:
-                return jsonify({
-                    "success": True,
-                    "message": f"File {filename} saved locally (OneDrive unavailable)",
-                    "location": "local",
-                    "file": filename,
-                    "volunteer_id": volunteer_id
-                }), 200
-            else:
-                return jsonify({
-                    "success": False,
-                    "error": "Upload to OneDrive and local storage both failed"
-                }), 500
-        
-        # OneDrive upload succeeded
-        return jsonify({
-            "success": True,
-            "message": f"File {filename} uploaded to OneDrive successfully",
-            "location": "onedrive",
-            "file": filename,
-            "volunteer_id": volunteer_id
-        }), 200
+        idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+        spool_path, file_size, hashes = spool_request_body(io.BytesIO(file_data))
+        return accept_spooled_upload(volunteer_id, filename, file_type, spool_path, file_size,
+                                     hashes, idempotency_key)
+    
+    except RequestEntityTooLarge:
+        return too_large_response()
     
     except Exception as e:
-        print(f"UPLOAD ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        upload_log.exception("Upload request failed")
         
         # Even if there's an exception, try local storage
         try:
             ensure_local_storage()
             save_file_locally(data.get("volunteer_id", "unknown"), 
-                            data.get("filename", "unknown"), 
+                            os.path.basename(data.get("filename") or "") or "unknown", 
                             file_data if 'file_data' in locals() else b"")
         except:
             pass
@@ -442,32 +1650,666 @@ def upload():
         }), 500
 
 
+@app.route("/api/upload/stream", methods=["POST"])
+@traced_upload
+@admission_controlled
+def upload_stream():
+    """
+    Streaming upload endpoint - the request body is written to a spool file
+    in STREAM_BUFFER_SIZE pieces and uploaded from disk chunk by chunk.
+    Returns 202 with a job_id (see /api/jobs/<id>) unless UPLOAD_ASYNC is off.
+    
+    Accepts either:
+    - application/octet-stream body with volunteer_id, filename and
+      file_type as query parameters
+    - multipart/form-data with a "file" part and the same fields as form fields
+    
+    An optional Idempotency-Key header makes client retries safe.
+    """
+    spool_path = None
+    upload_part = None
+    try:
+        if request.mimetype == "multipart/form-data":
+            fields = request.form
+            upload_part = request.files.get("file")
+            if upload_part is None:
+                return jsonify({
+                    "success": False,
+                    "error": "Missing multipart field: file"
+                }), 400
+            source = upload_part.stream
+        else:
+            fields = request.args
+            source = request.stream
+        
+        volunteer_id = fields.get("volunteer_id")
+        filename = fields.get("filename") or (upload_part.filename if upload_part else None)
+        file_type = fields.get("file_type", "video" if filename and filename.endswith(".webm") else "csv")
+        
+        if not all([volunteer_id, filename]):
+            return jsonify({
+                "success": False,
+                "error": "Missing required fields: volunteer_id, filename"
+            }), 400
+        
+        filename = os.path.basename(filename)
+        spool_path, file_size, hashes = spool_request_body(source)
+        
+        if file_size == 0:
+            return jsonify({
+                "success": False,
+                "error": "Empty request body"
+            }), 400
+        
+        upload_log.info("Stream upload request: %s/%s (%s bytes)", volunteer_id, filename, file_size)
+        
+        # accept_spooled_upload owns the spool file from here on
+        spooled_path, spool_path = spool_path, None
+        return accept_spooled_upload(volunteer_id, filename, file_type, spooled_path, file_size,
+                                     hashes, request.headers.get("Idempotency-Key"))
+    
+    except RequestEntityTooLarge:
+        return too_large_response()
+    
+    except Exception as e:
+        upload_log.exception("Stream upload request failed")
+        return jsonify({
+            "success": False,
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+    
+    finally:
+        if spool_path:
+            remove_spool_file(spool_path)
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Poll the state of a queued upload (with X-Debug-Timing: the job's stage timings so far)"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        # Queued by another worker process, or finished before a restart
+        status = upload_journal.job_status(job_id)
+        if status:
+            return jsonify(status), 200
+        return jsonify({
+            "success": False,
+            "error": f"Unknown job: {job_id}"
+        }), 404
+    
+    body = job.to_dict()
+    if job.trace and wants_timing():
+        body["timing"] = job.trace.timing()
+    return jsonify(body), 200
+
+
+def session_part_url(session_id, filename):
+    return f"/api/sessions/{session_id}/files/{filename}"
+
+
+def session_part_progress(part):
+    """Bytes of a part on OneDrive so far - from the job running it here or, in another process, the journal"""
+    if part["state"] == PART_UPLOADED:
+        return part["size"]
+    if part["state"] == PART_WAITING or not part["job_id"]:
+        return 0
+    job = upload_jobs.get(part["job_id"])
+    status = job.to_dict() if job else upload_journal.job_status(part["job_id"])
+    return min(part["size"], (status or {}).get("bytes_sent") or 0)
+
+
+def session_status(session):
+    """Session with per-file and overall progress, for the session endpoints"""
+    files = []
+    for part in session["parts"]:
+        files.append({
+            "filename": part["filename"],
+            "file_type": part["file_type"],
+            "size": part["size"],
+            "state": part["state"],
+            "bytes_sent": session_part_progress(part),
+            "location": part["location"],
+            "integrity": part["integrity"],
+            "job_id": part["job_id"],
+            "error": part["error"],
+            "upload_url": session_part_url(session["session_id"], part["filename"])
+        })
+    size = sum(part["size"] for part in files)
+    bytes_sent = sum(part["bytes_sent"] for part in files)
+    return {
+        "session_id": session["session_id"],
+        "volunteer_id": session["volunteer_id"],
+        "state": session["state"],
+        "error": session["error"],
+        "status_url": f"/api/sessions/{session['session_id']}",
+        "files": files,
+        "size": size,
+        "bytes_sent": bytes_sent,
+        "progress": round(bytes_sent / size, 4) if size else 1.0,
+        "created_at": session["created_at"],
+        "completed_at": session["completed_at"]
+    }
+
+
+@app.route("/api/sessions", methods=["POST"])
+def create_session():
+    """
+    Declare the files of one recording session before sending them.
+    
+    JSON body: {"volunteer_id": 7, "files": [{"filename": "V7.csv",
+    "size": 1234, "sha1": "...", "quickXorHash": "..."}, ...]} - hashes
+    and file_type are optional. Returns 201 with each file's upload_url;
+    PUT the files there (in parallel) and poll status_url.
+    """
+    data = request.get_json(silent=True) or {}
+    volunteer_id = data.get("volunteer_id")
+    if not volunteer_id:
+        return jsonify({
+            "success": False,
+            "error": "Missing required field: volunteer_id"
+        }), 400
+    try:
+        parts = validate_manifest(data.get("files"), SESSION_MAX_FILES)
+    except ManifestError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    session_id = upload_sessions.create(volunteer_id, parts)
+    session_log.info("Session %s of V%s: %s", session_id, volunteer_id,
+                     ", ".join(f"{part['filename']} ({part['size']} bytes)" for part in parts))
+    return jsonify(dict(session_status(upload_sessions.get(session_id)), success=True)), 201
+
+
+@app.route("/api/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    """Poll a session: state (open / completing / complete / incomplete) and per-file progress"""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown session: {session_id}"
+        }), 404
+    return jsonify(session_status(session)), 200
+
+
+def find_session_part(session_id, filename):
+    """(session, part, None) for a part that still takes a file, else (session, part, error response)"""
+    session = upload_sessions.get(session_id)
+    part = next((p for p in session["parts"] if p["filename"] == filename), None) if session else None
+    if part is None:
+        return session, None, (jsonify({
+            "success": False,
+            "error": f"Unknown session file: {session_id}/{filename}"
+        }), 404)
+    if part["state"] == PART_UPLOADED:
+        return session, part, (jsonify(dict(session_status(session), success=True, duplicate=True)), 200)
+    if session["state"] != SESSION_OPEN:
+        return session, part, (jsonify({
+            "success": False,
+            "error": f"Session is {session['state']}"
+        }), 409)
+    return session, part, None
+
+
+def manifest_mismatch(part, file_size, hashes):
+    """Why a received file is not the one the manifest declared, or None"""
+    if file_size != part["size"]:
+        return f"size {file_size}, manifest says {part['size']}"
+    if part["sha1"] and hashes["sha1"] != part["sha1"]:
+        return "sha1 differs from the manifest"
+    if part["quick_xor_hash"] and hashes["quickXorHash"] != part["quick_xor_hash"]:
+        return "quickXorHash differs from the manifest"
+    return None
+
+
+def accept_session_part(session, part, spool_path, file_size, hashes, upload_session=None):
+    """
+    Queue a received part (see accept_spooled_upload, which takes ownership
+    of spool_path and upload_session) and tie its job to the session
+    """
+    session_id, filename = session["session_id"], part["filename"]
+    key = part_key(session_id, filename)
+    upload_log.info("Session upload request: %s/%s (%s bytes)", session["volunteer_id"], filename, file_size)
+    response, status_code = accept_spooled_upload(session["volunteer_id"], filename, part["file_type"],
+                                                  spool_path, file_size, hashes, key, upload_session)
+    body = response.get_json()
+    if status_code == 202:
+        upload_sessions.attach_job(session_id, filename, body["job_id"], hashes,
+                                   state=body.get("state") or PART_QUEUED)
+        # A duplicate of another job may have finished before it was attached
+        job = upload_jobs.get(body["job_id"])
+        status = job.to_dict() if job else upload_journal.job_status(body["job_id"])
+        if status and status["state"] in (JOB_DONE, JOB_FAILED):
+            finish_session_part(key, body["job_id"], status)
+    elif status_code == 200:
+        # Already on OneDrive (dedup), or uploaded inline with UPLOAD_ASYNC off
+        upload_sessions.attach_job(session_id, filename, body.get("job_id"), hashes)
+        finish_session_part(key, body.get("job_id"), {
+            "state": JOB_DONE if body.get("success") else JOB_FAILED,
+            "location": body.get("location"),
+            "integrity": body.get("integrity"),
+            "error": body.get("error")
+        })
+    else:
+        return response, status_code
+    
+    body.update(session_id=session_id, session_url=f"/api/sessions/{session_id}")
+    return jsonify(body), status_code
+
+
+@app.route("/api/sessions/<session_id>/files/<filename>", methods=["PUT"])
+@traced_upload
+@admission_controlled
+def upload_session_file(session_id, filename):
+    """
+    Raw body of one declared file. It must match the manifest's size (and
+    hashes, if declared) - otherwise 422 and the file can be sent again.
+    Otherwise it is queued like a streaming upload (202 with a job_id) and
+    counts towards the session once its job finishes. Re-sending a file
+    is safe: it is deduplicated under the part's own Idempotency-Key.
+    """
+    session, part, error = find_session_part(session_id, filename)
+    if error:
+        return error
+    
+    try:
+        spool_path, file_size, hashes = spool_request_body(request.stream)
+        mismatch = manifest_mismatch(part, file_size, hashes)
+        if mismatch:
+            remove_spool_file(spool_path)
+            session_log.warning("Session %s: %s rejected, %s", session_id, filename, mismatch)
+            return jsonify({
+                "success": False,
+                "error": f"{filename} does not match the manifest: {mismatch}"
+            }), 422
+        return accept_session_part(session, part, spool_path, file_size, hashes)
+    
+    except RequestEntityTooLarge:
+        return too_large_response()
+    
+    except Exception as e:
+        upload_log.exception("Session upload of %s/%s failed", session_id, filename)
+        return jsonify({
+            "success": False,
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+
+
+def live_upload_session(entry):
+    """The Graph session a live upload streams into, as accept_spooled_upload() takes it, or None"""
+    if not entry["upload_url"]:
+        return None
+    return {"upload_url": entry["upload_url"], "expires_at": entry["upload_expires_at"], "offset": entry["uploaded"]}
+
+
+async def open_live_session_async(live_id, volunteer_id, filename):
+    """
+    Open the Graph upload session a live upload streams into while it
+    records. Without a token, while the circuit is open or if Graph fails,
+    the recording is only spooled and uploaded whole after finishing.
+    """
+    if not token_manager.has_token() or onedrive_breaker.state != STATE_CLOSED:
+        return
+    deadline = Deadline(UPLOAD_DEADLINE)
+    try:
+        volunteer_folder_id = await resolve_volunteer_folder_async(volunteer_id, deadline)
+        upload_url = volunteer_folder_id and await create_upload_session_async(
+            volunteer_id, volunteer_folder_id, filename, deadline=deadline, live_id=live_id)
+    except requests.RequestException as e:
+        live_log.warning("Live upload %s: no upload session, uploading after finish instead: %s", live_id, e)
+        return
+    if upload_url:
+        live_log.info("Live upload %s streams to OneDrive while recording", live_id)
+        await push_live_async(live_id)  # segments that arrived in the meantime
+
+
+async def push_live_async(live_id):
+    """
+    Push every full 320 KiB-aligned run of a live upload's spooled bytes
+    to its Graph session, with an open-ended Content-Range (bytes a-b/*)
+    since the total is not known yet. One process pushes at a time (a
+    lease in the live upload store) and keeps going while segments arrive;
+    the bytes after the last full run are sent by the upload job after
+    finish, with the real total. A failed PUT stops the push - the next
+    segment starts it again.
+    """
+    entry = await asyncio.to_thread(live_uploads.claim_push, live_id, LIVE_PUSH_LEASE)
+    if entry is None:
+        return
+    try:
+        uploaded = entry["uploaded"]
+        while entry["state"] == LIVE_OPEN and entry["upload_url"]:
+            aligned = entry["size"] - entry["size"] % CHUNK_SIZE
+            if aligned <= uploaded:
+                break
+            end = min(aligned, uploaded + LIVE_PUSH_CHUNK)
+            chunk = await asyncio.to_thread(read_spool_range, entry["spool_path"], uploaded, end)
+            try:
+                response = await async_graph.put(entry["upload_url"], headers={
+                    "Content-Length": str(len(chunk)),
+                    "Content-Range": f"bytes {uploaded}-{end - 1}/*"
+                }, data=chunk, auth=False, operation="live_chunk_put")
+            except requests.RequestException as e:
+                live_log.warning("Live upload %s: chunk at byte %s failed: %s", live_id, uploaded, e)
+                break
+            
+            if response.status_code == 202:
+                GRAPH_BYTES_SENT.inc(len(chunk))
+                uploaded = end
+            elif response.status_code == 416:
+                # Already stored (a response was lost) - continue where the session is
+                session_state, server_offset = await query_upload_session_async(entry["upload_url"])
+                if session_state != "active" or server_offset == uploaded:
+                    break
+                uploaded = server_offset
+            elif response.status_code in (404, 410):
+                live_log.warning("Live upload %s: upload session gone, uploading after finish instead", live_id)
+                await asyncio.to_thread(live_uploads.drop_upload_session, live_id)
+                break
+            else:
+                live_log.warning("Live upload %s: chunk at byte %s got %s", live_id, uploaded, response.status_code)
+                break
+            entry = await asyncio.to_thread(live_uploads.set_uploaded, live_id, uploaded, LIVE_PUSH_LEASE)
+    finally:
+        await asyncio.to_thread(live_uploads.release_push, live_id)
+
+
+def live_status(entry):
+    """Live upload state for the /api/live endpoints, with its job's progress once finished"""
+    body = {
+        "live_id": entry["live_id"],
+        "volunteer_id": entry["volunteer_id"],
+        "filename": entry["filename"],
+        "state": entry["state"],
+        "next_seq": entry["next_seq"],
+        "size": entry["size"],
+        "uploaded": entry["uploaded"],
+        "job_id": entry["job_id"],
+        "session_id": entry["session_id"],
+        "error": entry["error"],
+        "status_url": f"/api/live/{entry['live_id']}"
+    }
+    if entry["job_id"]:
+        job = upload_jobs.get(entry["job_id"])
+        body["job"] = job.to_dict() if job else upload_journal.job_status(entry["job_id"])
+    return body
+
+
+@app.route("/api/live", methods=["POST"])
+def create_live_upload():
+    """
+    Start a live upload before recording: JSON {"volunteer_id", "filename",
+    "file_type"?}. Returns 201 with live_id; PUT segments to
+    /api/live/<live_id>/segments/<seq> (seq = 0, 1, 2, ...) while recording
+    and POST /api/live/<live_id>/finish when it stops.
+    """
+    data = request.get_json(silent=True) or {}
+    volunteer_id = data.get("volunteer_id")
+    filename = os.path.basename(data.get("filename") or "")
+    if not all([volunteer_id, filename]):
+        return jsonify({
+            "success": False,
+            "error": "Missing required fields: volunteer_id, filename"
+        }), 400
+    
+    entry = live_uploads.create(volunteer_id, filename,
+                                data.get("file_type") or ("video" if filename.endswith(".webm") else "csv"))
+    live_log.info("Live upload %s: V%s/%s", entry["live_id"], volunteer_id, filename)
+    # In the background - recording must not wait for OneDrive
+    graph_loop.submit(open_live_session_async(entry["live_id"], volunteer_id, filename))
+    return jsonify(dict(live_status(entry), success=True)), 201
+
+
+@app.route("/api/live/<live_id>", methods=["GET"])
+def get_live_upload(live_id):
+    """Segments and bytes received so far; after finish, the upload job's state"""
+    entry = live_uploads.get(live_id)
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown live upload: {live_id}"
+        }), 404
+    return jsonify(live_status(entry)), 200
+
+
+@app.route("/api/live/<live_id>", methods=["DELETE"])
+def abandon_live_upload(live_id):
+    """The client sends the whole file another way - drop the segments received so far"""
+    entry = live_uploads.get(live_id)
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown live upload: {live_id}"
+        }), 404
+    abandoned = live_uploads.abandon(live_id)
+    if abandoned:
+        live_log.info("Live upload %s abandoned", live_id)
+        discard_upload_session(live_upload_session(entry))
+    return jsonify(dict(live_status(live_uploads.get(live_id)), success=abandoned)), 200 if abandoned else 409
+
+
+@app.route("/api/live/<live_id>/segments/<int:seq>", methods=["PUT"])
+@admission_controlled
+def append_live_segment(live_id, seq):
+    """
+    Append segment seq (raw body, at most LIVE_SEGMENT_MAX bytes).
+    200 once appended - also for a repeat of an appended segment; 409 with
+    next_seq when a segment before it is missing or the upload is finished.
+    """
+    if request.content_length is None or request.content_length > LIVE_SEGMENT_MAX:
+        return jsonify({
+            "success": False,
+            "error": f"Segments need a Content-Length of at most {LIVE_SEGMENT_MAX} bytes"
+        }), 413
+    
+    segment = request.get_data(cache=False)
+    result, entry = live_uploads.append(live_id, seq, segment)
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown live upload: {live_id}"
+        }), 404
+    if result in (OUT_OF_ORDER, CLOSED):
+        live_log.warning("Live upload %s: segment %s refused (%s, expected %s)", live_id, seq, result,
+                         entry["next_seq"])
+        return jsonify(dict(live_status(entry), success=False, error=(
+            f"Expected segment {entry['next_seq']}" if result == OUT_OF_ORDER else f"Live upload is {entry['state']}"
+        ))), 409
+    
+    live_log.debug("Live upload %s: segment %s %s (%s bytes)", live_id, seq, result, len(segment))
+    if result == APPENDED and entry["upload_url"] and entry["size"] - entry["size"] % CHUNK_SIZE > entry["uploaded"]:
+        graph_loop.submit(push_live_async(live_id))
+    return jsonify(dict(live_status(entry), success=True, duplicate=result == DUPLICATE)), 200
+
+
+def finish_live(entry, session_id, segments=None):
+    """
+    Queue a live upload's spool file - as a part of session_id if given -
+    and return the response for /finish. The job resumes the Graph session
+    the recording was streamed into and sends the rest with the real total.
+    Segments missing (fewer than the client's count) or a mismatch with the
+    session manifest reopen it so the client can send what is missing.
+    """
+    live_id = entry["live_id"]
+    if segments is not None and segments != entry["next_seq"]:
+        return jsonify(dict(live_status(entry), success=False,
+                            error=f"Received {entry['next_seq']} of {segments} segments")), 409
+    session = part = None
+    if session_id:
+        session, part, error = find_session_part(session_id, entry["filename"])
+        if error:
+            return error
+    
+    entry = live_uploads.finish(live_id)
+    if entry is None:
+        return jsonify(live_status(live_uploads.get(live_id))), 200  # finished by a concurrent call
+    if entry["size"] == 0:
+        remove_spool_file(entry["spool_path"])
+        discard_upload_session(live_upload_session(entry))
+        live_uploads.fail(live_id, "No segments received")
+        return jsonify(dict(live_status(live_uploads.get(live_id)), success=False)), 400
+    
+    # Updated with every segment - the recording is not read back
+    hashes = live_uploads.hashes(live_id)
+    if part:
+        mismatch = manifest_mismatch(part, entry["size"], hashes)
+        if mismatch:
+            live_uploads.reopen(live_id)
+            live_log.warning("Live upload %s does not match session %s: %s", live_id, session_id, mismatch)
+            return jsonify(dict(live_status(live_uploads.get(live_id)), success=False,
+                                error=f"{entry['filename']} does not match the manifest: {mismatch}")), 422
+    
+    upload_session = live_upload_session(entry)
+    if upload_session and not uses_resumable_upload(entry["file_type"], entry["size"]):
+        # Small enough for one simple PUT - the session is not needed
+        discard_upload_session(upload_session)
+        upload_session = None
+    if part:
+        response, status_code = accept_session_part(session, part, entry["spool_path"], entry["size"], hashes,
+                                                    upload_session)
+    else:
+        response, status_code = accept_spooled_upload(entry["volunteer_id"], entry["filename"], entry["file_type"],
+                                                      entry["spool_path"], entry["size"], hashes,
+                                                      f"live:{live_id}", upload_session)
+    
+    body = response.get_json()
+    if status_code in (200, 202):
+        live_uploads.set_job(live_id, body.get("job_id"), session_id)
+        live_log.info("Live upload %s finished: %s segments, %s bytes (%s already on OneDrive)", live_id,
+                      entry["next_seq"], entry["size"], entry["uploaded"] if upload_session else 0)
+    else:
+        # The spool file is gone with the rejected upload - the client sends the whole file instead
+        live_uploads.fail(live_id, body.get("error"))
+    return response, status_code
+
+
+@app.route("/api/live/<live_id>/finish", methods=["POST"])
+@traced_upload
+def finish_live_upload(live_id):
+    """
+    Recording stopped: upload what was received. Optional JSON
+    {"segments": n} refuses to finish (409) unless all n segments arrived;
+    {"session_id": ...} uploads it as that session's file of the same name.
+    Returns what /api/upload/stream would (202 with a job_id).
+    """
+    data = request.get_json(silent=True) or {}
+    entry = live_uploads.get(live_id)
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown live upload: {live_id}"
+        }), 404
+    if entry["state"] != LIVE_OPEN:
+        return jsonify(live_status(entry)), 200 if entry["job_id"] else 409
+    
+    try:
+        return finish_live(entry, data.get("session_id"), data.get("segments"))
+    except Exception as e:
+        live_log.exception("Finishing live upload %s failed", live_id)
+        entry = live_uploads.get(live_id)
+        if entry["state"] != LIVE_OPEN and not entry["job_id"] and os.path.exists(entry["spool_path"]):
+            live_uploads.reopen(live_id)  # nothing was queued - finishing can be retried
+        return jsonify({
+            "success": False,
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+    g.request_id = request.headers.get("X-Request-ID") or tracing.new_request_id()
+    g.request_id_token = tracing.set_request_id(g.request_id)
+
+
+@app.teardown_request
+def clear_request_id(exc):
+    token = g.pop("request_id_token", None)
+    if token is not None:
+        tracing.reset_request_id(token)
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unmatched"
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        HTTP_LATENCY.observe(time.monotonic() - started, endpoint=endpoint)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    trace = g.get("trace")
+    if trace and wants_timing() and response.is_json:
+        body = response.get_json()
+        if isinstance(body, dict):
+            body["timing"] = trace.timing()
+            response.set_data(json.dumps(body))
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of the backend's counters, gauges and histograms"""
+    return app.response_class(metrics.REGISTRY.render(), content_type=metrics.Registry.CONTENT_TYPE)
+
+
+def upload_usage():
+    """Admission and job-queue usage for /api/status"""
+    return {
+        "admission": admission.stats(),
+        "jobs": upload_jobs.stats()
+    }
+
+
 @app.route("/api/status", methods=["GET"])
 def status():
-    """Check connection status"""
+    """Check connection status
+    
+    Answers from health_prober's last snapshot (probed every
+    STATUS_PROBE_INTERVAL seconds) - no Graph call per request.
+    """
     try:
-        if not access_token:
+        if not token_manager.has_token():
             return jsonify({
                 "connected": False,
-                "message": "No access token. Run device_auth.py first"
+                "message": "No access token. Run device_auth.py first",
+                "uploads": upload_usage()
             }), 401
         
-        headers = {"Authorization": f"Bearer {access_token}"}
-        test_url = f"{GRAPH_API_ENDPOINT}/me"
-        response = requests.get(test_url, headers=headers)
+        probe = health_prober.snapshot()
+        probe_info = {
+            "age_seconds": probe["age_seconds"],
+            "latency_ms": probe["latency_ms"],
+            "status_code": probe["status_code"],
+            "error": probe["error"]
+        }
         
-        if response.status_code == 200:
-            user_data = response.json()
+        if probe["connected"]:
             return jsonify({
                 "connected": True,
                 "message": "Connected to OneDrive",
-                "user": user_data.get("userPrincipalName"),
+                "user": probe.get("user"),
+                "probe": probe_info,
+                "token": token_manager.status(),
+                "circuit": onedrive_breaker.status(),
+                "reconciler": reconciler.status() if RECONCILE_ENABLED else None,
+                "dedup": upload_index.stats(),
+                "sessions": upload_sessions.stats(),
+                "live": live_uploads.stats(),
+                "graph": dict(graph.stats(), async_client=async_graph.stats(), loop_tasks=graph_loop.running),
+                "uploads": upload_usage(),
                 "timestamp": datetime.now().isoformat()
             }), 200
         else:
             return jsonify({
                 "connected": False,
-                "message": f"Connection failed: {response.status_code}"
+                "message": f"Connection failed: {probe['status_code'] or probe['error']}",
+                "probe": probe_info,
+                "token": token_manager.status(),
+                "circuit": onedrive_breaker.status(),
+                "uploads": upload_usage()
             }), 401
     
     except Exception as e:
@@ -477,10 +2319,60 @@ def status():
         }), 500
 
 
-if __name__ == "__main__":
+def finish_idle_live_uploads():
+    """Upload what live uploads received before their browser went away (no segment for LIVE_IDLE_TIMEOUT)"""
+    for entry in live_uploads.idle(LIVE_IDLE_TIMEOUT):
+        live_log.warning("Live upload %s (V%s/%s) idle, uploading its %s bytes", entry["live_id"],
+                         entry["volunteer_id"], entry["filename"], entry["size"])
+        with app.app_context():
+            finish_live(entry, None)
+
+
+def sweep_journal():
+    """
+    Leader: resume orphaned uploads and finish abandoned live uploads, now
+    and every JOURNAL_SWEEP_INTERVAL (a worker may have died)
+    """
+    while True:
+        try:
+            resume_journaled_uploads()
+        except Exception:
+            journal_log.exception("Journal sweep failed")
+        try:
+            finish_idle_live_uploads()
+        except Exception:
+            live_log.exception("Live upload sweep failed")
+        time.sleep(JOURNAL_SWEEP_INTERVAL)
+
+
+def start_leader_services():
+    """Background services that must run in one process only"""
+    log.info("Process %s is the leader", os.getpid())
+    # Started even without a token: it picks up the token file once device_auth.py writes it
+    token_manager.start()
+    warm_folder_cache()
+    threading.Thread(target=sweep_journal, name="journal-sweeper", daemon=True).start()
+    if RECONCILE_ENABLED:
+        reconciler.start()
+
+
+def start_services():
+    """
+    Start the background services of this process - called by __main__
+    and, once per worker, by gunicorn.conf.py. Every process probes
+    OneDrive health for its own /api/status; the leader also refreshes
+    tokens, resumes journaled uploads and runs the reconciler.
+    Both start without a token too and pick it up after sign-in.
+    """
     load_tokens()
+    health_prober.start()
+    leader.start(start_leader_services)
+
+
+if __name__ == "__main__":
+    start_services()
     
-    print("Flask server starting on http://localhost:5001")
-    print("Waiting for requests...")
+    log.info("Flask server starting on http://localhost:5001")
+    log.info("Waiting for requests...")
     
     app.run(host="0.0.0.0", port=5001, debug=False)
@@ -0,0 +1,138 @@
+"""
+Cross-process coordination for multi-worker serving
+
+Under gunicorn (see gunicorn.conf.py) several worker processes import
+onedrive_uploader and share the backend directory. Two primitives keep
+them from doing the same work twice:
+
+- FileLock: exclusive flock() on a lock file, e.g. around a token refresh,
+  so one process refreshes and the others re-read the token file
+- LeaderLock: a lock one process holds for its lifetime. The holder runs
+  the background services (token refresher, journal resume, reconciler);
+  the others keep trying and take over when the leader exits - the kernel
+  releases flock() locks of a dead process.
+
+Without fcntl (Windows) both degrade to single-process behaviour: every
+FileLock is granted and every process is the leader.
+"""
+
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows - no multi-worker serving there
+    fcntl = None
+
+log = logging.getLogger("process_lock")
+
+
+def process_alive(pid):
+    """True if a process with this PID exists"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    except OSError:
+        return False
+    return True
+
+
+class FileLock:
+    """Exclusive lock on `path` shared by all processes (and threads) using it"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            self._thread_lock.release()
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class LeaderLock:
+    """
+    One leader among the processes sharing `path`.
+
+    start(on_elected) calls on_elected() once, in the process that wins the
+    lock - immediately if it is free, otherwise from a background thread
+    that retries every poll_seconds.
+    """
+
+    def __init__(self, path, poll_seconds=10):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._lock = FileLock(path)
+        self._stop = threading.Event()
+        self._thread = None
+        self.is_leader = False
+
+    def try_acquire(self):
+        if not self.is_leader and self._lock.acquire(blocking=False):
+            self.is_leader = True
+            try:
+                with open(self.path + ".pid", "w", encoding="utf-8") as f:
+                    f.write(str(os.getpid()))
+            except OSError:
+                pass
+        return self.is_leader
+
+    def start(self, on_elected):
+        if self.try_acquire():
+            on_elected()
+            return
+        log.info("Process %s waits for the leader lock", os.getpid())
+        self._thread = threading.Thread(target=self._run, args=(on_elected,), name="leader-election",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, on_elected):
+        while not self._stop.wait(self.poll_seconds):
+            if self.try_acquire():
+                on_elected()
+                return
+
+    def leader_pid(self):
+        """PID of the current leader as it last recorded itself, or None"""
+        try:
+            with open(self.path + ".pid", "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def stop(self):
+        self._stop.set()
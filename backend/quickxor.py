@@ -0,0 +1,90 @@
+"""
+QuickXorHash - the content hash OneDrive reports in driveItem file.hashes
+
+Each input byte is XORed into a 160-bit register at bit offset
+(position * 11) mod 160, wrapping around the register; the 64-bit
+little-endian length is XORed into the last 8 bytes of the result.
+
+Bytes at positions that are equal mod 160 land on the same offset, so
+update() first XOR-folds the buffer into one 160-byte row using big-int
+operations (done in C) and then places those 160 bytes - the work per
+call is independent of Python-level per-byte loops.
+"""
+
+import base64
+
+WIDTH_BITS = 160
+WIDTH_BYTES = WIDTH_BITS // 8
+SHIFT = 11
+_MASK = (1 << WIDTH_BITS) - 1
+# Byte i lands on the same offset as byte i + 160
+ROW_BYTES = WIDTH_BITS
+
+
+def _fold_rows(data, start_column):
+    """
+    XOR together all 160-byte rows of data, where data[0] sits at column
+    start_column. Returns a 160-byte row (column i = XOR of bytes at i).
+
+    The head up to the next row boundary is placed at its column on its
+    own; the row-aligned rest is read straight from a memoryview of data,
+    so no padded copy of the buffer is built.
+    """
+    view = memoryview(data).cast("B")
+    head = min(len(view), (ROW_BYTES - start_column) % ROW_BYTES)
+    value = int.from_bytes(view[head:], "little")
+    rows = -(-(len(view) - head) // ROW_BYTES)
+
+    # Halve the number of rows each step: fold the high half onto the low half
+    while rows > 1:
+        half = (rows + 1) // 2
+        shift = half * ROW_BYTES * 8
+        value = (value & ((1 << shift) - 1)) ^ (value >> shift)
+        rows = half
+
+    if head:
+        value ^= int.from_bytes(view[:head], "little") << (start_column * 8)
+    return value.to_bytes(ROW_BYTES, "little")
+
+
+class QuickXorHash:
+    """Incremental quickXorHash with a hashlib-style interface"""
+
+    name = "quickxor"
+    digest_size = WIDTH_BYTES
+
+    def __init__(self, data=None):
+        self._register = 0
+        self._length = 0
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        if not data:
+            return
+        row = _fold_rows(data, self._length % ROW_BYTES)
+        register = self._register
+        for column, value in enumerate(row):
+            if value:
+                offset = (column * SHIFT) % WIDTH_BITS
+                shifted = value << offset
+                # Bits pushed past bit 159 wrap around to bit 0
+                register ^= (shifted & _MASK) ^ (shifted >> WIDTH_BITS)
+        self._register = register
+        self._length += len(data)
+
+    def digest(self):
+        result = bytearray(self._register.to_bytes(WIDTH_BYTES, "little"))
+        for i, length_byte in enumerate(self._length.to_bytes(8, "little")):
+            result[WIDTH_BYTES - 8 + i] ^= length_byte
+        return bytes(result)
+
+    def b64digest(self):
+        """Base64 digest - the format Graph returns in file.hashes.quickXorHash"""
+        return base64.b64encode(self.digest()).decode("ascii")
+
+    def copy(self):
+        clone = QuickXorHash()
+        clone._register = self._register
+        clone._length = self._length
+        return clone
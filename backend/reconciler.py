@@ -0,0 +1,262 @@
+"""
+Background reconciler for locally saved fallback files
+
+Files that could not reach OneDrive are saved under uploads/V{id}/ (by
+onedrive_uploader.save_file_locally) or uploads/GSR_Sessions/Volunteer_{id}/
+(by drive_upload.py) and were never uploaded again. The reconciler:
+
+- Scans the local fallback tree on an interval
+- Keeps a JSON manifest of files already on OneDrive (name, size, SHA-1)
+- Treats a file as already on OneDrive only if the remote copy has the
+  same quickXorHash, not merely the same size
+- Pushes missing files through a bounded worker pool, only while the
+  OneDrive backend is healthy
+- Rate-limits its own bytes and pauses while live uploads are running,
+  so it never competes with a recording station's upload
+
+Local files are never deleted - the manifest is what marks them as synced.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from quickxor import QuickXorHash
+
+# Volunteer folders used by the two fallback layouts - volunteer IDs are
+# numeric, so e.g. "Videos" is not mistaken for volunteer "ideos"
+VOLUNTEER_DIR_PATTERN = re.compile(r"^(?:Volunteer_|V)(\d+)$")
+HASH_BUFFER_SIZE = 1024 * 1024
+
+log = logging.getLogger("reconciler")
+
+
+def file_hashes(path):
+    """SHA-1 (hex) and quickXorHash (base64) of a file, read once in bounded pieces"""
+    sha1 = hashlib.sha1()
+    quick_xor = QuickXorHash()
+    with open(path, "rb") as f:
+        for piece in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            sha1.update(piece)
+            quick_xor.update(piece)
+    return sha1.hexdigest(), quick_xor.b64digest()
+
+
+class ByteRateLimiter:
+    """Token bucket in bytes/second, shared by all reconciler workers"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.allowance = bytes_per_second
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """Block until nbytes may be sent"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= nbytes
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ThrottledReader:
+    """
+    Seekable file wrapper that rate-limits reads and waits while
+    should_pause() is true (uploads in progress).
+    """
+
+    def __init__(self, f, limiter, should_pause=None, pause_poll=1.0):
+        self._f = f
+        self._limiter = limiter
+        self._should_pause = should_pause
+        self._pause_poll = pause_poll
+
+    def read(self, size=-1):
+        while self._should_pause and self._should_pause():
+            time.sleep(self._pause_poll)
+        data = self._f.read(size)
+        self._limiter.consume(len(data))
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+
+class Reconciler:
+    """Scans local fallback folders and pushes files missing from OneDrive"""
+
+    def __init__(self, roots, manifest_path, upload_fn, is_healthy, is_busy,
+                 max_workers=2, bytes_per_second=1024 * 1024, interval_seconds=300):
+        """
+        roots: directories to scan (volunteer folders anywhere below them)
+        upload_fn(volunteer_id, filename, reader, size, quick_xor_hash) -> bool
+        is_healthy() -> bool: OneDrive reachable (token present, circuit closed)
+        is_busy() -> bool: uploads in progress in any worker process
+        """
+        self.roots = roots
+        self.manifest_path = manifest_path
+        self.upload_fn = upload_fn
+        self.is_healthy = is_healthy
+        self.is_busy = is_busy
+        self.max_workers = max_workers
+        self.interval_seconds = interval_seconds
+        self.limiter = ByteRateLimiter(bytes_per_second)
+
+        self._manifest = self._load_manifest()
+        self._manifest_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_scan_at = None
+        self.last_pending = 0
+        self.pushed = 0
+        self.failed = 0
+
+    # ---- manifest ----
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            log.warning("Could not read manifest, starting empty: %s", e)
+            return {}
+
+    def _save_manifest(self):
+        """Atomic write (lock held by caller)"""
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", suffix=".json", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _mark_remote(self, path, volunteer_id, filename, size, mtime, sha1):
+        with self._manifest_lock:
+            self._manifest[path] = {
+                "volunteer_id": volunteer_id,
+                "name": filename,
+                "size": size,
+                "mtime": mtime,
+                "sha1": sha1,
+                "uploaded_at": time.time()
+            }
+            self._save_manifest()
+
+    # ---- scanning ----
+
+    def scan(self):
+        """Return local files not yet recorded as remote: [(path, volunteer_id, filename, size, mtime)]"""
+        seen = set()
+        pending = []
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for dirpath, _, filenames in os.walk(root):
+                match = VOLUNTEER_DIR_PATTERN.match(os.path.basename(dirpath))
+                if not match:
+                    continue
+                for filename in filenames:
+                    if filename.startswith(".") or filename.endswith(".part"):
+                        continue
+                    path = os.path.realpath(os.path.join(dirpath, filename))
+                    if path in seen:
+                        continue
+                    seen.add(path)
+
+                    stat = os.stat(path)
+                    entry = self._manifest.get(path)
+                    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                        continue
+                    pending.append((path, match.group(1), filename, stat.st_size, stat.st_mtime))
+
+        self.last_scan_at = time.time()
+        self.last_pending = len(pending)
+        return pending
+
+    def _push(self, item):
+        path, volunteer_id, filename, size, mtime = item
+        if not self.is_healthy():
+            return False
+
+        try:
+            sha1, quick_xor_hash = file_hashes(path)
+            # Same content already pushed under another path (e.g. copied folders)
+            with self._manifest_lock:
+                duplicate = any(entry["sha1"] == sha1 and entry["name"] == filename and
+                                entry["volunteer_id"] == volunteer_id for entry in self._manifest.values())
+            if not duplicate:
+                with open(path, "rb") as f:
+                    reader = ThrottledReader(f, self.limiter, self.is_busy)
+                    if not self.upload_fn(volunteer_id, filename, reader, size, quick_xor_hash):
+                        self.failed += 1
+                        return False
+                self.pushed += 1
+                log.info("Pushed %s to OneDrive as V%s/%s", path, volunteer_id, filename)
+            self._mark_remote(path, volunteer_id, filename, size, mtime, sha1)
+            return True
+        except Exception:
+            log.exception("Failed to push %s", path)
+            self.failed += 1
+            return False
+
+    def run_once(self):
+        """One scan + push pass. Skipped while unhealthy or busy."""
+        if not self.is_healthy() or self.is_busy():
+            return 0
+
+        pending = self.scan()
+        if not pending:
+            return 0
+
+        log.info("%s local file(s) missing from OneDrive", len(pending))
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="reconcile") as pool:
+            results = list(pool.map(self._push, pending))
+        return sum(1 for ok in results if ok)
+
+    # ---- background thread ----
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # First pass shortly after startup, then every interval_seconds
+        delay = min(30, self.interval_seconds)
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Reconcile pass failed")
+            delay = self.interval_seconds
+
+    def status(self):
+        return {
+            "synced_files": len(self._manifest),
+            "pending_files": self.last_pending,
+            "pushed": self.pushed,
+            "failed": self.failed,
+            "last_scan_at": self.last_scan_at
+        }
@@ -0,0 +1,141 @@
+"""
+Structured, non-blocking logging
+
+Log calls on request and worker threads only put the record on a queue;
+one listener thread formats and writes it, so a slow stdout or log file
+never stalls an upload and tracebacks are formatted off the request
+thread. Each line is a JSON object:
+
+    {"ts": "...", "level": "INFO", "logger": "uploader.folder", "msg": "...", "request_id": "..."}
+
+plus any `extra={...}` fields and "exc" for exceptions.
+
+Levels are per logger: `level` is the default, `levels` overrides it for
+single loggers ("uploader.folder=WARNING,graph_client=DEBUG"). Children
+inherit, so "uploader=WARNING" silences INFO on the whole upload path.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+import tracing
+
+FORMAT_JSON = "json"
+FORMAT_TEXT = "text"
+
+# Attributes every LogRecord has - anything else came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "request_tag"}
+
+_listener = None
+_handler = None
+
+
+class _RequestIdFilter(logging.Filter):
+    """Stamp the request ID while still on the logging thread (it lives in a contextvar)"""
+
+    def filter(self, record):
+        record.request_id = tracing.current_request_id()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and leaves formatting to the listener"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the args now (they may change later); the traceback is formatted by the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(request_tag)s %(message)s")
+
+    def format(self, record):
+        request_id = getattr(record, "request_id", None)
+        record.request_tag = f" [{request_id}]" if request_id else ""
+        return super().format(record)
+
+
+def parse_levels(levels):
+    """"uploader.folder=WARNING,graph_client=DEBUG" -> {"uploader.folder": "WARNING", ...}"""
+    parsed = {}
+    for item in (levels or "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def configure(level="INFO", levels="", fmt=FORMAT_JSON, stream=None, queue_size=10000):
+    """Route all logging through the queue to stream (stdout). Safe to call more than once."""
+    global _listener, _handler
+    if _handler is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if fmt == FORMAT_TEXT else JsonFormatter())
+
+    _handler = _NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    _handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped():
+    """Records discarded because the queue was full"""
+    return _handler.dropped if _handler else 0
@@ -0,0 +1,74 @@
+"""
+Admission control and the job queue limit: 429/503 with Retry-After, against the Graph simulator
+"""
+
+import os
+
+import pytest
+
+import onedrive_uploader as uploader
+from conftest import stored_file, wait_for
+
+
+@pytest.fixture
+def client():
+    return uploader.app.test_client()
+
+
+def post_stream(client, volunteer_id, filename, body):
+    return client.post(f"/api/upload/stream?volunteer_id={volunteer_id}&filename={filename}",
+                       data=body, content_type="application/octet-stream")
+
+
+def wait_until_uploaded(client, response):
+    """Let an accepted upload finish, so no Graph call outlives the test"""
+    assert response.status_code == 202
+    return wait_for(lambda: (lambda s: s if s["state"] in ("done", "failed") else None)(
+        client.get(response.json["status_url"]).json))
+
+
+def assert_busy(response, status_code):
+    assert response.status_code == status_code
+    assert response.headers["Retry-After"] == str(uploader.UPLOAD_RETRY_AFTER)
+    assert response.json["retry_after"] == uploader.UPLOAD_RETRY_AFTER
+
+
+def test_upload_over_the_concurrency_limit_gets_429(sim, client, monkeypatch):
+    monkeypatch.setattr(uploader.admission, "max_concurrent", 1)
+    with uploader.admission.admit(100):  # another upload still being received
+        assert_busy(post_stream(client, 51, "V51.csv", b"a,b\n1,2\n"), 429)
+    assert sim.stats["requests"] == 0
+
+    wait_until_uploaded(client, post_stream(client, 51, "V51.csv", b"a,b\n1,2\n"))
+
+
+def test_upload_over_the_byte_budget_gets_429(sim, client, monkeypatch):
+    monkeypatch.setattr(uploader.admission, "max_inflight_bytes", 10000)
+    with uploader.admission.admit(6000):
+        assert_busy(post_stream(client, 52, "V52.webm", os.urandom(5000)), 429)
+        # What still fits in the budget is admitted
+        fits = post_stream(client, 52, "V52.csv", os.urandom(3000))
+    wait_until_uploaded(client, fits)
+
+
+def test_upload_larger_than_the_budget_is_admitted_when_nothing_else_is_in_flight(sim, client, monkeypatch):
+    monkeypatch.setattr(uploader.admission, "max_inflight_bytes", 1000)
+    wait_for(lambda: uploader.upload_jobs.pending_bytes() == 0)
+    status = wait_until_uploaded(client, post_stream(client, 53, "V53.webm", os.urandom(5000)))
+    assert status["location"] == "onedrive"
+    assert stored_file(sim, "V53.webm")["size"] == 5000
+
+
+def test_upload_with_the_job_queue_full_gets_503_and_leaves_nothing_behind(sim, client, monkeypatch):
+    body = os.urandom(5000)
+    spooled = {name for name in os.listdir(uploader.SPOOL_DIR) if name.endswith(".part")}
+    monkeypatch.setattr(uploader.upload_jobs, "max_pending", 0)
+    assert_busy(post_stream(client, 54, "V54.webm", body), 503)
+    assert {name for name in os.listdir(uploader.SPOOL_DIR) if name.endswith(".part")} == spooled
+
+    # The refused upload was not journaled, so the retry is uploaded rather than answered as a duplicate
+    monkeypatch.setattr(uploader.upload_jobs, "max_pending", uploader.UPLOAD_QUEUE_SIZE)
+    retry = post_stream(client, 54, "V54.webm", body)
+    assert "duplicate" not in retry.json
+    wait_until_uploaded(client, retry)
+    stored_file(sim, "V54.webm")
@@ -0,0 +1,67 @@
+"""
+Circuit breaker around OneDrive: opening after failures, the half-open probe and closing again,
+against the Graph simulator
+"""
+
+import os
+import time
+
+import pytest
+
+import onedrive_uploader as uploader
+from circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN
+from conftest import stored_file, wait_for
+
+COOLDOWN = 0.5
+
+
+@pytest.fixture
+def breaker(sim, monkeypatch):
+    """A breaker with a short cool-down and the uploader's GET /me probe, in place of onedrive_breaker"""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=COOLDOWN, probe=uploader.probe_onedrive)
+    monkeypatch.setattr(uploader, "onedrive_breaker", breaker)
+    return breaker
+
+
+def upload(volunteer_id, filename):
+    """Upload a small file through the API; returns the finished job's status"""
+    client = uploader.app.test_client()
+    response = client.post(f"/api/upload/stream?volunteer_id={volunteer_id}&filename={filename}",
+                           data=os.urandom(2000), content_type="application/octet-stream")
+    assert response.status_code == 202
+    return wait_for(lambda: (lambda s: s if s["state"] in ("done", "failed") else None)(
+        client.get(response.json["status_url"]).json))
+
+
+def test_failures_open_the_circuit_and_uploads_skip_onedrive(sim, breaker):
+    sim.faults.update(error_rate=1.0, error_statuses=[500])
+    for n in range(2):
+        assert upload(81, f"V81-{n}.csv")["location"] == "local"
+    assert breaker.state == STATE_OPEN
+
+    requests_before = sim.stats["requests"]
+    assert upload(81, "V81-open.csv")["location"] == "local"
+    assert sim.stats["requests"] == requests_before  # not even a probe during the cool-down
+
+
+def test_failed_probe_reopens_the_circuit(sim, breaker):
+    sim.faults.update(error_rate=1.0, error_statuses=[500])
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(COOLDOWN)
+
+    requests_before = sim.stats["requests"]
+    assert upload(82, "V82.csv")["location"] == "local"
+    assert sim.stats["requests"] == requests_before + 1  # only the GET /me probe
+    assert breaker.state == STATE_OPEN and breaker.times_opened == 2
+
+
+def test_successful_probe_closes_the_circuit(sim, breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    time.sleep(COOLDOWN)
+
+    assert upload(83, "V83.csv")["location"] == "onedrive"
+    assert breaker.state == STATE_CLOSED and breaker.consecutive_failures == 0
+    stored_file(sim, "V83.csv")
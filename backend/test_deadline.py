@@ -0,0 +1,82 @@
+"""
+Upload deadlines: the budget starts at admission and bounds whole Graph calls
+"""
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import onedrive_uploader as uploader
+from conftest import wait_for
+from deadline import Deadline, DeadlineExceeded
+
+
+def test_spent_deadline_goes_local_without_counting_against_onedrive(sim):
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+
+    body, status_code = uploader.upload_with_fallback(61, "V61.csv", b"t,gsr\n", 6, "csv", deadline=deadline)
+
+    assert status_code == 200 and body["location"] == "local"
+    assert uploader.onedrive_breaker.consecutive_failures == 0
+    assert sim.stats["requests"] == 0
+
+
+def test_time_waiting_for_a_worker_counts_against_the_deadline(sim, monkeypatch):
+    monkeypatch.setattr(uploader, "UPLOAD_DEADLINE", 1.0)
+    mark_job_uploading = uploader.mark_job_uploading
+
+    def slow_to_start(job):
+        time.sleep(1.2)  # stands in for a long queue
+        mark_job_uploading(job)
+
+    monkeypatch.setattr(uploader, "mark_job_uploading", slow_to_start)
+    client = uploader.app.test_client()
+    response = client.post("/api/upload/stream?volunteer_id=62&filename=V62.webm", data=os.urandom(4000),
+                           content_type="application/octet-stream")
+    assert response.status_code == 202
+
+    status = wait_for(lambda: (lambda s: s if s["state"] in ("done", "failed") else None)(
+        client.get(response.json["status_url"]).json))
+    assert status["location"] == "local"
+    assert sim.stats["files_committed"] == 0
+
+
+@pytest.fixture
+def trickling_server():
+    """HTTP server that sends its response body one byte every 100 ms"""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    stop = threading.Event()
+
+    def serve():
+        connection, _ = listener.accept()
+        with connection:
+            connection.recv(65536)
+            connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 100\r\n\r\n")
+            for _ in range(100):
+                if stop.wait(0.1):
+                    break
+                try:
+                    connection.sendall(b" ")
+                except OSError:
+                    break
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}"
+    stop.set()
+    listener.close()
+
+
+def test_trickling_response_cannot_outlast_the_deadline(trickling_server):
+    pytest.importorskip("aiohttp")
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        uploader.graph_loop.run(uploader.async_graph.get(f"{trickling_server}/slow", auth=False,
+                                                         deadline=Deadline(0.5)))
+    # Every byte arrives well within the read timeout; only the deadline stops it
+    assert time.monotonic() - started < 2
@@ -0,0 +1,105 @@
+"""
+Duplicate uploads (Idempotency-Key and content hash), against the Graph simulator
+"""
+
+import os
+import threading
+
+import onedrive_uploader as uploader
+from circuit_breaker import STATE_OPEN
+from conftest import stored_file, wait_for
+
+
+def post_stream(client, volunteer_id, filename, body, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(f"/api/upload/stream?volunteer_id={volunteer_id}&filename={filename}",
+                       data=body, content_type="application/octet-stream", headers=headers)
+
+
+def wait_for_job(client, job_id):
+    return wait_for(lambda: (lambda s: s if s["state"] in ("done", "failed") else None)(
+        client.get(f"/api/jobs/{job_id}").json))
+
+
+def test_reusing_an_idempotency_key_for_other_content_is_422(sim):
+    client = uploader.app.test_client()
+    first = post_stream(client, 41, "V41.csv", b"a,b\n1,2\n", key="key-41")
+    assert first.status_code == 202
+    wait_for_job(client, first.json["job_id"])
+
+    reused = post_stream(client, 41, "V41.csv", b"a,b\n3,4\n", key="key-41")
+    assert reused.status_code == 422
+
+
+def test_repeat_of_the_same_content_returns_the_earlier_result(sim):
+    client = uploader.app.test_client()
+    body = os.urandom(5000)
+    first = post_stream(client, 42, "V42.webm", body)
+    assert wait_for_job(client, first.json["job_id"])["location"] == "onedrive"
+
+    repeat = post_stream(client, 42, "V42.webm", body)
+    assert repeat.status_code == 200
+    assert repeat.json["duplicate"] is True
+    assert repeat.json["item_id"] == stored_file(sim, "V42.webm")["id"]
+
+
+def test_repeat_is_uploaded_again_when_the_earlier_file_was_deleted(sim):
+    client = uploader.app.test_client()
+    body = os.urandom(5000)
+    first = post_stream(client, 43, "V43.webm", body)
+    wait_for_job(client, first.json["job_id"])
+    sim._remove_item(stored_file(sim, "V43.webm")["id"])
+
+    repeat = post_stream(client, 43, "V43.webm", body)
+    assert repeat.status_code == 202
+    assert "duplicate" not in repeat.json
+    wait_for_job(client, repeat.json["job_id"])
+    stored_file(sim, "V43.webm")
+
+
+def test_earlier_result_is_trusted_without_asking_onedrive_while_the_circuit_is_open(sim, monkeypatch):
+    client = uploader.app.test_client()
+    body = os.urandom(5000)
+    first = post_stream(client, 44, "V44.webm", body)
+    wait_for_job(client, first.json["job_id"])
+    requests_before = sim.stats["requests"]
+
+    monkeypatch.setattr(uploader.onedrive_breaker, "state", STATE_OPEN)
+    repeat = post_stream(client, 44, "V44.webm", body)
+    assert repeat.status_code == 200
+    assert repeat.json["duplicate"] is True
+    assert sim.stats["requests"] == requests_before
+
+
+def test_identical_requests_racing_past_the_lookup_queue_one_job(sim, monkeypatch):
+    lookup = uploader.find_earlier_upload
+    both_looked = threading.Barrier(2, timeout=10)
+    calls = []
+
+    def find_earlier_upload_together(*args, **kwargs):
+        # The first two lookups both finish (and miss) before either request is journaled
+        calls.append(args)
+        result = lookup(*args, **kwargs)
+        if len(calls) <= 2:
+            both_looked.wait()
+        return result
+
+    monkeypatch.setattr(uploader, "find_earlier_upload", find_earlier_upload_together)
+    body = os.urandom(5000)
+    responses = []
+
+    def send():
+        responses.append(post_stream(uploader.app.test_client(), 45, "V45.webm", body))
+
+    threads = [threading.Thread(target=send) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(response.status_code for response in responses) == [202, 202]
+    job_ids = {response.json["job_id"] for response in responses}
+    assert len(job_ids) == 1
+    assert [response.json.get("duplicate", False) for response in responses].count(True) == 1
+    wait_for_job(uploader.app.test_client(), job_ids.pop())
+    stored_file(sim, "V45.webm")
@@ -0,0 +1,196 @@
+"""
+Regression tests for the upload path, run against graph_simulator.py in-process
+
+Covered: QuickXorHash, the 320 KiB / 60 MiB chunk rules, resuming an
+upload session after a 416 or a dropped connection, recovery from
+429 + Retry-After, and a session upload through the job queue. The
+simulator fixtures live in conftest.py.
+
+Run from the repository root:  python -m pytest backend
+"""
+
+import base64
+import hashlib
+import os
+import time
+
+import pytest
+import requests
+
+import onedrive_uploader as uploader
+from chunk_sizer import AdaptiveChunkSizer, CHUNK_UNIT, GRAPH_MAX_CHUNK
+from conftest import stored_file, wait_for
+from quickxor import QuickXorHash
+
+AUTH = {"Authorization": "Bearer simulator"}
+
+
+def create_session(sim, name="file.bin"):
+    response = requests.post(f"{sim.base_url}/v1.0/me/drive/items/root:/{name}:/createUploadSession",
+                             json={"item": {"@microsoft.graph.conflictBehavior": "rename"}}, headers=AUTH)
+    assert response.status_code == 200
+    return response.json()["uploadUrl"]
+
+
+def put_chunk(upload_url, data, start, total):
+    return requests.put(upload_url, data=data,
+                        headers={"Content-Range": f"bytes {start}-{start + len(data) - 1}/{total}"})
+
+
+# ---- QuickXorHash ----
+
+@pytest.mark.parametrize("data, expected", [
+    (b"", "AAAAAAAAAAAAAAAAAAAAAAAAAAA="),
+    (b"The quick brown fox jumps over the lazy dog", "bMSlbysmxJL6S75XwfMcQZOpcr4="),
+    (bytes((i * 7 + 3) % 251 for i in range(1000)), "XwCwWw+SPjp9D8+NCRe+PKCPYvw="),
+])
+def test_quickxor_known_vectors(data, expected):
+    assert QuickXorHash(data).b64digest() == expected
+
+
+def test_quickxor_incremental_matches_one_shot():
+    data = os.urandom(3 * CHUNK_UNIT + 4321)
+    hasher = QuickXorHash()
+    for start, end in [(0, 1), (1, 160), (160, 161), (161, CHUNK_UNIT + 7), (CHUNK_UNIT + 7, len(data))]:
+        hasher.update(data[start:end])
+    assert hasher.b64digest() == QuickXorHash(data).b64digest()
+
+
+@pytest.mark.parametrize("head", [1, 159, 160, 161, 317])
+def test_quickxor_buffer_types_and_row_offsets(head):
+    # A head shorter than, equal to and longer than the rest of the first row
+    data = os.urandom(5 * 160 + 37)
+    expected = QuickXorHash(data).b64digest()
+    for wrap in (bytes, bytearray, memoryview):
+        hasher = QuickXorHash(wrap(data[:head]))
+        hasher.update(wrap(data[head:]))
+        assert hasher.b64digest() == expected
+
+
+# ---- chunk rules ----
+
+def test_chunk_sizer_stays_on_the_graph_grid():
+    sizer = AdaptiveChunkSizer(max_size=1000 * CHUNK_UNIT, initial_size=CHUNK_UNIT + 1)
+    assert sizer.max_size == GRAPH_MAX_CHUNK
+    for seconds in [0.001] * 20 + [30.0] * 5 + [0.5] * 5:
+        size = sizer.record_success(sizer.size, seconds)
+        assert size % CHUNK_UNIT == 0
+        assert CHUNK_UNIT <= size <= GRAPH_MAX_CHUNK
+    for _ in range(10):
+        assert sizer.record_failure() % CHUNK_UNIT == 0
+    assert sizer.size == CHUNK_UNIT
+
+
+def test_simulator_rejects_chunks_off_the_320_kib_grid(sim):
+    total = 4 * CHUNK_UNIT
+    upload_url = create_session(sim)
+    assert put_chunk(upload_url, os.urandom(CHUNK_UNIT + 1), 0, total).status_code == 400
+
+
+def test_simulator_rejects_chunks_over_60_mib(sim):
+    total = GRAPH_MAX_CHUNK + 2 * CHUNK_UNIT
+    upload_url = create_session(sim)
+    assert put_chunk(upload_url, bytes(GRAPH_MAX_CHUNK + CHUNK_UNIT), 0, total).status_code == 400
+
+
+def test_short_final_chunk_completes_with_matching_hash(sim):
+    data = os.urandom(CHUNK_UNIT + 1000)
+    upload_url = create_session(sim)
+    assert put_chunk(upload_url, data[:CHUNK_UNIT], 0, len(data)).status_code == 202
+    response = put_chunk(upload_url, data[CHUNK_UNIT:], CHUNK_UNIT, len(data))
+    assert response.status_code == 201
+    assert response.json()["file"]["hashes"]["quickXorHash"] == QuickXorHash(data).b64digest()
+
+
+# ---- resuming ----
+
+def test_resend_of_a_stored_chunk_gets_416_and_resumes_from_next_expected_range(sim):
+    data = os.urandom(2 * CHUNK_UNIT + 10)
+    upload_url = create_session(sim)
+    assert put_chunk(upload_url, data[:CHUNK_UNIT], 0, len(data)).status_code == 202
+
+    # The response was lost: the client sends the same range again
+    assert put_chunk(upload_url, data[:CHUNK_UNIT], 0, len(data)).status_code == 416
+    status = requests.get(upload_url).json()
+    assert status["nextExpectedRanges"] == [f"{CHUNK_UNIT}-"]
+
+    assert put_chunk(upload_url, data[CHUNK_UNIT:2 * CHUNK_UNIT], CHUNK_UNIT, len(data)).status_code == 202
+    response = put_chunk(upload_url, data[2 * CHUNK_UNIT:], 2 * CHUNK_UNIT, len(data))
+    assert response.status_code == 201
+    assert response.json()["file"]["hashes"]["quickXorHash"] == QuickXorHash(data).b64digest()
+
+
+@pytest.mark.parametrize("after_commit", [False, True], ids=["before-commit", "after-commit"])
+def test_upload_resumes_after_a_dropped_chunk(sim, tmp_path, after_commit):
+    data = os.urandom(3 * CHUNK_UNIT + 777)
+    spooled = tmp_path / "drop.webm"
+    spooled.write_bytes(data)
+    sim.faults.update(drop_next=1, drop_after_commit=after_commit, paths="^/upload/")
+
+    # A spool file object goes through the memory-mapped chunk source
+    with open(spooled, "rb") as f:
+        result = uploader.upload_file_resumable(31, "drop.webm", f, len(data))
+
+    assert sim.stats["dropped"] == 1
+    assert result and result["integrity"] == "verified"
+    item = stored_file(sim, "drop.webm")
+    assert item["size"] == len(data)
+    assert item["hash"] == QuickXorHash(data).b64digest()
+
+
+# ---- throttling ----
+
+def test_upload_waits_out_429_retry_after(sim):
+    data = os.urandom(2 * CHUNK_UNIT + 5)
+    sim.faults.update(throttle_next=2, retry_after=1, paths="^/upload/")
+
+    started = time.monotonic()
+    result = uploader.upload_file_resumable(32, "throttled.webm", data, len(data))
+    elapsed = time.monotonic() - started
+
+    assert sim.stats["throttled"] == 2
+    assert sim.stats["by_status"].get("429") == 2
+    assert elapsed >= 1.0  # Retry-After was honoured, not retried immediately
+    assert result and result["integrity"] == "verified"
+    assert stored_file(sim, "throttled.webm")["hash"] == QuickXorHash(data).b64digest()
+
+
+# ---- through the API ----
+
+def test_session_upload_completes_with_manifest(sim):
+    client = uploader.app.test_client()
+    csv = b"t,gsr\n" + b"0.1,512\n" * 2000
+    video = os.urandom(2 * CHUNK_UNIT + 99)
+    response = client.post("/api/sessions", json={"volunteer_id": 33, "files": [
+        {"filename": "V33.csv", "size": len(csv), "sha1": hashlib.sha1(csv).hexdigest()},
+        {"filename": "V33.webm", "size": len(video)}
+    ]})
+    assert response.status_code == 201
+    session = response.json
+    urls = {part["filename"]: part["upload_url"] for part in session["files"]}
+
+    for filename, body in [("V33.webm", video), ("V33.csv", csv)]:
+        accepted = client.put(urls[filename], data=body, content_type="application/octet-stream")
+        assert accepted.status_code == 202
+
+    def finished():
+        status = client.get(session["status_url"]).json
+        return status if status["state"] in ("complete", "incomplete") else None
+
+    status = wait_for(finished)
+    assert status["state"] == "complete", status
+    assert stored_file(sim, "V33.webm")["hash"] == QuickXorHash(video).b64digest()
+    assert stored_file(sim, "V33.csv")["size"] == len(csv)
+    stored_file(sim, f"session-{session['session_id']}.json")
+
+
+def test_json_upload_keeps_only_the_file_name(sim):
+    client = uploader.app.test_client()
+    csv = b"t,gsr\n0.1,512\n"
+    response = client.post("/api/upload", json={
+        "volunteer_id": 34, "filename": "../../outside/V34.csv", "file_data": base64.b64encode(csv).decode()
+    })
+    assert response.status_code == 202
+    assert response.json["file"] == "V34.csv"
+    wait_for(lambda: client.get(response.json["status_url"]).json["state"] == "done")
+    assert stored_file(sim, "V34.csv")["size"] == len(csv)
@@ -0,0 +1,116 @@
+"""
+Upload journal: handing over entries of dead processes, and resuming their uploads against the Graph simulator
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import textwrap
+import time
+import uuid
+
+import requests
+
+import onedrive_uploader as uploader
+from chunk_sizer import CHUNK_UNIT
+from conftest import stored_file, wait_for
+from quickxor import QuickXorHash
+from upload_journal import UploadJournal
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Journals one upload from a separate process, then waits for its stdin to close
+RECORD_IN_CHILD = textwrap.dedent("""
+    import sys
+    from upload_journal import UploadJournal
+    path, job_id, volunteer_id, filename, file_type, spool_path, size, sha1, quick_xor_hash = sys.argv[1:]
+    UploadJournal(path).record(job_id, volunteer_id, filename, file_type, spool_path, int(size),
+                               sha1=sha1, quick_xor_hash=quick_xor_hash)
+    print("recorded", flush=True)
+    sys.stdin.read()
+""")
+
+
+def record_in_child(path, job_id, volunteer_id=60, filename="V60.csv", file_type="csv", spool_path="",
+                    size=0, sha1=None, quick_xor_hash=""):
+    """Journal an entry owned by a child process; returns the running child (close its stdin to end it)"""
+    child = subprocess.Popen(
+        [sys.executable, "-c", RECORD_IN_CHILD, path, job_id, str(volunteer_id), filename, file_type,
+         spool_path, str(size), sha1 or uuid.uuid4().hex, quick_xor_hash],
+        cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    )
+    assert child.stdout.readline().strip() == "recorded"
+    return child
+
+
+def end(child):
+    child.stdin.close()
+    child.wait(10)
+
+
+def test_only_entries_of_dead_processes_are_claimed(tmp_path):
+    path = str(tmp_path / "journal.db")
+    dead = record_in_child(path, "dead")
+    end(dead)
+    alive = record_in_child(path, "alive")
+    journal = UploadJournal(path)
+    journal.record("ours", 60, "V60.webm", "video", "", 0, sha1="ours")
+    try:
+        claimed = journal.claim_orphans(started_at=0)
+        assert [entry["job_id"] for entry in claimed] == ["dead"]
+        assert journal.get("dead")["owner_pid"] == os.getpid()
+        assert journal.get("alive")["owner_pid"] == alive.pid
+    finally:
+        end(alive)
+
+    # Once its process is gone, the other entry is free to take as well
+    assert [entry["job_id"] for entry in journal.claim_orphans(started_at=0)] == ["alive"]
+
+
+def test_entry_of_an_earlier_process_with_our_pid_is_claimed(tmp_path):
+    # PIDs repeat (PID 1 in a container): an entry with our PID from before we started is not ours
+    journal = UploadJournal(str(tmp_path / "journal.db"))
+    journal.record("before-restart", 60, "V60.webm", "video", "", 0, sha1="a")
+    started_at = time.time()
+    journal.record("this-run", 60, "V60.csv", "csv", "", 0, sha1="b")
+    claimed = journal.claim_orphans(started_at)
+    assert [entry["job_id"] for entry in claimed] == ["before-restart"]
+
+
+def test_an_orphan_is_claimed_by_one_process_only(tmp_path):
+    path = str(tmp_path / "journal.db")
+    end(record_in_child(path, "orphan"))
+    first, second = UploadJournal(path), UploadJournal(path)
+    assert len(first.claim_orphans(started_at=0)) == 1
+    assert second.claim_orphans(started_at=0) == []
+
+
+def test_upload_of_a_killed_process_resumes_from_its_session(sim):
+    data = os.urandom(3 * CHUNK_UNIT + 123)
+    job_id = uuid.uuid4().hex
+    spool_path = os.path.join(uploader.SPOOL_DIR, f"{job_id}.part")
+    with open(spool_path, "wb") as f:
+        f.write(data)
+
+    # A worker journaled the upload, sent the first chunk and was killed
+    worker = record_in_child(uploader.UPLOAD_JOURNAL_FILE, job_id, 61, "V61.webm", "video", spool_path,
+                             len(data), hashlib.sha1(data).hexdigest(), QuickXorHash(data).b64digest())
+    folder_id = uploader.resolve_volunteer_folder(61)
+    upload_url = uploader.graph_loop.run(uploader.create_upload_session_async(61, folder_id, "V61.webm",
+                                                                              job_id=job_id))
+    first = requests.put(upload_url, data=data[:CHUNK_UNIT],
+                         headers={"Content-Range": f"bytes 0-{CHUNK_UNIT - 1}/{len(data)}"})
+    assert first.status_code == 202
+    uploader.upload_journal.set_offset(job_id, CHUNK_UNIT)
+    end(worker)
+
+    uploader.resume_journaled_uploads()
+    status = wait_for(lambda: (lambda s: s if s and s["state"] in ("done", "failed") else None)(
+        uploader.upload_journal.job_status(job_id)))
+
+    assert status["location"] == "onedrive" and status["integrity"] == "verified"
+    assert sim.stats["bytes_received"] == len(data)  # the first chunk was not sent again
+    assert stored_file(sim, "V61.webm")["hash"] == QuickXorHash(data).b64digest()
+    assert uploader.upload_journal.get(job_id) is None
+    assert not os.path.exists(spool_path)
@@ -0,0 +1,136 @@
+"""
+Live uploads against the Graph simulator: segment order, and streaming to OneDrive while recording
+"""
+
+import os
+
+import pytest
+
+import live_uploads
+import onedrive_uploader as uploader
+from chunk_sizer import CHUNK_UNIT
+from circuit_breaker import STATE_OPEN
+from conftest import stored_file, wait_for
+from quickxor import QuickXorHash
+
+SEGMENT = 200 * 1024  # not a multiple of 320 KiB, so runs and segments do not line up
+
+
+@pytest.fixture
+def client():
+    return uploader.app.test_client()
+
+
+def start_live(client, filename):
+    """Create a live upload and wait until its OneDrive session is open (so no call outlives the test)"""
+    response = client.post("/api/live", json={"volunteer_id": 71, "filename": filename})
+    assert response.status_code == 201
+    live_id = response.json["live_id"]
+    wait_for(lambda: uploader.live_uploads.get(live_id)["upload_url"])
+    return live_id
+
+
+def put_segment(client, live_id, seq, data):
+    return client.put(f"/api/live/{live_id}/segments/{seq}", data=data, content_type="application/octet-stream")
+
+
+def finish_and_wait(client, live_id, segments):
+    response = client.post(f"/api/live/{live_id}/finish", json={"segments": segments})
+    assert response.status_code == 202, response.json
+    return wait_for(lambda: (lambda s: s if s["state"] in ("done", "failed") else None)(
+        client.get(response.json["status_url"]).json))
+
+
+def test_repeated_and_early_segments_are_not_appended(sim, client):
+    live_id = start_live(client, "V71-order.webm")
+    first, second = os.urandom(1000), os.urandom(1000)
+
+    assert put_segment(client, live_id, 0, first).status_code == 200
+    repeat = put_segment(client, live_id, 0, first)
+    assert repeat.status_code == 200 and repeat.json["duplicate"] is True
+    early = put_segment(client, live_id, 2, os.urandom(1000))
+    assert early.status_code == 409 and early.json["next_seq"] == 1
+    assert put_segment(client, live_id, 1, second).status_code == 200
+
+    status = finish_and_wait(client, live_id, 2)
+    assert status["location"] == "onedrive" and status["size"] == 2000
+    assert stored_file(sim, "V71-order.webm")["hash"] == QuickXorHash(first + second).b64digest()
+
+
+def test_finish_refuses_until_every_segment_arrived(sim, client):
+    live_id = start_live(client, "V71-missing.webm")
+    assert put_segment(client, live_id, 0, b"x" * 100).status_code == 200
+    response = client.post(f"/api/live/{live_id}/finish", json={"segments": 2})
+    assert response.status_code == 409
+    assert uploader.live_uploads.get(live_id)["state"] == live_uploads.LIVE_OPEN
+    client.delete(f"/api/live/{live_id}")
+
+
+def test_recording_streams_to_onedrive_and_finish_sends_only_the_rest(sim, client, monkeypatch):
+    data = os.urandom(3 * CHUNK_UNIT + 5000)
+    live_id = start_live(client, "V71.webm")
+
+    segments = [data[start:start + SEGMENT] for start in range(0, len(data), SEGMENT)]
+    for seq, segment in enumerate(segments):
+        assert put_segment(client, live_id, seq, segment).status_code == 200
+
+    # Every full 320 KiB run is on OneDrive before recording stops; nothing is committed yet
+    aligned = len(data) - len(data) % CHUNK_UNIT
+    wait_for(lambda: uploader.live_uploads.get(live_id)["uploaded"] == aligned)
+    assert sim.stats["bytes_received"] == aligned
+    assert sim.stats["files_committed"] == 0
+
+    # Finishing uses the hashes kept per segment - the recording is not read back
+    catch_up = live_uploads._SpoolHashes.catch_up
+    read_back = []
+
+    def spy(hashes, spool_path, size):
+        if hashes.size != size:
+            read_back.append(size - hashes.size)
+        return catch_up(hashes, spool_path, size)
+
+    monkeypatch.setattr(live_uploads._SpoolHashes, "catch_up", spy)
+    status = finish_and_wait(client, live_id, len(segments))
+
+    assert read_back == []
+    assert status["location"] == "onedrive" and status["integrity"] == "verified"
+    assert sim.stats["bytes_received"] == len(data)  # the job resumed the session, nothing was sent twice
+    assert stored_file(sim, "V71.webm")["hash"] == QuickXorHash(data).b64digest()
+
+
+def test_recording_is_uploaded_whole_when_its_session_expired(sim, client):
+    data = os.urandom(2 * CHUNK_UNIT + 777)
+    live_id = start_live(client, "V71-expired.webm")
+    sim.sessions.clear()
+
+    segments = [data[start:start + SEGMENT] for start in range(0, len(data), SEGMENT)]
+    for seq, segment in enumerate(segments):
+        assert put_segment(client, live_id, seq, segment).status_code == 200
+    wait_for(lambda: uploader.live_uploads.get(live_id)["upload_url"] is None)
+
+    status = finish_and_wait(client, live_id, len(segments))
+    assert status["location"] == "onedrive"
+    assert stored_file(sim, "V71-expired.webm")["hash"] == QuickXorHash(data).b64digest()
+
+
+def test_recording_is_only_spooled_while_the_circuit_is_open(sim, client):
+    data = os.urandom(CHUNK_UNIT + 4321)
+    uploader.onedrive_breaker.state = STATE_OPEN
+    response = client.post("/api/live", json={"volunteer_id": 71, "filename": "V71-open.webm"})
+    live_id = response.json["live_id"]
+    assert put_segment(client, live_id, 0, data).status_code == 200
+    assert uploader.live_uploads.get(live_id)["upload_url"] is None
+    assert sim.stats["requests"] == 0
+
+    uploader.onedrive_breaker.record_success()  # OneDrive is back before the recording ends
+    status = finish_and_wait(client, live_id, 1)
+    assert status["location"] == "onedrive"
+    assert stored_file(sim, "V71-open.webm")["hash"] == QuickXorHash(data).b64digest()
+
+
+def test_abandoning_cancels_the_upload_session(sim, client):
+    live_id = start_live(client, "V71-abandoned.webm")
+    assert put_segment(client, live_id, 0, os.urandom(CHUNK_UNIT)).status_code == 200
+    assert client.delete(f"/api/live/{live_id}").status_code == 200
+    wait_for(lambda: not sim.sessions)
+    assert sim.stats["files_committed"] == 0
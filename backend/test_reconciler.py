@@ -0,0 +1,81 @@
+"""
+Reconciler passes against the Graph simulator: the manifest and backing off while uploads run
+"""
+
+import json
+import os
+
+import onedrive_uploader as uploader
+from conftest import stored_file, wait_for
+from live_uploads import LiveUploadStore
+from quickxor import QuickXorHash
+from reconciler import Reconciler
+from upload_journal import UploadJournal
+
+
+def make_reconciler(tmp_path):
+    return Reconciler([str(tmp_path / "uploads")], str(tmp_path / "manifest.json"),
+                      upload_fn=uploader.reconcile_upload, is_healthy=lambda: True,
+                      is_busy=uploader.uploads_in_progress, max_workers=2, bytes_per_second=0)
+
+
+def save_locally(tmp_path, folder, filename, data):
+    directory = tmp_path / "uploads" / folder
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / filename).write_bytes(data)
+    return directory / filename
+
+
+def test_pass_pushes_missing_files_and_records_them_in_the_manifest(sim, tmp_path):
+    wait_for(lambda: not uploader.uploads_in_progress())
+    video = os.urandom(50000)
+    save_locally(tmp_path, "V51", "V51.webm", video)
+    save_locally(tmp_path, "V51", "V51.csv", b"t,gsr\n0.1,512\n")
+    save_locally(tmp_path, "notes", "todo.txt", b"not a volunteer folder")
+    reconciler = make_reconciler(tmp_path)
+
+    assert reconciler.run_once() == 2
+    assert stored_file(sim, "V51.webm")["hash"] == QuickXorHash(video).b64digest()
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert sorted(entry["name"] for entry in manifest.values()) == ["V51.csv", "V51.webm"]
+
+    # The manifest survives a restart: nothing is scanned as pending again
+    requests_before = sim.stats["requests"]
+    assert make_reconciler(tmp_path).run_once() == 0
+    assert sim.stats["requests"] == requests_before
+
+
+def test_pass_waits_while_another_worker_has_a_live_upload_open(sim, tmp_path):
+    wait_for(lambda: not uploader.uploads_in_progress())
+    save_locally(tmp_path, "V52", "V52.csv", b"t,gsr\n0.2,600\n")
+    reconciler = make_reconciler(tmp_path)
+
+    # A second store on the same file stands in for another worker process
+    other_worker = LiveUploadStore(uploader.LIVE_UPLOADS_FILE, str(tmp_path))
+    live = other_worker.create(52, "V52.webm", "video")
+    try:
+        assert reconciler.run_once() == 0
+        assert sim.stats["files_committed"] == 0
+    finally:
+        other_worker.abandon(live["live_id"])
+        other_worker.close()
+
+    assert reconciler.run_once() == 1
+    stored_file(sim, "V52.csv")
+
+
+def test_pass_waits_while_another_worker_has_uploads_journaled(sim, tmp_path):
+    wait_for(lambda: not uploader.uploads_in_progress())
+    save_locally(tmp_path, "V53", "V53.csv", b"t,gsr\n0.3,700\n")
+    reconciler = make_reconciler(tmp_path)
+
+    other_worker = UploadJournal(uploader.UPLOAD_JOURNAL_FILE)
+    other_worker.record("other-worker-job", 53, "V53.webm", "video", str(tmp_path / "spooled"), 1000)
+    try:
+        assert reconciler.run_once() == 0
+        assert sim.stats["files_committed"] == 0
+    finally:
+        other_worker.remove("other-worker-job")
+        other_worker.close()
+
+    assert reconciler.run_once() == 1
@@ -0,0 +1,85 @@
+"""
+TokenManager single-flight refresh: concurrent callers and other processes share one refresh
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+import token_manager
+from token_manager import TokenManager
+
+
+class FakeMicrosoft:
+    """Stands in for msal.PublicClientApplication; counts refresh round trips"""
+
+    calls = 0
+    lock = threading.Lock()
+
+    def __init__(self, client_id, authority=None, token_cache=None):
+        pass
+
+    def acquire_token_by_refresh_token(self, refresh_token, scopes):
+        with FakeMicrosoft.lock:
+            FakeMicrosoft.calls += 1
+            number = FakeMicrosoft.calls
+        time.sleep(0.2)  # a slow round trip, so the other callers pile up behind it
+        return {"access_token": f"fresh-{number}", "refresh_token": f"rotated-{number}", "expires_in": 3600}
+
+
+@pytest.fixture
+def token_file(tmp_path, monkeypatch):
+    FakeMicrosoft.calls = 0
+    monkeypatch.setattr(token_manager.msal, "PublicClientApplication", FakeMicrosoft)
+    path = tmp_path / "tokens.json"
+    # Inside the refresh margin: the next get_token() has to refresh
+    path.write_text(json.dumps({"access_token": "stale", "refresh_token": "original",
+                                "expires_at": time.time() + 60}))
+    return str(path)
+
+
+def make_manager(token_file):
+    manager = TokenManager(token_file, "client", "https://login.example/common", ["Files.ReadWrite"],
+                           refresh_margin=300)
+    assert manager.load()
+    return manager
+
+
+def test_concurrent_callers_share_one_refresh(token_file):
+    manager = make_manager(token_file)
+    barrier = threading.Barrier(8)
+    tokens = []
+
+    def call():
+        barrier.wait()
+        tokens.append(manager.get_token())
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert FakeMicrosoft.calls == 1
+    assert tokens == ["fresh-1"] * 8
+    saved = json.loads(open(token_file, encoding="utf-8").read())
+    assert saved["access_token"] == "fresh-1" and saved["refresh_token"] == "rotated-1"
+
+
+def test_caller_holding_a_replaced_token_does_not_refresh_again(token_file):
+    manager = make_manager(token_file)
+    assert manager.refresh(stale_token="stale")
+    # A request that got a 401 with the old token asks again after the refresh
+    assert manager.refresh(stale_token="stale")
+    assert FakeMicrosoft.calls == 1
+    assert manager.get_token() == "fresh-1"
+
+
+def test_token_refreshed_by_another_process_is_used(token_file):
+    # Each manager stands for one worker process sharing the token file
+    first, second = make_manager(token_file), make_manager(token_file)
+    assert first.get_token() == "fresh-1"
+    assert second.get_token() == "fresh-1"
+    assert FakeMicrosoft.calls == 1
@@ -0,0 +1,297 @@
+"""
+OneDrive access-token manager
+
+Replaces the module-level access_token / tokens_data globals with one
+object shared by all request and job threads:
+
+- One msal.PublicClientApplication (created on first refresh) with one
+  SerializableTokenCache, persisted inside the token file
+- Proactive refresh on a background thread refresh_margin seconds before
+  expiry, so uploads never start with an expired token
+- Single-flight refresh: one thread talks to Microsoft, concurrent callers
+  wait for its result instead of refreshing again
+- Token file written atomically (temp file + os.replace)
+- Shared by worker processes: a refresh holds an flock on
+  "<token file>.lock" and first re-reads the file, so when another
+  process already refreshed, its token is used instead of refreshing
+  again; get_token() picks up tokens other processes wrote (checked at
+  most every reload_interval seconds)
+
+The token file keeps the format written by device_auth.py (an MSAL token
+response plus "timestamp"); "expires_at" and "msal_cache" are added.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import msal
+
+from process_lock import FileLock
+
+log = logging.getLogger("token_manager")
+
+
+class TokenManager:
+    """Holds the current Graph access token and keeps it fresh"""
+
+    def __init__(self, token_file, client_id, authority, scopes, refresh_margin=300, observer=None,
+                 reload_interval=1.0):
+        """observer: optional callable(seconds, success) called after each refresh round trip"""
+        self.token_file = token_file
+        self.client_id = client_id
+        self.authority = authority
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.observer = observer
+        self.reload_interval = reload_interval
+
+        self.cache = msal.SerializableTokenCache()
+        self._app = None
+        self._tokens = {}
+        self._access_token = None
+        self._expires_at = None  # epoch seconds, None if unknown
+
+        self._refresh_lock = threading.Lock()
+        self._file_lock = FileLock(token_file + ".lock")
+        self._file_mtime = None  # st_mtime_ns of the token file we last read or wrote
+        self._checked_at = 0.0
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.refresh_count = 0
+        self.last_refresh_at = None
+        self.last_error = None
+
+    # ---- loading / saving ----
+
+    def load(self):
+        """Load tokens from the token file. Returns True if an access token is available."""
+        try:
+            mtime = os.stat(self.token_file).st_mtime_ns
+        except OSError:
+            return False
+
+        try:
+            with open(self.token_file, "r", encoding="utf-8") as f:
+                tokens = json.load(f)
+        except Exception as e:
+            log.error("Error loading tokens: %s", e)
+            return False
+        reloaded = self._file_mtime is not None
+        self._file_mtime = mtime
+
+        if tokens.get("msal_cache"):
+            self.cache.deserialize(tokens["msal_cache"])
+
+        self._tokens = tokens
+        self._access_token = tokens.get("access_token")
+        self._expires_at = self._read_expiry(tokens)
+
+        if self._access_token:
+            if reloaded:
+                log.debug("Tokens reloaded from %s", self.token_file)
+            else:
+                log.info("Tokens loaded successfully")
+            return True
+        return False
+
+    def _reload_if_changed(self, force=False):
+        """Re-read the token file if another process replaced it. Returns True if it was re-read."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.token_file).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self._file_mtime and self.load()
+
+    @staticmethod
+    def _read_expiry(tokens):
+        """Work out when the access token expires from the saved token response"""
+        if tokens.get("expires_at"):
+            return float(tokens["expires_at"])
+        if tokens.get("expires_in") and tokens.get("timestamp"):
+            try:
+                issued = datetime.fromisoformat(tokens["timestamp"]).timestamp()
+                return issued + int(tokens["expires_in"])
+            except ValueError:
+                return None
+        return None
+
+    def _save(self):
+        """Write the token file atomically so readers never see a partial file"""
+        tokens = dict(self._tokens)
+        tokens["timestamp"] = datetime.now().isoformat()
+        tokens["expires_at"] = self._expires_at
+        if self.cache.has_state_changed:
+            tokens["msal_cache"] = self.cache.serialize()
+
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tokens-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(tokens, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.token_file)
+            self._file_mtime = os.stat(self.token_file).st_mtime_ns
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._tokens = tokens
+
+    # ---- token access ----
+
+    def has_token(self):
+        self._reload_if_changed()
+        return bool(self._access_token)
+
+    def seconds_left(self):
+        """Seconds until the access token expires, or None if unknown"""
+        if self._expires_at is None:
+            return None
+        return self._expires_at - time.time()
+
+    def _needs_refresh(self):
+        left = self.seconds_left()
+        return left is not None and left <= self.refresh_margin
+
+    def get_token(self):
+        """
+        Return a valid access token. If the token is inside the refresh
+        margin (e.g. the background thread is behind), refresh first.
+        """
+        self._reload_if_changed()
+        token = self._access_token
+        if token and self._needs_refresh():
+            self.refresh(stale_token=token)
+            token = self._access_token
+        return token
+
+    def _get_app(self):
+        # Building the app does authority discovery over the network, so do it once, lazily
+        if self._app is None:
+            self._app = msal.PublicClientApplication(
+                self.client_id,
+                authority=self.authority,
+                token_cache=self.cache
+            )
+        return self._app
+
+    def refresh(self, stale_token=None):
+        """
+        Refresh the access token (single-flight).
+
+        stale_token: the token the caller saw fail / expire. If another
+        thread or process already replaced it while this one waited for
+        the lock, no second refresh is made.
+        """
+        with self._refresh_lock, self._file_lock:
+            reloaded = self._reload_if_changed(force=True)
+            if stale_token is not None and self._access_token != stale_token and not self._needs_refresh():
+                return True
+            if reloaded and self.seconds_left() is not None and not self._needs_refresh():
+                log.info("Token was refreshed by another process")
+                self._wakeup.set()
+                return True
+
+            refresh_token = self._tokens.get("refresh_token")
+            if not refresh_token:
+                log.warning("No refresh token available")
+                self.last_error = "No refresh token available"
+                return False
+
+            started = time.monotonic()
+            try:
+                result = self._get_app().acquire_token_by_refresh_token(refresh_token, scopes=self.scopes)
+            except Exception as e:
+                log.error("Error refreshing token: %s", e)
+                self.last_error = str(e)
+                self._observe(started, False)
+                return False
+            self._observe(started, "access_token" in result)
+
+            if "access_token" not in result:
+                log.error("Failed to refresh token: %s", result.get("error_description"))
+                self.last_error = result.get("error_description") or result.get("error")
+                return False
+
+            self._tokens["access_token"] = result["access_token"]
+            # Microsoft rotates refresh tokens - always keep the newest one
+            if result.get("refresh_token"):
+                self._tokens["refresh_token"] = result["refresh_token"]
+            if result.get("expires_in"):
+                self._tokens["expires_in"] = result["expires_in"]
+                self._expires_at = time.time() + int(result["expires_in"])
+
+            self._access_token = result["access_token"]
+            self.refresh_count += 1
+            self.last_refresh_at = time.time()
+            self.last_error = None
+
+            try:
+                self._save()
+            except Exception as e:
+                log.error("Error saving refreshed tokens: %s", e)
+
+            log.info("Token refreshed successfully")
+            self._wakeup.set()
+            return True
+
+    def _observe(self, started, success):
+        if self.observer:
+            self.observer(time.monotonic() - started, success)
+
+    # ---- background refresh ----
+
+    def start(self, retry_interval=60):
+        """Start the background thread that refreshes before expiry"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(retry_interval,), name="token-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self, retry_interval):
+        while not self._stop.is_set():
+            wait = retry_interval
+            # Started before sign-in, or another process saved new tokens
+            self._reload_if_changed(force=True)
+            if self._tokens.get("refresh_token"):
+                left = self.seconds_left()
+                if left is None or left <= self.refresh_margin:
+                    # Expiring (or expiry unknown) - refresh now, re-plan if that worked
+                    if self.refresh() and self.seconds_left() is not None:
+                        continue
+                else:
+                    wait = left - self.refresh_margin
+
+            self._wakeup.clear()
+            self._wakeup.wait(timeout=wait)
+
+    def status(self):
+        left = self.seconds_left()
+        return {
+            "has_token": self.has_token(),
+            "expires_in": int(left) if left is not None else None,
+            "refresh_count": self.refresh_count,
+            "last_refresh_at": self.last_refresh_at,
+            "last_error": self.last_error
+        }
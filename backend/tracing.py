@@ -0,0 +1,218 @@
+"""
+Span tracing for uploads
+
+Every upload request gets a request ID; while a Trace is active, timed
+spans are recorded for each stage (spooling, queue wait, folder lookup,
+createUploadSession, token refresh, every chunk PUT, local fallback).
+A trace follows the upload from the Flask request thread into the job
+worker: the job activates the same Trace.
+
+Finished spans are
+- aggregated per name on the Trace (Trace.timing(), for debug responses)
+- written by a SpanExporter, if one is configured, as JSON lines or as
+  Chrome trace events (load the file in chrome://tracing or ui.perfetto.dev)
+
+With no active trace, span() is a no-op.
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+EXPORT_JSONL = "jsonl"
+EXPORT_CHROME = "chrome"
+
+# (trace, current span id) for the running thread / context
+_current = contextvars.ContextVar("upload_trace", default=(None, None))
+_span_ids = itertools.count(1)
+# request ID outside of a trace (every request has one, traced or not)
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+class SpanExporter:
+    """Appends finished spans to a file (JSON lines or Chrome trace events)"""
+
+    def __init__(self, path, fmt=EXPORT_JSONL):
+        if fmt not in (EXPORT_JSONL, EXPORT_CHROME):
+            raise ValueError(f"Unknown trace format: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if fmt == EXPORT_CHROME and self._file.tell() == 0:
+            # JSON Array Format - the closing "]" is optional, so events can be appended
+            self._file.write("[\n")
+
+    def export(self, span, flush=False):
+        if self.fmt == EXPORT_CHROME:
+            line = json.dumps({
+                "name": span["name"],
+                "cat": "upload",
+                "ph": "X",
+                "ts": int(span["start"] * 1e6),
+                "dur": int(span["duration_ms"] * 1000),
+                "pid": os.getpid(),
+                "tid": span["thread"],
+                "args": dict(span["attrs"], request_id=span["trace_id"], span_id=span["span_id"],
+                             parent_id=span["parent_id"])
+            }) + ",\n"
+        else:
+            line = json.dumps(span) + "\n"
+
+        with self._lock:
+            self._file.write(line)
+            if flush:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Trace:
+    """Spans of one upload, identified by its request ID"""
+
+    def __init__(self, trace_id=None, exporter=None):
+        self.trace_id = trace_id or new_request_id()
+        self.exporter = exporter
+        self.started = time.time()
+        self._stages = {}  # span name -> [count, total seconds]
+        self._lock = threading.Lock()
+
+    def record(self, name, start, seconds, parent_id, attrs, span_id=None):
+        span_id = span_id or next(_span_ids)
+        with self._lock:
+            stage = self._stages.setdefault(name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += seconds
+        if self.exporter:
+            self.exporter.export({
+                "trace_id": self.trace_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start": start,
+                "duration_ms": round(seconds * 1000, 3),
+                "thread": threading.get_ident(),
+                "attrs": attrs
+            }, flush=parent_id is None)
+
+    def timing(self):
+        """Per-stage breakdown: {"request_id", "elapsed_ms", "stages": {name: {count, total_ms}}}"""
+        with self._lock:
+            stages = {name: {"count": count, "total_ms": round(seconds * 1000, 1)}
+                      for name, (count, seconds) in self._stages.items()}
+        return {
+            "request_id": self.trace_id,
+            "elapsed_ms": round((time.time() - self.started) * 1000, 1),
+            "stages": stages
+        }
+
+
+def current_trace():
+    return _current.get()[0]
+
+
+def current_request_id():
+    """ID of the request (or job) this thread is working for, or None"""
+    trace = _current.get()[0]
+    return trace.trace_id if trace else _request_id.get()
+
+
+def set_request_id(request_id):
+    """Make request_id current (also used without a trace, e.g. for logging). Returns a reset token."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+@contextmanager
+def bind_request_id(request_id):
+    """set_request_id() for the duration of a with block"""
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace the current trace (e.g. in the job worker thread)"""
+    token = _current.set((trace, None))
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "span_id", "parent_id", "start", "_t0", "_token")
+
+    def __init__(self, trace, parent_id, name, attrs):
+        self.trace = trace
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_span_ids)
+
+    def set(self, **attrs):
+        """Add attributes known only after the work (status, bytes, ...)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current.set((self.trace, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._t0
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.record(self.name, self.start, seconds, self.parent_id, self.attrs, self.span_id)
+        return False
+
+
+class _NoSpan:
+    """Returned by span() when no trace is active"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing one stage of the current trace (no-op without one)"""
+    trace, parent_id = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, parent_id, name, attrs)
+
+
+def add_span(name, seconds, **attrs):
+    """Record a span that just finished and lasted `seconds` (e.g. from an observer hook)"""
+    trace, parent_id = _current.get()
+    if trace is not None:
+        trace.record(name, time.time() - seconds, seconds, parent_id, attrs)
@@ -0,0 +1,106 @@
+"""
+Index of uploads that already reached OneDrive (SQLite)
+
+Every Graph call uses conflictBehavior "rename", so a retried upload of a
+file that already landed creates another copy (V7.webm, V7 1.webm, ...).
+Completed uploads are recorded here by volunteer, filename and content
+hash (SHA-1 + quickXorHash, computed while the request is spooled) and by
+the client's Idempotency-Key. A repeat is answered from the index without
+sending any bytes - once the caller has checked the file is still on
+OneDrive; an entry whose file was deleted or replaced is removed.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class UploadIndex:
+    """Thread-safe lookup of completed uploads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completed_uploads (
+                volunteer_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                sha1 TEXT NOT NULL,
+                quick_xor_hash TEXT,
+                size INTEGER NOT NULL,
+                idempotency_key TEXT,
+                job_id TEXT,
+                result TEXT NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (volunteer_id, filename, sha1)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS completed_uploads_key ON completed_uploads (idempotency_key)"
+        )
+        self._conn.commit()
+
+        self.hits = 0
+
+    @staticmethod
+    def _entry(row):
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["result"] = json.loads(entry["result"])
+        return entry
+
+    def find(self, volunteer_id, filename, sha1):
+        """Earlier upload of exactly this content under this name, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM completed_uploads WHERE volunteer_id = ? AND filename = ? AND sha1 = ?",
+                (str(volunteer_id), filename, sha1)
+            ).fetchone()
+        return self._entry(row)
+
+    def find_by_key(self, idempotency_key):
+        """Earlier upload sent with this Idempotency-Key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM completed_uploads WHERE idempotency_key = ? "
+                "ORDER BY completed_at DESC LIMIT 1",
+                (idempotency_key,)
+            ).fetchone()
+        return self._entry(row)
+
+    def record(self, volunteer_id, filename, sha1, quick_xor_hash, size, result,
+               idempotency_key=None, job_id=None):
+        """Remember an upload that finished on OneDrive"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completed_uploads "
+                "(volunteer_id, filename, sha1, quick_xor_hash, size, idempotency_key, job_id, "
+                "result, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(volunteer_id), filename, sha1, quick_xor_hash, size, idempotency_key, job_id,
+                 json.dumps(result), time.time())
+            )
+            self._conn.commit()
+
+    def remove(self, volunteer_id, filename, sha1):
+        """Forget an upload whose file is no longer on OneDrive"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM completed_uploads WHERE volunteer_id = ? AND filename = ? AND sha1 = ?",
+                (str(volunteer_id), filename, sha1)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM completed_uploads").fetchone()[0]
+        return {"completed_uploads": count, "duplicate_hits": self.hits}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,229 @@
+"""
+Background upload jobs
+
+/api/upload only spools the file to disk and enqueues an UploadJob; a
+bounded pool of workers does the OneDrive upload (or local fallback) and
+the browser polls /api/jobs/<id> for progress. Workers are threads, or
+coroutines on a graph_async.GraphEventLoop when the queue has a runner.
+
+Job states: queued -> uploading -> done | failed
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = "queued"
+JOB_UPLOADING = "uploading"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+log = logging.getLogger("upload_jobs")
+
+
+class QueueFullError(Exception):
+    """Raised when the number of pending jobs reaches the queue limit"""
+
+
+class UploadJob:
+    """One file waiting for / going through upload"""
+
+    def __init__(self, volunteer_id, filename, file_type, spool_path, size, job_id=None,
+                 sha1=None, quick_xor_hash=None, idempotency_key=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.volunteer_id = volunteer_id
+        self.filename = filename
+        self.file_type = file_type
+        self.spool_path = spool_path
+        self.size = size
+        self.sha1 = sha1
+        self.quick_xor_hash = quick_xor_hash
+        self.idempotency_key = idempotency_key
+        self.state = JOB_QUEUED
+        self.bytes_sent = 0
+        self.location = None
+        self.integrity = None  # verified / unverified / corrupt, once uploaded
+        self.error = None
+        self.result = None
+        self.trace = None  # tracing.Trace carried from the request into the worker
+        self.request_id = None  # ID of the request that queued the job (for log lines)
+        self.deadline = None  # deadline.Deadline started when the request was admitted
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def set_progress(self, bytes_sent):
+        self.bytes_sent = bytes_sent
+        self.updated_at = time.time()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "volunteer_id": self.volunteer_id,
+            "filename": self.filename,
+            "file_type": self.file_type,
+            "state": self.state,
+            "size": self.size,
+            "sha1": self.sha1,
+            "bytes_sent": self.bytes_sent,
+            "location": self.location,
+            "integrity": self.integrity,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+
+class UploadJobQueue:
+    """
+    Bounded worker pool running upload jobs.
+
+    handler(job) does the actual upload and returns (response_body, status)
+    like onedrive_uploader.upload_with_fallback. The job's spool file is
+    removed once the handler returns. on_finished(job), if given, is called
+    with the job in its final state (done or failed).
+
+    With a runner (GraphEventLoop) handler is a coroutine function and at
+    most max_workers jobs run at once as coroutines on the runner's loop;
+    otherwise max_workers threads call it.
+    """
+
+    def __init__(self, handler, max_workers=2, max_pending=32, max_finished=500, on_finished=None,
+                 runner=None):
+        self.handler = handler
+        self.on_finished = on_finished
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.runner = runner
+        self._executor = None if runner else ThreadPoolExecutor(max_workers=max_workers,
+                                                                thread_name_prefix="upload-job")
+        self._slots = None  # asyncio.Semaphore(max_workers), created on the runner's loop
+        self._jobs = OrderedDict()  # job_id -> UploadJob, oldest first
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Enqueue job; raises QueueFullError when too many jobs are pending"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} uploads already pending")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._trim_finished()
+
+        if self.runner:
+            self.runner.submit(self._run_async(job))
+        else:
+            self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_active(self, predicate):
+        """First queued/uploading job matching predicate(job), or None"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.state in (JOB_QUEUED, JOB_UPLOADING) and predicate(job):
+                    return job
+        return None
+
+    def find_by_key(self, idempotency_key):
+        """Most recent job (any state) submitted with idempotency_key, or None"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.idempotency_key == idempotency_key:
+                    return job
+        return None
+
+    def pending_bytes(self):
+        """Bytes accepted into the queue that have not been uploaded yet"""
+        with self._lock:
+            return sum(max(0, job.size - job.bytes_sent) for job in self._jobs.values()
+                       if job.state in (JOB_QUEUED, JOB_UPLOADING))
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+            return {
+                "pending": self._pending,
+                "queued": states.count(JOB_QUEUED),
+                "uploading": states.count(JOB_UPLOADING),
+                "done": states.count(JOB_DONE),
+                "failed": states.count(JOB_FAILED)
+            }
+
+    def _run(self, job):
+        self._started(job)
+        try:
+            self._record(job, *self.handler(job))
+        except Exception as e:
+            self._crashed(job, e)
+        finally:
+            self._finished(job)
+
+    async def _run_async(self, job):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            self._started(job)
+            try:
+                self._record(job, *await self.handler(job))
+            except Exception as e:
+                self._crashed(job, e)
+            finally:
+                # on_finished writes the journal (SQLite) - not on the event loop
+                await asyncio.to_thread(self._finished, job)
+
+    @staticmethod
+    def _started(job):
+        job.state = JOB_UPLOADING
+        job.updated_at = time.time()
+
+    @staticmethod
+    def _record(job, body, status_code):
+        job.result = body
+        job.location = body.get("location")
+        job.integrity = body.get("integrity")
+        if body.get("success"):
+            job.state = JOB_DONE
+            job.bytes_sent = job.size
+        else:
+            job.state = JOB_FAILED
+            job.error = body.get("error", f"HTTP {status_code}")
+
+    @staticmethod
+    def _crashed(job, e):
+        log.exception("Job %s crashed", job.id)
+        job.state = JOB_FAILED
+        job.error = f"{type(e).__name__}: {e}"
+
+    def _finished(self, job):
+        job.updated_at = time.time()
+        try:
+            os.remove(job.spool_path)
+        except OSError:
+            pass
+        with self._lock:
+            self._pending -= 1
+        if self.on_finished:
+            try:
+                self.on_finished(job)
+            except Exception:
+                log.exception("on_finished failed for job %s", job.id)
+
+    def _trim_finished(self):
+        """Forget the oldest finished jobs beyond max_finished (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in (JOB_DONE, JOB_FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        if self._executor:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,262 @@
+"""
+On-disk journal of in-flight uploads (SQLite)
+
+Every queued upload is recorded with its spool file, and resumable uploads
+also record the Graph uploadUrl, its expiry and the last byte offset Graph
+acknowledged. If the backend is killed (STOP.sh / start.sh use kill -9),
+the next start re-queues unfinished entries and resumable uploads continue
+from the confirmed offset instead of starting over.
+
+With several worker processes the journal is also how they see each
+other's jobs: every entry records the PID of the process running it
+(claim_orphans() hands over entries whose process died), and finished
+jobs move to the finished_jobs table so /api/jobs/<id> can be answered
+by any worker.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from process_lock import process_alive
+
+FINISHED_JOB_TTL = 24 * 3600  # seconds finished job states are kept for polling
+
+
+def parse_expiry(expiration_date_time):
+    """Convert Graph's expirationDateTime (ISO 8601) to epoch seconds, or None"""
+    if not expiration_date_time:
+        return None
+    try:
+        value = expiration_date_time.replace("Z", "+00:00")
+        # Graph may send up to 7 fractional digits; fromisoformat wants exactly 6
+        value = re.sub(r"\.(\d+)", lambda m: "." + (m.group(1) + "000000")[:6], value)
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class UploadJournal:
+    """Thread-safe SQLite journal keyed by upload job ID"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                job_id TEXT PRIMARY KEY,
+                volunteer_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                spool_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                upload_url TEXT,
+                expires_at REAL,
+                confirmed_offset INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS finished_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                finished_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS finished_jobs_age ON finished_jobs (finished_at)")
+        self._add_missing_columns()
+        self._conn.commit()
+
+    # Columns added after the first release - existing journals are migrated in place
+    ADDED_COLUMNS = {
+        "sha1": "TEXT",
+        "quick_xor_hash": "TEXT",
+        "idempotency_key": "TEXT",
+        "owner_pid": "INTEGER",
+        "state": "TEXT"
+    }
+
+    def _add_missing_columns(self):
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(uploads)")}
+        for name, column_type in self.ADDED_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE uploads ADD COLUMN {name} {column_type}")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def record(self, job_id, volunteer_id, filename, file_type, spool_path, size,
+               sha1=None, quick_xor_hash=None, idempotency_key=None):
+        """
+        Add a newly spooled upload, owned by this process. Returns False
+        (and adds nothing) if an upload of the same volunteer, filename and
+        SHA-1 is already journaled by any process - of two identical
+        requests racing past the duplicate lookup, only one is queued.
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock before the existence check, so the
+            # check and the insert are one step for every process sharing the file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO uploads "
+                    "(job_id, volunteer_id, filename, file_type, spool_path, size, "
+                    "sha1, quick_xor_hash, idempotency_key, owner_pid, state, created_at, updated_at) "
+                    "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, ? WHERE NOT EXISTS ("
+                    "SELECT 1 FROM uploads WHERE volunteer_id = ? AND filename = ? AND sha1 = ?)",
+                    (job_id, str(volunteer_id), filename, file_type, spool_path, size,
+                     sha1, quick_xor_hash, idempotency_key, os.getpid(), now, now,
+                     str(volunteer_id), filename, sha1)
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return cursor.rowcount == 1
+
+    def set_state(self, job_id, state):
+        """Record the job state (queued / uploading) for workers polling from other processes"""
+        self._execute("UPDATE uploads SET state = ?, updated_at = ? WHERE job_id = ?",
+                      (state, time.time(), job_id))
+
+    def set_session(self, job_id, upload_url, expires_at):
+        """Store a new Graph upload session; resets the confirmed offset"""
+        self._execute(
+            "UPDATE uploads SET upload_url = ?, expires_at = ?, confirmed_offset = 0, updated_at = ? "
+            "WHERE job_id = ?",
+            (upload_url, expires_at, time.time(), job_id)
+        )
+
+    def set_offset(self, job_id, confirmed_offset):
+        """Record the last byte offset Graph acknowledged"""
+        self._execute(
+            "UPDATE uploads SET confirmed_offset = ?, updated_at = ? WHERE job_id = ?",
+            (confirmed_offset, time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM uploads WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def remove(self, job_id):
+        """Forget an upload once it finished (OneDrive, local fallback or failed)"""
+        self._execute("DELETE FROM uploads WHERE job_id = ?", (job_id,))
+
+    def finish(self, job_id, status):
+        """The job is over: keep its final status (UploadJob.to_dict()) and drop the in-flight entry"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO finished_jobs (job_id, status, finished_at) VALUES (?, ?, ?)",
+                               (job_id, json.dumps(status, default=str), now))
+            self._conn.execute("DELETE FROM uploads WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM finished_jobs WHERE finished_at < ?", (now - FINISHED_JOB_TTL,))
+            self._conn.commit()
+
+    def job_status(self, job_id):
+        """Status of a job run by any process, shaped like UploadJob.to_dict(), or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM finished_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            entry = None if row else self._conn.execute(
+                "SELECT * FROM uploads WHERE job_id = ?", (job_id,)).fetchone()
+        if row:
+            return json.loads(row["status"])
+        if entry:
+            return self._status_of(entry)
+        return None
+
+    @staticmethod
+    def _status_of(entry):
+        return {
+            "job_id": entry["job_id"],
+            "volunteer_id": entry["volunteer_id"],
+            "filename": entry["filename"],
+            "file_type": entry["file_type"],
+            "state": entry["state"] or "queued",
+            "size": entry["size"],
+            "sha1": entry["sha1"],
+            "bytes_sent": entry["confirmed_offset"],
+            "location": None,
+            "integrity": None,
+            "error": None,
+            "created_at": entry["created_at"],
+            "updated_at": entry["updated_at"]
+        }
+
+    def find_active(self, volunteer_id, filename, sha1):
+        """Status of an in-flight upload of the same content (any process), or None"""
+        with self._lock:
+            entry = self._conn.execute(
+                "SELECT * FROM uploads WHERE volunteer_id = ? AND filename = ? AND sha1 = ? "
+                "ORDER BY created_at LIMIT 1",
+                (str(volunteer_id), filename, sha1)
+            ).fetchone()
+        return self._status_of(entry) if entry else None
+
+    def find_by_key(self, idempotency_key):
+        """Status of an in-flight upload sent with idempotency_key (any process), or None"""
+        with self._lock:
+            entry = self._conn.execute(
+                "SELECT * FROM uploads WHERE idempotency_key = ? ORDER BY created_at DESC LIMIT 1",
+                (idempotency_key,)
+            ).fetchone()
+        return self._status_of(entry) if entry else None
+
+    def unfinished(self):
+        """All journaled uploads, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM uploads ORDER BY created_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def active_count(self):
+        """Number of journaled uploads not finished yet, across all processes"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+    def claim_orphans(self, started_at):
+        """
+        Take over entries no live process is running, oldest first: their
+        owner died, or it had this PID before this process started at
+        `started_at` (PIDs repeat, e.g. PID 1 in a container). The
+        ownership change is conditional, so two processes never claim the
+        same entry.
+        """
+        pid = os.getpid()
+        claimed = []
+        for entry in self.unfinished():
+            owner = entry["owner_pid"]
+            if owner == pid:
+                if entry["updated_at"] >= started_at:
+                    continue  # ours, queued by this process
+            elif owner and process_alive(owner):
+                continue
+            with self._lock:
+                cursor = self._conn.execute(
+                    "UPDATE uploads SET owner_pid = ?, updated_at = ? WHERE job_id = ? AND owner_pid IS ?",
+                    (pid, time.time(), entry["job_id"], owner)
+                )
+                self._conn.commit()
+            if cursor.rowcount == 1:
+                claimed.append(entry)
+        return claimed
+
+    def disown(self, job_id):
+        """Give up a claimed entry (e.g. the queue was full) so any process can claim it later"""
+        self._execute("UPDATE uploads SET owner_pid = NULL WHERE job_id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,289 @@
+"""
+Upload sessions - several files of one recording session (SQLite)
+
+A volunteer's session produces V7.csv and V7.webm, which used to reach
+the backend as unrelated uploads. The client now declares them up front
+in a manifest (volunteer, filenames, sizes and optionally hashes), sends
+every part in parallel, and the parts upload concurrently as ordinary
+jobs. A session is complete only when every part reached OneDrive and
+checked out; the last part to finish makes that decision.
+
+Part states:    waiting -> queued -> uploading -> uploaded | failed
+Session states: open -> completing -> complete | incomplete
+
+The store is shared by worker processes like the upload journal, so
+whichever process runs a part's job can finish the session, and any
+process can answer a progress poll.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+SESSION_OPEN = "open"
+SESSION_COMPLETING = "completing"
+SESSION_COMPLETE = "complete"
+SESSION_INCOMPLETE = "incomplete"
+
+PART_WAITING = "waiting"
+PART_QUEUED = "queued"
+PART_UPLOADING = "uploading"
+PART_UPLOADED = "uploaded"
+PART_FAILED = "failed"
+
+PART_FINISHED = (PART_UPLOADED, PART_FAILED)
+SESSION_TTL = 7 * 24 * 3600  # seconds sessions are kept for polling
+
+
+class ManifestError(ValueError):
+    """The declared manifest is unusable (reported to the client as 400)"""
+
+
+def part_key(session_id, filename):
+    """Idempotency-Key of a part's upload job - how a finished job finds its part"""
+    return f"session:{session_id}:{filename}"
+
+
+def validate_manifest(files, max_files):
+    """
+    Check the client's list of {"filename", "size", "sha1"?, "quickXorHash"?,
+    "file_type"?} and return it normalised; raises ManifestError.
+    """
+    if not isinstance(files, list) or not files:
+        raise ManifestError("files must be a non-empty list")
+    if len(files) > max_files:
+        raise ManifestError(f"At most {max_files} files per session")
+
+    parts = []
+    seen = set()
+    for declared in files:
+        if not isinstance(declared, dict):
+            raise ManifestError("Every file needs filename and size")
+        filename = declared.get("filename")
+        size = declared.get("size")
+        if not isinstance(filename, str) or not filename or filename != filename.split("/")[-1].split("\\")[-1]:
+            raise ManifestError(f"Invalid filename: {filename!r}")
+        if filename in seen:
+            raise ManifestError(f"Duplicate filename: {filename}")
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise ManifestError(f"Invalid size for {filename}: {size!r}")
+        sha1 = declared.get("sha1")
+        if sha1 is not None and not (isinstance(sha1, str) and len(sha1) == 40):
+            raise ManifestError(f"Invalid sha1 for {filename}")
+        seen.add(filename)
+        parts.append({
+            "filename": filename,
+            "size": size,
+            "sha1": sha1.lower() if sha1 else None,
+            "quick_xor_hash": declared.get("quickXorHash") or None,
+            "file_type": declared.get("file_type") or ("video" if filename.endswith(".webm") else "csv")
+        })
+    return parts
+
+
+class UploadSessionStore:
+    """Thread- and process-safe store of upload sessions and their parts"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                volunteer_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                completed_at REAL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS parts (
+                session_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha1 TEXT,
+                quick_xor_hash TEXT,
+                idempotency_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                job_id TEXT,
+                location TEXT,
+                integrity TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (session_id, filename)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS parts_key ON parts (idempotency_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS parts_job ON parts (job_id)")
+        self._conn.commit()
+
+    def create(self, volunteer_id, parts):
+        """New open session for validate_manifest() parts; returns its ID"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, volunteer_id, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, str(volunteer_id), SESSION_OPEN, now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO parts (session_id, filename, file_type, size, sha1, quick_xor_hash, "
+                "idempotency_key, state, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(session_id, part["filename"], part["file_type"], part["size"], part["sha1"],
+                  part["quick_xor_hash"], part_key(session_id, part["filename"]), PART_WAITING, now)
+                 for part in parts]
+            )
+            self._prune(now)
+            self._conn.commit()
+        return session_id
+
+    def _prune(self, now):
+        """Forget old sessions (lock held)"""
+        expired = "SELECT session_id FROM sessions WHERE updated_at < ?"
+        self._conn.execute(f"DELETE FROM parts WHERE session_id IN ({expired})", (now - SESSION_TTL,))
+        self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - SESSION_TTL,))
+
+    def get(self, session_id):
+        """Session dict with its "parts" (in manifest order), or None"""
+        with self._lock:
+            session = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+            parts = self._conn.execute("SELECT * FROM parts WHERE session_id = ? ORDER BY rowid",
+                                       (session_id,)).fetchall()
+        if session is None:
+            return None
+        return dict(session, parts=[dict(part) for part in parts])
+
+    def get_part(self, session_id, filename):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM parts WHERE session_id = ? AND filename = ?",
+                                     (session_id, filename)).fetchone()
+        return dict(row) if row else None
+
+    def attach_job(self, session_id, filename, job_id, hashes, state=PART_QUEUED):
+        """
+        The part's bytes were received (hashes of what arrived fill in any
+        the manifest left out) and job_id uploads them - unless the part
+        already finished.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE parts SET job_id = ?, state = ?, error = NULL, sha1 = COALESCE(sha1, ?), "
+                "quick_xor_hash = COALESCE(quick_xor_hash, ?), updated_at = ? "
+                f"WHERE session_id = ? AND filename = ? AND state NOT IN {PART_FINISHED}",
+                (job_id, state, hashes["sha1"], hashes["quickXorHash"], time.time(), session_id, filename)
+            )
+            self._conn.commit()
+
+    def set_part_state(self, idempotency_key, job_id, state):
+        """A part's job moved on (queued -> uploading)"""
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE parts SET state = ?, updated_at = ? "
+                f"WHERE (idempotency_key = ? OR job_id = ?) AND state NOT IN {PART_FINISHED}",
+                (state, time.time(), idempotency_key, job_id)
+            )
+            self._conn.commit()
+
+    def finish_part(self, idempotency_key, job_id, result):
+        """
+        Record the outcome of a part's upload. result is shaped like
+        UploadJob.to_dict(): state, location, integrity and error.
+
+        Returns the session if this was its last unfinished part - the
+        caller now owns completing it (see complete()) - else None. The
+        check and the claim are one transaction, so with several worker
+        processes exactly one of them gets the session.
+        """
+        uploaded = (result.get("state") == "done" and result.get("location") == "onedrive"
+                    and result.get("integrity") != "corrupt")
+        if uploaded:
+            error = None
+        elif result.get("state") == "done":
+            error = ("corrupt on OneDrive" if result.get("integrity") == "corrupt"
+                     else f"saved {result.get('location') or 'elsewhere'}, not on OneDrive")
+        else:
+            error = result.get("error") or "upload failed"
+        now = time.time()
+
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT session_id, filename FROM parts WHERE (idempotency_key = ? OR job_id = ?) "
+                    f"AND state NOT IN {PART_FINISHED}",
+                    (idempotency_key, job_id)
+                ).fetchall()
+                claimed = None
+                for row in rows:
+                    self._conn.execute(
+                        "UPDATE parts SET state = ?, job_id = COALESCE(?, job_id), location = ?, integrity = ?, "
+                        "error = ?, updated_at = ? WHERE session_id = ? AND filename = ?",
+                        (PART_UPLOADED if uploaded else PART_FAILED, job_id, result.get("location"),
+                         result.get("integrity"), error, now,
+                         row["session_id"], row["filename"])
+                    )
+                    unfinished = self._conn.execute(
+                        f"SELECT COUNT(*) FROM parts WHERE session_id = ? AND state NOT IN {PART_FINISHED}",
+                        (row["session_id"],)
+                    ).fetchone()[0]
+                    if unfinished == 0:
+                        cursor = self._conn.execute(
+                            "UPDATE sessions SET state = ?, updated_at = ? WHERE session_id = ? AND state = ?",
+                            (SESSION_COMPLETING, now, row["session_id"], SESSION_OPEN)
+                        )
+                        if cursor.rowcount == 1:
+                            claimed = row["session_id"]
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return self.get(claimed) if claimed else None
+
+    def complete(self, session_id, complete, error=None):
+        """Settle a completing session as complete or incomplete"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET state = ?, error = ?, updated_at = ?, completed_at = ? "
+                "WHERE session_id = ? AND state = ?",
+                (SESSION_COMPLETE if complete else SESSION_INCOMPLETE, error, now, now,
+                 session_id, SESSION_COMPLETING)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) AS n FROM sessions GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def manifest_document(session):
+    """The session as recorded next to its files once complete (JSON bytes)"""
+    return json.dumps({
+        "session_id": session["session_id"],
+        "volunteer_id": session["volunteer_id"],
+        "created_at": session["created_at"],
+        "completed_at": time.time(),
+        "files": [{
+            "filename": part["filename"],
+            "file_type": part["file_type"],
+            "size": part["size"],
+            "sha1": part["sha1"],
+            "quickXorHash": part["quick_xor_hash"],
+            "integrity": part["integrity"]
+        } for part in session["parts"]]
+    }, indent=2).encode()
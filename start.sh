@@ -30,9 +30,14 @@ lsof -ti:5001 | xargs kill -9 2>/dev/null || true
 lsof -ti:8000 | xargs kill -9 2>/dev/null || true
 sleep 2
 
-# Start Flask backend
-echo -e "${BLUE}1️⃣ Starting Flask backend on port 5001...${NC}"
-python3 backend/onedrive_uploader.py > .pids/flask.log 2>&1 &
+# Start Flask backend (WEB_CONCURRENCY > 1: that many gunicorn worker processes)
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+    echo -e "${BLUE}1️⃣ Starting backend on port 5001 with $WEB_CONCURRENCY workers...${NC}"
+    gunicorn -c backend/gunicorn.conf.py onedrive_uploader:app > .pids/flask.log 2>&1 &
+else
+    echo -e "${BLUE}1️⃣ Starting Flask backend on port 5001...${NC}"
+    python3 backend/onedrive_uploader.py > .pids/flask.log 2>&1 &
+fi
 FLASK_PID=$!
 echo $FLASK_PID > .pids/flask.pid
 sleep 3